@@ -0,0 +1,240 @@
+import sys
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from RAG.similarity import top_k_rows, top_k_similar, normalize_rows
+from config import (
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_TRAIN_ITERATIONS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    TOP_K_RESULTS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """
+    Inverted-file index in pure NumPy.
+
+    Rows are clustered with spherical k-means into ``nlist`` cells. A query
+    scores the centroids, then only the rows of the ``nprobe`` closest cells.
+    Raising ``nprobe`` trades latency for recall; ``nprobe == nlist`` is exact.
+    """
+
+    def __init__(
+        self,
+        nlist: int = IVF_NLIST,
+        nprobe: int = IVF_NPROBE,
+        iterations: int = IVF_TRAIN_ITERATIONS,
+        seed: int = 0
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def _assign(self, vectors: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        assignments = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            assignments[start:start + block_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def build(self, matrix: np.ndarray) -> None:
+        """
+        Train the coarse quantizer and bucket every row.
+
+        Args:
+            matrix (np.ndarray): Unit-length embeddings, one row per chunk
+        """
+        n = matrix.shape[0]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a bounded sample so building stays cheap for huge corpora
+        sample_size = min(n, nlist * 64)
+        sample_rows = np.sort(rng.choice(n, sample_size, replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assignments = self._assign(sample)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=nlist)
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            # Empty cells keep their previous centroid
+            self.centroids[filled] = normalize_rows(sums)
+
+        assignments = self._assign(matrix)
+        self.order = np.argsort(assignments, kind='stable')
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist))))
+        logger.info(f"Built IVF index with {nlist} cells over {n} chunks")
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query_embedding: np.ndarray,
+        top_k: int,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the approximate nearest rows to a query.
+
+        Args:
+            matrix (np.ndarray): The matrix the index was built over
+            query_embedding (np.ndarray): Normalized query embedding
+            top_k (int): Number of results to return
+            nprobe (Optional[int]): Cells to scan, defaults to ``self.nprobe``
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Row numbers and similarities, best first
+        """
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        cells = top_k_rows(self.centroids @ query_embedding, nprobe)
+        rows = np.concatenate(
+            [self.order[self.offsets[c]:self.offsets[c + 1]] for c in cells]
+        )
+        if rows.shape[0] == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+        rows.sort()  # Sequential reads from the memory-mapped matrix
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ query_embedding
+        best = top_k_rows(scores, top_k)
+        return rows[best], scores[best]
+
+
+class HNSWIndex:
+    """
+    Graph index backed by the optional ``hnswlib`` package.
+
+    ``ef`` is the size of the dynamic candidate list at query time; larger
+    values raise recall at the cost of latency.
+    """
+
+    def __init__(
+        self,
+        m: int = HNSW_M,
+        ef_construction: int = HNSW_EF_CONSTRUCTION,
+        ef: int = HNSW_EF_SEARCH
+    ):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._graph = None
+
+    def build(self, matrix: np.ndarray) -> None:
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("hnswlib is required for HNSW retrieval. Please install it with 'pip install hnswlib'.")
+        n, dim = matrix.shape
+        graph = hnswlib.Index(space='ip', dim=dim)
+        graph.init_index(max_elements=n, ef_construction=self.ef_construction, M=self.m)
+        graph.add_items(np.asarray(matrix, dtype=np.float32), np.arange(n))
+        graph.set_ef(self.ef)
+        self._graph = graph
+        logger.info(f"Built HNSW index over {n} chunks")
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query_embedding: np.ndarray,
+        top_k: int,
+        ef: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, self._graph.get_current_count())
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        self._graph.set_ef(max(ef or self.ef, k))
+        labels, distances = self._graph.knn_query(query_embedding, k=k)
+        # Inner-product distance is 1 - similarity
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+
+def build_ann_index(matrix: np.ndarray, kind: str):
+    """
+    Build an approximate index of the given kind over a matrix.
+
+    Args:
+        matrix (np.ndarray): Unit-length embeddings
+        kind (str): "ivf" or "hnsw"
+
+    Returns:
+        The built index
+    """
+    if kind == 'ivf':
+        index = IVFIndex()
+    elif kind == 'hnsw':
+        index = HNSWIndex()
+    else:
+        raise ValueError(f"Unknown ANN index type: {kind}")
+    index.build(matrix)
+    return index
+
+
+def recall_at_k(
+    ann_index,
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int = TOP_K_RESULTS
+) -> float:
+    """
+    Measure how many of the exact top-k rows the ANN index returns.
+
+    Args:
+        ann_index: A built IVFIndex or HNSWIndex
+        matrix (np.ndarray): The indexed matrix
+        queries (np.ndarray): Normalized query embeddings, one per row
+        k (int): Cut-off for recall
+
+    Returns:
+        float: Mean recall@k over the queries
+    """
+    hits = 0
+    total = 0
+    exact_rows, _ = top_k_similar(queries, matrix, k)
+    for query, exact in zip(queries, exact_rows):
+        approx, _ = ann_index.search(matrix, query, k)
+        hits += len(set(exact.tolist()) & set(approx.tolist()))
+        total += exact.shape[0]
+    return hits / total if total else 1.0
+
+
+def main(argv: List[str]) -> None:
+    """
+    Report recall@k of each ANN setting against exact search on the current store.
+
+    Usage: python -m RAG.ann [ivf|hnsw]
+    """
+    from RAG.store import EmbeddingStore
+
+    kind = argv[1] if len(argv) > 1 else 'ivf'
+    matrix, _, _ = EmbeddingStore().load()
+    rng = np.random.default_rng(0)
+    # Perturbed corpus rows stand in for real queries
+    rows = rng.choice(matrix.shape[0], min(100, matrix.shape[0]), replace=False)
+    queries = np.asarray(matrix[rows], dtype=np.float32)
+    queries = normalize_rows(queries + rng.normal(scale=0.02, size=queries.shape).astype(np.float32))
+
+    index = build_ann_index(matrix, kind)
+    if kind == 'ivf':
+        for nprobe in (1, 2, 4, 8, 16, 32, 64):
+            index.nprobe = nprobe
+            print(f"nprobe={nprobe}: recall@{TOP_K_RESULTS} = {recall_at_k(index, matrix, queries):.3f}")
+    else:
+        for ef in (16, 32, 64, 128, 256):
+            index.ef = ef
+            print(f"ef={ef}: recall@{TOP_K_RESULTS} = {recall_at_k(index, matrix, queries):.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,122 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from RAG.similarity import similarity
+from config import CONTEXT_TOKEN_BUDGET, MMR_LAMBDA, CONTEXT_DUPLICATE_SIMILARITY
+
+# Words, numbers and single punctuation marks
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate how many tokens the model's tokenizer splits a text into.
+
+    Takes the larger of the word/punctuation count and the usual four
+    characters per token, so long legal terms and citations are not
+    undercounted.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return max(len(_TOKEN.findall(text)), (len(text) + 3) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text at a word boundary so that ``count_tokens`` fits ``max_tokens``."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    text = text[:max(max_tokens, 0) * 4]
+    for i, match in enumerate(_TOKEN.finditer(text)):
+        if i == max_tokens:
+            text = text[:match.start()]
+            break
+    space = text.rfind(' ')
+    return (text[:space] if space > 0 else text).rstrip()
+
+
+class Context(NamedTuple):
+    """Chunks chosen for a prompt, in the order they should appear."""
+    chunks: List[Dict]
+    token_count: int
+    duplicates: int  # Chunks dropped as near-duplicates of a chosen chunk
+    over_budget: int  # Chunks dropped because they did not fit the token budget
+
+    @property
+    def contents(self) -> List[str]:
+        return [chunk['content'] for chunk in self.chunks]
+
+
+def build_context(
+    relevant_docs: List[Dict],
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    diversity: float = MMR_LAMBDA,
+    duplicate_threshold: float = CONTEXT_DUPLICATE_SIMILARITY
+) -> Context:
+    """
+    Pick the retrieved chunks that go into the prompt.
+
+    Chunks are picked by maximal marginal relevance: each step takes the
+    chunk with the best ``diversity * similarity - (1 - diversity) *
+    redundancy``, where redundancy is its highest embedding similarity to a
+    chunk already picked. Chunks at or above ``duplicate_threshold`` to a
+    picked chunk (e.g. overlapping neighbours) are dropped, as are chunks
+    that no longer fit ``token_budget``. The most relevant chunk is
+    truncated rather than dropped if it alone exceeds the budget.
+
+    The picked chunks are grouped by source document, documents ordered by
+    their most relevant chunk and chunks within a document in reading order.
+
+    Args:
+        relevant_docs (List[Dict]): Results of ``retrieve_relevant_documents``
+        token_budget (Optional[int]): Estimated tokens of context allowed, None or 0 for no limit
+        diversity (float): 1.0 ranks by relevance alone, lower values favour covering more ground
+        duplicate_threshold (float): Embedding similarity at which a chunk counts as a duplicate
+
+    Returns:
+        Context: The chosen chunks and their estimated token count
+    """
+    n = len(relevant_docs)
+    if n == 0:
+        return Context([], 0, 0, 0)
+
+    relevance = np.array([doc['similarity'] for doc in relevant_docs], dtype=np.float32)
+    if all(doc.get('embedding') is not None for doc in relevant_docs):
+        embeddings = np.vstack([doc['embedding'] for doc in relevant_docs])
+        pairwise = similarity(embeddings, embeddings)
+    else:
+        pairwise = np.zeros((n, n), dtype=np.float32)
+
+    redundancy = np.zeros(n, dtype=np.float32)
+    remaining = np.ones(n, dtype=bool)
+    picked = []
+    used = duplicates = over_budget = 0
+    while remaining.any():
+        scores = diversity * relevance - (1.0 - diversity) * redundancy
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        remaining[best] = False
+
+        if picked and redundancy[best] >= duplicate_threshold:
+            duplicates += 1
+            continue
+        content = relevant_docs[best]['content']
+        tokens = count_tokens(content)
+        if token_budget and used + tokens > token_budget:
+            if picked:
+                over_budget += 1
+                continue
+            content = truncate_to_tokens(content, token_budget)
+            tokens = count_tokens(content)
+        picked.append({**relevant_docs[best], 'content': content})
+        used += tokens
+        redundancy = np.maximum(redundancy, pairwise[best])
+
+    first_seen = {}
+    for rank, chunk in enumerate(picked):
+        first_seen.setdefault(chunk['metadata']['filename'], rank)
+    picked.sort(key=lambda chunk: (first_seen[chunk['metadata']['filename']], chunk['metadata'].get('chunk', 0)))
+    return Context(picked, used, duplicates, over_budget)
@@ -1,8 +1,13 @@
-import ollama
+import asyncio
 import numpy as np
-from typing import Dict, Optional, List, Union
+from typing import Dict, Optional, List, Union, Iterator, Tuple
 from functools import lru_cache
-from config import EMBEDDING_MODEL
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from RAG.embedding_cache import EmbeddingCache, get_embedding_cache
+from RAG.similarity import normalize_rows, similarity
+from model_backend import get_backend
+from telemetry import record_cache
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, EMBEDDING_CACHE_ENABLED
 
 # import ollama
 # import numpy as np
@@ -21,16 +26,16 @@ def normalize_embedding(embedding: np.ndarray) -> np.ndarray:
     """
     Normalize embedding vector to unit length.
     
+    A matrix is normalized row by row in one vectorized pass; zero vectors
+    are returned unchanged.
+    
     Args:
-        embedding (np.ndarray): Input embedding vector
+        embedding (np.ndarray): Input embedding vector, or a matrix of vectors
     
     Returns:
-        np.ndarray: Normalized embedding vector
+        np.ndarray: Normalized embedding vector(s)
     """
-    norm = np.linalg.norm(embedding)
-    if norm == 0:
-        return embedding
-    return embedding / norm
+    return normalize_rows(embedding)
 
 # def normalize_embedding(emberddding: np.ndarray) -> np.ndarray:
 #     """
@@ -47,11 +52,25 @@ def normalize_embedding(embedding: np.ndarray) -> np.ndarray:
 #         return embedding
 #     return embedding / norm
 
+def _persistent_cache() -> Optional[EmbeddingCache]:
+    if not EMBEDDING_CACHE_ENABLED or not get_backend().cache_embeddings:
+        return None
+    return get_embedding_cache()
+
+
+def _freeze(embedding: np.ndarray) -> np.ndarray:
+    """Mark a cached vector read-only so callers sharing it cannot modify it."""
+    embedding.setflags(write=False)
+    return embedding
+
+
 @lru_cache(maxsize=1000) # apply LRU cache to the get_embedding function
 def get_embedding(text: str) -> np.ndarray:
     """
     Generate embeddings for a given text using the specified model.
-    Results are cached to improve performance.
+    Results are cached in-process and in the persistent embedding cache,
+    so restarts and other workers do not re-embed known text. The returned
+    array is shared and read-only; copy it before modifying.
     
     Args:
         text (str): The text to generate embeddings for
@@ -62,15 +81,42 @@ def get_embedding(text: str) -> np.ndarray:
     Raises:
         EmbeddingError: If the embedding generation fails
     """
+    cache = _persistent_cache()
+    if cache is not None:
+        embedding = cache.get(text)
+        record_cache('embedding', embedding is not None)
+        if embedding is not None:
+            return _freeze(embedding)
     try:
-        result = ollama.embeddings(
-            model=EMBEDDING_MODEL,
-            prompt=text
-        )
-        embedding = np.array(result['embedding'], dtype=np.float32)
-        return normalize_embedding(embedding)
+        embedding = normalize_embedding(get_backend().embed([text])[0])
+    except Exception as e:
+        raise EmbeddingError(f"Failed to generate embedding: {str(e)}") from e
+    if cache is not None:
+        cache.put(text, embedding)
+    return _freeze(embedding)
+
+
+async def aget_embedding(text: str) -> np.ndarray:
+    """
+    Async variant of ``get_embedding`` for the asyncio server.
+    
+    Raises:
+        EmbeddingError: If the embedding generation fails
+    """
+    cache = _persistent_cache()
+    if cache is not None:
+        # SQLite calls block, for up to the connection timeout if another process holds the write lock
+        embedding = await asyncio.to_thread(cache.get, text)
+        record_cache('embedding', embedding is not None)
+        if embedding is not None:
+            return embedding
+    try:
+        embedding = normalize_embedding((await get_backend().aembed([text]))[0])
     except Exception as e:
         raise EmbeddingError(f"Failed to generate embedding: {str(e)}") from e
+    if cache is not None:
+        await asyncio.to_thread(cache.put, text, embedding)
+    return embedding
 
 
 # def get_embedding(file_path: str) -> Optional[np.ndarray]:
@@ -113,23 +159,137 @@ def compute_similarity(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
 #         )
 #     return float(np.dot(embedding1, embedding2))
 
-def batch_get_embeddings(texts: List[str]) -> Dict[str, np.ndarray]:
+def compute_similarity_batch(query_embeddings: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """
+    Compute cosine similarities between queries and many embeddings at once.
+    
+    Args:
+        query_embeddings (np.ndarray): One normalized query vector, or a matrix of them
+        embeddings (np.ndarray): Normalized embeddings, one per row; float16 and
+            ``RAG.similarity.QuantizedMatrix`` storage is accumulated in float32
+    
+    Returns:
+        np.ndarray: Scores shaped ``(rows,)`` for one query, ``(queries, rows)`` for several
+    
+    Raises:
+        ValueError: If the embeddings have different dimensions
+    """
+    return similarity(query_embeddings, embeddings)
+
+def embed_batch(texts: List[str]) -> np.ndarray:
+    """
+    Generate embeddings for several texts in a single request.
+    
+    Args:
+        texts (List[str]): Texts to embed
+    
+    Returns:
+        np.ndarray: Normalized embeddings, one row per text
+    
+    Raises:
+        EmbeddingError: If the embedding generation fails
+    """
+    try:
+        matrix = np.asarray(get_backend().embed(texts), dtype=np.float32)
+    except Exception as e:
+        raise EmbeddingError(f"Failed to generate embeddings: {str(e)}") from e
+    if matrix.shape[0] != len(texts):
+        raise EmbeddingError(f"Expected {len(texts)} embeddings, got {matrix.shape[0]}")
+    return normalize_embedding(matrix)
+
+
+def _embed_batches(
+    texts: List[str],
+    batch_size: int,
+    max_workers: int
+) -> Iterator[Tuple[int, Union[np.ndarray, EmbeddingError]]]:
+    """Embed texts in batches on a thread pool, yielding (offset, result) as batches finish."""
+    batches = [(start, texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+    if not batches:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = {executor.submit(embed_batch, batch): start for start, batch in batches}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except EmbeddingError as e:
+                yield futures[future], e
+
+
+def _embed_unique(
+    texts: List[str],
+    batch_size: int,
+    max_workers: int,
+    skip_failures: bool
+) -> Dict[str, np.ndarray]:
+    """
+    Embed each distinct text once, serving what it can from the persistent
+    cache and sending only the misses to the backend.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    cache = _persistent_cache()
+    embeddings = cache.get_many(unique_texts) if cache is not None else {}
+    missing = [text for text in unique_texts if text not in embeddings]
+
+    fresh = {}
+    for start, result in _embed_batches(missing, batch_size, max_workers):
+        if isinstance(result, EmbeddingError):
+            if skip_failures:
+                continue
+            raise result
+        for offset, embedding in enumerate(result):
+            fresh[missing[start + offset]] = embedding
+    if cache is not None:
+        cache.put_many(fresh)
+    embeddings.update(fresh)
+    return embeddings
+
+
+def embed_texts(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_workers: int = EMBEDDING_CONCURRENCY
+) -> np.ndarray:
+    """
+    Generate embeddings for many texts with batched, concurrent requests.
+    
+    Args:
+        texts (List[str]): Texts to embed
+        batch_size (int): Texts per embedding request
+        max_workers (int): Maximum number of requests in flight
+    
+    Returns:
+        np.ndarray: Normalized embeddings in the same order as ``texts``
+    
+    Raises:
+        EmbeddingError: If any batch fails
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    embeddings = _embed_unique(texts, batch_size, max_workers, skip_failures=False)
+    return np.vstack([embeddings[text] for text in texts]).astype(np.float32, copy=False)
+
+
+def batch_get_embeddings(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_workers: int = EMBEDDING_CONCURRENCY
+) -> Dict[str, np.ndarray]:
     """
     Generate embeddings for multiple texts in batch.
     
+    Texts are sent to the embedding backend ``batch_size`` at a time with up
+    to ``max_workers`` requests in flight. Batches that fail are skipped.
+    
     Args:
         texts (List[str]): List of texts to generate embeddings for
+        batch_size (int): Texts per embedding request
+        max_workers (int): Maximum number of requests in flight
     
     Returns:
         Dict[str, np.ndarray]: Dictionary mapping texts to their normalized embeddings
     """
-    embeddings = {}
-    for text in texts:
-        try:
-            embeddings[text] = get_embedding(text)
-        except EmbeddingError:
-            continue
-    return embeddings
+    return _embed_unique(texts, batch_size, max_workers, skip_failures=True)
 
 # def batch_get_embeddings(texts: List[str]) -> Dict[str, np.ndarray]:
 #     embeddings = {}
@@ -0,0 +1,165 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from model_backend import get_backend
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_TOUCH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in a SQLite file.
+
+    Entries are keyed on a hash of the model name and the exact text, so a
+    model change never returns stale vectors. The file survives restarts and
+    is shared by every process on the host (gunicorn workers, ingestion runs)
+    through SQLite's WAL mode. Once it grows past ``max_entries`` the least
+    recently used rows are evicted. A hit only records its use when the
+    entry was last used over ``touch_interval`` seconds ago, so lookups of
+    hot entries stay read-only and do not contend for the writer lock.
+    """
+
+    EVICTION_INTERVAL = 1000  # Writes between size checks
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        model: Optional[str] = None,
+        touch_interval: float = EMBEDDING_CACHE_TOUCH_INTERVAL
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.model = model or get_backend().embedding_model
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process; never reuse one across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            texts (List[str]): Texts to look up
+
+        Returns:
+            Dict[str, np.ndarray]: Cached embeddings for the texts that were found
+        """
+        keys = {self.key(text): text for text in texts}
+        if not keys:
+            return {}
+        found = {}
+        now = time.time()
+        try:
+            conn = self._connection()
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                stale = []
+                for key, vector, last_used in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32).copy()
+                    if last_used is None or now - last_used >= self.touch_interval:
+                        stale.append((now, key))
+                if stale:
+                    conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", stale)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+        return found
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text]).get(text)
+
+    def put_many(self, embeddings: Dict[str, np.ndarray]) -> None:
+        """Store embeddings for texts, evicting old entries if the cache is full."""
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (self.key(text), self.model, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in embeddings.items()
+        ]
+        conn = None
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+            with self._writes_lock:
+                self._writes += len(rows)
+                evict = self._writes >= self.EVICTION_INTERVAL
+                if evict:
+                    self._writes = 0
+            if evict:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+            # Otherwise this thread's connection stays in the transaction and every later BEGIN fails
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    self._local.conn = None
+
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        self.put_many({text: embedding})
+
+    def evict(self) -> None:
+        """Delete the least recently used entries beyond ``max_entries``."""
+        conn = self._connection()
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def __len__(self) -> int:
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
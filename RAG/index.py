@@ -0,0 +1,602 @@
+import os
+import json
+import logging
+import threading
+from typing import Any, List, Dict, NamedTuple, Optional, Tuple
+import numpy as np
+from datetime import datetime
+from RAG.store import EmbeddingStore, StoreError, read_legacy_json
+from RAG.ann import build_ann_index
+from RAG.quantization import build_quantizer, quantized_search
+from RAG.sharding import ShardedSearch
+from RAG.similarity import similarity, take_rows
+from RAG.lexical import BM25Index, reciprocal_rank_fusion
+from config import (
+    EMBEDDINGS_DIR,
+    RETRIEVAL_INDEX,
+    QUANTIZATION,
+    INDEX_SHARDS,
+    ANN_MIN_CHUNKS,
+    RETRIEVAL_MODE,
+    RRF_K,
+    HYBRID_CANDIDATES,
+    LEXICAL_PREFILTER,
+    LEXICAL_MIN_COVERAGE,
+    BATCH_SCORE_BLOCK
+)
+
+logger = logging.getLogger(__name__)
+
+
+class IndexData(NamedTuple):
+    """One consistent snapshot of the index, swapped as a whole on reload."""
+    matrix: np.ndarray
+    contents: List[str]
+    metadata: List[Dict]
+    ann: Any
+    quantized: Any  # ScalarQuantizer or ProductQuantizer codes, or None
+    lexical: Optional[BM25Index]
+    documents: Dict[str, Dict]  # Document name to its attributes and last_modified
+    partitions: Dict[str, np.ndarray]  # Document name to its row numbers, ascending
+    stats: Dict  # Corpus statistics, see VectorIndex.stats
+
+
+def corpus_stats(partitions: Dict[str, np.ndarray], info: Dict) -> Dict:
+    """Summarize the corpus once per load so stats requests never touch the disk."""
+    total_docs = len(partitions)
+    total_chunks = sum(rows.shape[0] for rows in partitions.values())
+    return {
+        'total_documents': total_docs,
+        'total_chunks': total_chunks,
+        'average_chunks_per_doc': total_chunks / total_docs if total_docs > 0 else 0,
+        'embedding_model': info.get('model'),
+        'embedding_dim': info.get('dim', 0),
+        'store_version': info.get('version')
+    }
+
+
+EMPTY_INDEX = IndexData(
+    np.zeros((0, 0), dtype=np.float32), [], [], None, None, None, {}, {}, corpus_stats({}, {})
+)
+
+
+def normalize_filters(filters: Optional[Dict]) -> Optional[Dict]:
+    """
+    Validate retrieval filters taken from a request.
+
+    Supported keys are ``documents`` (document filenames), ``modified_after``
+    (an ISO date or datetime), and any document attribute such as
+    ``jurisdiction`` or ``document_type``. Every key except
+    ``modified_after`` takes a string or a list of accepted strings.
+
+    Args:
+        filters (Optional[Dict]): Filters as sent by the client
+
+    Returns:
+        Optional[Dict]: Normalized filters, or None if there are none
+
+    Raises:
+        ValueError: If the filters are malformed
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+
+    normalized = {}
+    for key, value in filters.items():
+        if value is None or value == []:
+            continue
+        if key == 'modified_after':
+            if isinstance(value, str):
+                try:
+                    value = datetime.fromisoformat(value)
+                except ValueError:
+                    raise ValueError(f"modified_after is not an ISO date: {value}")
+            elif not isinstance(value, datetime):
+                raise ValueError("modified_after must be an ISO date string")
+            if value.tzinfo is not None:
+                # Stored timestamps are naive local times
+                value = value.astimezone().replace(tzinfo=None)
+            normalized[key] = value
+        else:
+            values = [value] if isinstance(value, str) else value
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"Filter '{key}' must be a string or a list of strings")
+            normalized[key] = sorted(set(values))
+    return normalized or None
+
+
+def filters_key(filters: Optional[Dict]) -> Optional[str]:
+    """Return a stable string for normalized filters, e.g. to scope cache entries."""
+    if not filters:
+        return None
+    return json.dumps(filters, sort_keys=True, default=str)
+
+
+def document_matches(document: Dict, filters: Dict) -> bool:
+    """Check a document's attributes against normalized filters."""
+    for key, value in filters.items():
+        if key == 'documents':
+            if document['filename'] not in value:
+                return False
+        elif key == 'modified_after':
+            if document['last_modified'] < value:
+                return False
+        else:
+            attribute = document.get(key)
+            if attribute is None or str(attribute) not in value:
+                return False
+    return True
+
+
+class VectorIndex:
+    """
+    In-memory index over the chunk embeddings in the embedding store.
+
+    The store's float32 matrix is memory-mapped once with the chunk texts and
+    metadata kept beside it, so a query is a single matrix-vector product.
+    For large corpora an approximate IVF/HNSW index can be enabled through
+    RETRIEVAL_INDEX. Otherwise QUANTIZATION can keep only int8 or PQ codes
+    of the vectors in RAM: queries are scored on the codes and only the best
+    RERANK_CANDIDATES rows are read from the matrix for exact scores. Exact
+    search is split over INDEX_SHARDS row ranges scanned in parallel, see
+    ``ShardedSearch``. The store's BM25 index is loaded beside the vectors so
+    queries can also be ranked lexically (see RETRIEVAL_MODE). A per-document
+    table of attributes and row partitions lets filtered queries score only
+    the chunks of matching documents. The index reloads itself when the
+    store changes on disk.
+    """
+
+    def __init__(
+        self,
+        embeddings_dir: str = EMBEDDINGS_DIR,
+        index_type: str = RETRIEVAL_INDEX,
+        mode: str = RETRIEVAL_MODE,
+        quantization: str = QUANTIZATION,
+        shards: int = INDEX_SHARDS
+    ):
+        self.embeddings_dir = embeddings_dir
+        self.index_type = index_type
+        self.mode = mode
+        self.quantization = quantization
+        self.sharding = ShardedSearch(shards)
+        self.store = EmbeddingStore(embeddings_dir, quantization)
+        # Swapped as one tuple so readers never see a half-reloaded index
+        self._data: IndexData = EMPTY_INDEX
+        self._signature: Optional[int] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data.contents)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._data.matrix
+
+    @property
+    def contents(self) -> List[str]:
+        return self._data.contents
+
+    @property
+    def metadata(self) -> List[Dict]:
+        return self._data.metadata
+
+    @property
+    def ann(self):
+        """The approximate index in use, or None for exact search."""
+        return self._data.ann
+
+    @property
+    def quantized(self):
+        """The quantized codes searched before exact re-ranking, or None."""
+        return self._data.quantized
+
+    @property
+    def lexical(self) -> Optional[BM25Index]:
+        """The BM25 index over the chunk texts."""
+        return self._data.lexical
+
+    @property
+    def documents(self) -> Dict[str, Dict]:
+        """Attributes of each indexed document, by document name."""
+        return self._data.documents
+
+    def _current_signature(self) -> Optional[int]:
+        """Return a cheap fingerprint of the store on disk."""
+        signature = self.store.signature()
+        if signature is not None:
+            return signature
+        try:
+            return os.stat(self.embeddings_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def version(self) -> Optional[int]:
+        """Return a value that changes whenever the store on disk changes."""
+        return self._current_signature()
+
+    def load(self) -> None:
+        """Open the embedding store and rebuild the chunk tables."""
+        signature = self._current_signature()
+
+        lexical = None
+        quantized = None
+        info: Dict = {}
+        if self.store.exists():
+            try:
+                matrix, records, info = self.store.load()
+            except StoreError as e:
+                # A writer may be swapping versions; keep serving the old data
+                logger.error(str(e))
+                return
+            lexical = self.store.load_lexical(info)
+            if self.quantization != 'none':
+                quantized = self.store.load_quantized(info)
+        else:
+            matrix, records = read_legacy_json(self.embeddings_dir)
+            if records:
+                logger.warning(
+                    f"Loaded legacy JSON embeddings from {self.embeddings_dir}; "
+                    f"run data_processing/migrate_embeddings.py to convert them"
+                )
+
+        contents = [record['content'] for record in records]
+        metadata = []
+        documents: Dict[str, Dict] = {}
+        partitions: Dict[str, List[int]] = {}
+        for row, record in enumerate(records):
+            name = record['document']
+            document = documents.get(name)
+            if document is None:
+                document = {
+                    'document_type': os.path.splitext(name)[1].lstrip('.').lower() or None,
+                    **record.get('attributes', {}),
+                    'filename': name,
+                    'last_modified': datetime.fromisoformat(record['last_modified'])
+                }
+                documents[name] = document
+                partitions[name] = []
+            partitions[name].append(row)
+            metadata.append({
+                **document,
+                'chunk': record['chunk'],
+                'created_at': datetime.fromisoformat(record['created_at']),
+                'last_modified': datetime.fromisoformat(record['last_modified'])
+            })
+
+        ann = None
+        if self.index_type != 'exact' and len(records) >= ANN_MIN_CHUNKS:
+            ann = build_ann_index(matrix, self.index_type)
+
+        if ann is not None or self.quantization == 'none' or not records:
+            quantized = None
+        elif quantized is None or quantized.kind != self.quantization or len(quantized) != len(records):
+            # Stores written without codes, or with another kind of codes
+            quantized = build_quantizer(matrix, self.quantization)
+
+        if (lexical is None or len(lexical) != len(contents)) and self.mode != 'dense':
+            # Stores written before the lexical index existed
+            lexical = BM25Index.build(contents)
+
+        partitions = {name: np.asarray(rows, dtype=np.int64) for name, rows in partitions.items()}
+        if not info and records:
+            info = {'dim': int(matrix.shape[1])}
+        self._data = IndexData(
+            matrix,
+            contents,
+            metadata,
+            ann,
+            quantized,
+            lexical,
+            documents,
+            partitions,
+            corpus_stats(partitions, info)
+        )
+        self._signature = signature
+        self._loaded = True
+        logger.info(f"Loaded {len(contents)} chunks from {len(documents)} documents into the vector index")
+        shards = len(self.sharding.bounds(len(contents)))
+        if ann is None and quantized is None and shards > 1:
+            logger.info(f"Exact search is split into {shards} shards")
+
+    def refresh(self) -> None:
+        """Reload the index if the store has changed; costs one ``stat`` call otherwise."""
+        if self._loaded and self._current_signature() == self._signature:
+            return
+        with self._lock:
+            if not self._loaded or self._current_signature() != self._signature:
+                self.load()
+
+    def stats(self) -> Dict:
+        """
+        Return corpus statistics.
+
+        They are computed when the store is loaded, so a call costs one
+        ``stat`` of the store header plus a copy of a few scalars.
+
+        Returns:
+            Dict: total_documents, total_chunks, average_chunks_per_doc,
+            embedding_model, embedding_dim and store_version
+        """
+        self.refresh()
+        return dict(self._data.stats)
+
+    def document_counts(self) -> Dict[str, int]:
+        """Return the number of chunks of each indexed document."""
+        self.refresh()
+        return {name: int(rows.shape[0]) for name, rows in self._data.partitions.items()}
+
+    def filter_rows(self, filters: Dict, data: Optional[IndexData] = None) -> np.ndarray:
+        """
+        Collect the rows of every document matching the filters.
+
+        Only the per-document table is scanned; rows come from the
+        precomputed partitions.
+
+        Args:
+            filters (Dict): Filters from ``normalize_filters``
+
+        Returns:
+            np.ndarray: Matching row numbers, ascending
+        """
+        data = data or self._data
+        names = [name for name, document in data.documents.items() if document_matches(document, filters)]
+        if not names:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([data.partitions[name] for name in names]))
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        min_similarity: float,
+        query_text: Optional[str] = None,
+        filters: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        Score the query against the chunks and return the best matches.
+
+        Without ``query_text`` (or in "dense" mode) chunks are ranked by
+        cosine similarity alone. Otherwise the BM25 ranking of ``query_text``
+        is used on its own ("lexical") or fused with the vector ranking by
+        reciprocal rank fusion ("hybrid"). In those modes a chunk holding at
+        least LEXICAL_MIN_COVERAGE of the query's IDF-weighted terms is kept
+        even if its similarity is below ``min_similarity``; one sharing only
+        a common word is not. With ``filters`` only chunks of matching
+        documents are scored.
+
+        Args:
+            query_embedding (np.ndarray): Normalized query embedding
+            top_k (int): Number of results to return
+            min_similarity (float): Minimum similarity threshold
+            query_text (Optional[str]): Preprocessed query text for lexical ranking
+            filters (Optional[Dict]): Filters from ``normalize_filters``
+
+        Returns:
+            List[Dict]: Matching chunks with content, similarity, metadata and embedding, best first
+        """
+        self.refresh()
+        data = self._data
+        if data.matrix.shape[0] == 0 or top_k <= 0:
+            return []
+        if query_embedding.shape[-1] != data.matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimensions don't match: {query_embedding.shape} vs {data.matrix.shape[1:]}"
+            )
+
+        rows = None
+        if filters:
+            rows = self.filter_rows(filters, data)
+            if rows.shape[0] == 0:
+                return []
+
+        query_embedding = query_embedding.astype(np.float32, copy=False)
+        if self.mode == 'dense' or query_text is None or data.lexical is None:
+            rows, scores = self._dense_search(data, query_embedding, top_k, rows)
+            matched = set()
+        else:
+            rows, scores, matched = self._hybrid_search(data, query_embedding, query_text, top_k, rows)
+        return self._results(data, rows, scores, matched, min_similarity)
+
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        min_similarity: float,
+        query_texts: Optional[List[str]] = None,
+        filters: Optional[Dict] = None,
+        block_size: int = BATCH_SCORE_BLOCK
+    ) -> List[List[Dict]]:
+        """
+        Batch variant of ``search`` for many queries.
+
+        The vector rankings of ``block_size`` queries at a time come from a
+        single matrix-matrix product, so the chunk matrix is read once per
+        block rather than once per query. The approximate index and the
+        quantized codes (when enabled) are still searched one query at a
+        time, and the lexical prefilter is not applied.
+
+        Args:
+            query_embeddings (np.ndarray): Normalized query embeddings, one per row
+            top_k (int): Number of results per query
+            min_similarity (float): Minimum similarity threshold
+            query_texts (Optional[List[str]]): Preprocessed query texts for lexical ranking
+            filters (Optional[Dict]): Filters from ``normalize_filters``, applied to every query
+            block_size (int): Queries scored per matrix-matrix product
+
+        Returns:
+            List[List[Dict]]: The results of each query, in query order
+        """
+        self.refresh()
+        data = self._data
+        n_queries = query_embeddings.shape[0]
+        if data.matrix.shape[0] == 0 or top_k <= 0 or n_queries == 0:
+            return [[] for _ in range(n_queries)]
+        if query_embeddings.shape[-1] != data.matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimensions don't match: {query_embeddings.shape} vs {data.matrix.shape[1:]}"
+            )
+
+        rows = None
+        mask = None
+        if filters:
+            rows = self.filter_rows(filters, data)
+            if rows.shape[0] == 0:
+                return [[] for _ in range(n_queries)]
+            mask = np.zeros(data.matrix.shape[0], dtype=bool)
+            mask[rows] = True
+
+        query_embeddings = query_embeddings.astype(np.float32, copy=False)
+        hybrid = self.mode != 'dense' and query_texts is not None and data.lexical is not None
+        depth = max(top_k, HYBRID_CANDIDATES) if hybrid else top_k
+        dense = None
+        if not (hybrid and self.mode == 'lexical'):
+            dense = self._dense_search_many(data, query_embeddings, depth, rows, block_size)
+
+        results = []
+        for i in range(n_queries):
+            if not hybrid:
+                ranked, scores = dense[i]
+                matched = set()
+            else:
+                lexical_rows, _ = data.lexical.search(query_texts[i], depth, mask)
+                if dense is None:
+                    ranked = lexical_rows[:top_k]
+                else:
+                    ranked, _ = reciprocal_rank_fusion([dense[i][0], lexical_rows], RRF_K)
+                    ranked = ranked[:top_k]
+                scores = similarity(query_embeddings[i], take_rows(data.matrix, ranked))
+                matched = self._lexical_matches(data, query_texts[i], ranked)
+            results.append(self._results(data, ranked, scores, matched, min_similarity))
+        return results
+
+    @staticmethod
+    def _lexical_matches(data: IndexData, query_text: str, rows: np.ndarray) -> set:
+        """Rows holding enough of the query's terms to be kept whatever their similarity."""
+        coverage = data.lexical.coverage(query_text, rows)
+        return set(rows[coverage >= LEXICAL_MIN_COVERAGE].tolist())
+
+    @staticmethod
+    def _results(
+        data: IndexData,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        matched: set,
+        min_similarity: float
+    ) -> List[Dict]:
+        return [
+            {
+                'content': data.contents[i],
+                'similarity': float(score),
+                'metadata': dict(data.metadata[i]),
+                'embedding': data.matrix[i]
+            }
+            for i, score in zip(rows.tolist(), scores)
+            if score >= min_similarity or i in matched
+        ]
+
+    def _dense_search_many(
+        self,
+        data: IndexData,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray],
+        block_size: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Rank rows by cosine similarity for every query, one block of queries per product."""
+        if candidates is None and data.ann is not None:
+            return [data.ann.search(data.matrix, query, top_k) for query in query_embeddings]
+        if data.quantized is not None:
+            return [
+                quantized_search(data.quantized, data.matrix, query, top_k, candidates)
+                for query in query_embeddings
+            ]
+        if candidates is not None:
+            candidates = np.sort(candidates)
+
+        rankings = []
+        for start in range(0, query_embeddings.shape[0], block_size):
+            best_rows, best_scores = self.sharding.search(
+                data.matrix, query_embeddings[start:start + block_size], top_k, candidates
+            )
+            rankings.extend(zip(best_rows, best_scores))
+        return rankings
+
+    def _dense_search(
+        self,
+        data: IndexData,
+        query_embedding: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Rank rows (all of them, or only ``candidates``) by cosine similarity."""
+        if candidates is None and data.ann is not None:
+            return data.ann.search(data.matrix, query_embedding, top_k)
+        if data.quantized is not None:
+            return quantized_search(data.quantized, data.matrix, query_embedding, top_k, candidates)
+        if candidates is not None:
+            candidates = np.sort(candidates)  # Sequential reads from the memory-mapped matrix
+        return self.sharding.search(data.matrix, query_embedding, top_k, candidates)
+
+    def _hybrid_search(
+        self,
+        data: IndexData,
+        query_embedding: np.ndarray,
+        query_text: str,
+        top_k: int,
+        rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray, set]:
+        """
+        Rank rows lexically, or by fusing the lexical and vector rankings.
+
+        Args:
+            rows (Optional[np.ndarray]): Restrict the search to these rows
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, set]: Row numbers best first, their
+            cosine similarities, and the rows that match the query lexically,
+            see ``_lexical_matches``
+        """
+        depth = max(top_k, HYBRID_CANDIDATES)
+        mask = None
+        if rows is not None:
+            mask = np.zeros(data.matrix.shape[0], dtype=bool)
+            mask[rows] = True
+
+        # On large corpora only chunks sharing a term with the query are
+        # scored densely, unless too few of them match
+        candidates = rows
+        lexical_rows = None
+        scope = data.matrix.shape[0] if rows is None else rows.shape[0]
+        if LEXICAL_PREFILTER and scope > LEXICAL_PREFILTER:
+            prefilter, _ = data.lexical.search(query_text, LEXICAL_PREFILTER, mask)
+            if prefilter.shape[0] >= top_k:
+                candidates = prefilter
+                lexical_rows = prefilter[:depth]
+        if lexical_rows is None:
+            lexical_rows, _ = data.lexical.search(query_text, depth, mask)
+
+        if self.mode == 'lexical':
+            ranked = lexical_rows[:top_k]
+        else:
+            dense_rows, _ = self._dense_search(data, query_embedding, depth, candidates)
+            ranked, _ = reciprocal_rank_fusion([dense_rows, lexical_rows], RRF_K)
+            ranked = ranked[:top_k]
+        similarities = similarity(query_embedding, take_rows(data.matrix, ranked))
+        return ranked, similarities, self._lexical_matches(data, query_text, ranked)
+
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> VectorIndex:
+    """Return the process-wide vector index, creating it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = VectorIndex()
+    return _index
@@ -0,0 +1,209 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from RAG.similarity import top_k_rows
+from config import BM25_K1, BM25_B, RRF_K
+
+# Words, numbers and joined terms such as "h-1b", "i-129" or "214.2"
+TOKEN_PATTERN = re.compile(r'\w+(?:[-.]\w+)*')
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase lexical terms."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index over chunk texts with Okapi BM25 scoring.
+
+    Postings are stored as flat NumPy arrays (CSR layout): the rows and term
+    frequencies for term ``t`` live at ``indptr[t]:indptr[t + 1]``. Per-posting
+    BM25 weights are precomputed, so a query only gathers the postings of its
+    terms and sums them per row; rows without a query term are never touched.
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = BM25_K1,
+        b: float = BM25_B
+    ):
+        self.terms = list(terms)
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.int32)
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.k1 = k1
+        self.b = b
+        self.idf = self._idf()
+        self.weights = self._weights()
+
+    def __len__(self) -> int:
+        return int(self.doc_len.shape[0])
+
+    def _idf(self) -> np.ndarray:
+        df = np.diff(self.indptr).astype(np.float64)
+        return np.log1p((len(self) - df + 0.5) / (df + 0.5))
+
+    def _weights(self) -> np.ndarray:
+        n = len(self)
+        if n == 0 or self.rows.shape[0] == 0:
+            return np.zeros(0, dtype=np.float32)
+        avgdl = max(float(self.doc_len.mean()), 1.0)
+        tf = self.tfs.astype(np.float64)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[self.rows] / avgdl)
+        term_idf = np.repeat(self.idf, np.diff(self.indptr))
+        return (term_idf * tf * (self.k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+    @classmethod
+    def build(cls, contents: Iterable[str]) -> "BM25Index":
+        """
+        Build the index from chunk texts in row order.
+
+        Args:
+            contents (Iterable[str]): Chunk texts
+
+        Returns:
+            BM25Index: The built index
+        """
+        vocabulary: Dict[str, int] = {}
+        term_ids: List[int] = []
+        rows: List[int] = []
+        tfs: List[int] = []
+        doc_len: List[int] = []
+        for row, content in enumerate(contents):
+            tokens = tokenize(content)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        return cls(
+            list(vocabulary),
+            indptr,
+            np.asarray(rows, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.int32)[order],
+            np.asarray(doc_len, dtype=np.int32)
+        )
+
+    def save(self, path: str) -> None:
+        """Write the index to an ``.npz`` file."""
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                # Newline-joined UTF-8; fixed-width unicode arrays waste space on long terms
+                terms=np.frombuffer('\n'.join(self.terms).encode('utf-8'), dtype=np.uint8),
+                indptr=self.indptr,
+                rows=self.rows,
+                tfs=self.tfs,
+                doc_len=self.doc_len
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Read an index written by ``save``."""
+        with np.load(path, allow_pickle=False) as data:
+            terms = data['terms'].tobytes().decode('utf-8')
+            return cls(
+                terms.split('\n') if terms else [],
+                data['indptr'],
+                data['rows'],
+                data['tfs'],
+                data['doc_len']
+            )
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank chunks by BM25 against a query.
+
+        Args:
+            query (str): Query text
+            top_k (int): Number of results to return
+            mask (Optional[np.ndarray]): Boolean array over rows; only True rows are ranked
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Row numbers and BM25 scores, best
+            first. Only rows containing at least one query term are returned.
+        """
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not term_ids or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate([self.rows[self.indptr[t]:self.indptr[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in term_ids])
+        if mask is not None:
+            keep = mask[rows]
+            rows, weights = rows[keep], weights[keep]
+            if rows.shape[0] == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        matched, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        best = top_k_rows(scores, top_k)
+        return matched[best].astype(np.int64), scores[best]
+
+
+    def coverage(self, query: str, rows: np.ndarray) -> np.ndarray:
+        """
+        Share of the query's IDF-weighted terms that each row contains.
+
+        Unlike a BM25 score this does not depend on the rest of the corpus
+        matching well: a row sharing only a common word with the query
+        scores near 0, a row containing every known query term scores 1.
+
+        Args:
+            query (str): Query text
+            rows (np.ndarray): Row numbers to measure
+
+        Returns:
+            np.ndarray: Coverage between 0 and 1 of each row, 0 if no query term is known
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        term_ids = sorted({self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary})
+        covered = np.zeros(rows.shape[0], dtype=np.float64)
+        if not term_ids or rows.shape[0] == 0:
+            return covered.astype(np.float32)
+        for t in term_ids:
+            covered += self.idf[t] * np.isin(rows, self.rows[self.indptr[t]:self.indptr[t + 1]])
+        return (covered / self.idf[term_ids].sum()).astype(np.float32)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[np.ndarray], k: int = RRF_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge several rankings of rows with reciprocal rank fusion.
+
+    Each row scores ``sum(1 / (k + rank))`` over the rankings it appears in,
+    with ranks starting at 1.
+
+    Args:
+        rankings (Iterable[np.ndarray]): Row numbers, best first, one array per ranking
+        k (int): Rank offset; larger values flatten the contribution of top ranks
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Row numbers and fused scores, best first
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist(), start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    if not fused:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float64, count=len(fused))
+    order = np.argsort(-scores, kind='stable')
+    return rows[order], scores[order].astype(np.float32)
@@ -1,10 +1,12 @@
 import os
 import json
+import asyncio
 import logging
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import numpy as np
 from datetime import datetime
-from RAG.embedding import get_embedding, compute_similarity
+from RAG.embedding import get_embedding, aget_embedding, embed_texts
+from RAG.index import get_index, normalize_filters, filters_key
 from config import (
     EMBEDDINGS_DIR,
     TOP_K_RESULTS,
@@ -75,10 +77,37 @@ def preprocess_query(query: str) -> str:
 #     return ' '.join(filtered_words)
 
 
+def embed_query(query: str) -> np.ndarray:
+    """Embed a query the same way retrieval does."""
+    return get_embedding(preprocess_query(query))
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """Embed many queries with batched requests, one row per query."""
+    return embed_texts([preprocess_query(query) for query in queries])
+
+
+def embed_queries_and_questions(queries: List[str], questions: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Embed retrieval queries and questions as asked in one batch.
+
+    Queries go through ``preprocess_query`` like ``embed_queries``; questions
+    are embedded verbatim, since the answer cache must tell apart questions
+    that differ only by words it drops, such as "when" and "why".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: One row per query and one row per question
+    """
+    embeddings = embed_texts([preprocess_query(query) for query in queries] + list(questions))
+    return embeddings[:len(queries)], embeddings[len(queries):]
+
+
 def retrieve_relevant_documents(
     query: str,
     top_k: int = TOP_K_RESULTS,
-    min_similarity: float = SIMILARITY_THRESHOLD
+    min_similarity: float = SIMILARITY_THRESHOLD,
+    query_embedding: Optional[np.ndarray] = None,
+    filters: Optional[Dict] = None
 ) -> List[Dict]:
     """
     Retrieve the most relevant documents for a given query.
@@ -87,6 +116,8 @@ def retrieve_relevant_documents(
         query (str): The search query
         top_k (int): Number of most relevant documents to return
         min_similarity (float): Minimum similarity threshold
+        query_embedding (Optional[np.ndarray]): Precomputed ``embed_query(query)``
+        filters (Optional[Dict]): Restrict retrieval to matching documents, see ``normalize_filters``
     
     Returns:
         List[Dict]: List of relevant documents with their metadata and scores
@@ -95,41 +126,83 @@ def retrieve_relevant_documents(
         logger.warning(f"Embeddings directory {EMBEDDINGS_DIR} does not exist!")
         return []
     
-    # Preprocess the query
-    processed_query = preprocess_query(query)
-    
     # Get query embedding
-    query_embedding = get_embedding(processed_query)
-    
-    # Load and score documents
-    scored_docs = []
-    for filename in os.listdir(EMBEDDINGS_DIR):
-        if not filename.endswith('.json'):
-            continue
-            
-        file_path = os.path.join(EMBEDDINGS_DIR, filename)
-        try:
-            with open(file_path, 'r') as f:
-                doc_data = json.load(f)
-                
-            doc_embedding = np.array(doc_data['embedding'])
-            similarity = compute_similarity(query_embedding, doc_embedding)
-            
-            if similarity >= min_similarity:
-                metadata = load_document_metadata(file_path)
-                scored_docs.append({
-                    'content': doc_data['content'],
-                    'similarity': similarity,
-                    'metadata': metadata.__dict__
-                })
-                
-        except Exception as e:
-            logger.error(f"Error processing {filename}: {str(e)}")
-            continue
-    
-    # Sort by similarity and get top k
-    scored_docs.sort(key=lambda x: x['similarity'], reverse=True)
-    return scored_docs[:top_k]
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    
+    # Score the chunks in one pass over the resident index
+    return get_index().search(
+        query_embedding, top_k, min_similarity, query_text=query, filters=normalize_filters(filters)
+    )
+
+
+def retrieve_relevant_documents_batch(
+    queries: List[str],
+    top_k: int = TOP_K_RESULTS,
+    min_similarity: float = SIMILARITY_THRESHOLD,
+    query_embeddings: Optional[np.ndarray] = None,
+    filters: Optional[Dict] = None
+) -> List[List[Dict]]:
+    """
+    Retrieve the most relevant documents for many queries at once.
+    
+    Args:
+        queries (List[str]): The search queries
+        top_k (int): Number of most relevant documents to return per query
+        min_similarity (float): Minimum similarity threshold
+        query_embeddings (Optional[np.ndarray]): Precomputed ``embed_queries(queries)``
+        filters (Optional[Dict]): Restrict retrieval to matching documents, applied to every query
+    
+    Returns:
+        List[List[Dict]]: Relevant documents for each query, in query order
+    """
+    if not queries:
+        return []
+    if not os.path.exists(EMBEDDINGS_DIR):
+        logger.warning(f"Embeddings directory {EMBEDDINGS_DIR} does not exist!")
+        return [[] for _ in queries]
+    
+    if query_embeddings is None:
+        query_embeddings = embed_queries(queries)
+    
+    # Score all queries against the resident index with matrix-matrix products
+    return get_index().search_many(
+        query_embeddings, top_k, min_similarity, query_texts=queries, filters=normalize_filters(filters)
+    )
+
+
+async def aembed_query(query: str) -> np.ndarray:
+    """Async variant of ``embed_query``."""
+    return await aget_embedding(preprocess_query(query))
+
+
+async def aembed_question(question: str) -> np.ndarray:
+    """Embed a question as asked, without ``preprocess_query``, for the answer cache."""
+    return await aget_embedding(question)
+
+
+async def aretrieve_relevant_documents(
+    query: str,
+    top_k: int = TOP_K_RESULTS,
+    min_similarity: float = SIMILARITY_THRESHOLD,
+    query_embedding: Optional[np.ndarray] = None,
+    filters: Optional[Dict] = None
+) -> List[Dict]:
+    """
+    Async variant of ``retrieve_relevant_documents``.
+    
+    The query embedding is awaited on the async model client and the index
+    scan runs on a worker thread, so the event loop stays free.
+    """
+    if not os.path.exists(EMBEDDINGS_DIR):
+        logger.warning(f"Embeddings directory {EMBEDDINGS_DIR} does not exist!")
+        return []
+    
+    if query_embedding is None:
+        query_embedding = await aembed_query(query)
+    return await asyncio.to_thread(
+        get_index().search, query_embedding, top_k, min_similarity, query, normalize_filters(filters)
+    )
 
 
 # def retrieve_relevant_embeddings(query: str, top_k: int = TOP_K_RESULTS, min_similarity = int =S SIMILARITY_THRESHOLD) -> List[Dict]:
@@ -163,29 +236,25 @@ def retrieve_relevant_documents(
 #     return scored_docs[:top_k]
 
 
-def get_document_stats() -> Dict:
-    """Get statistics about the document collection."""
-    if not os.path.exists(EMBEDDINGS_DIR):
-        return {
-            'total_documents': 0,
-            'total_chunks': 0,
-            'average_chunks_per_doc': 0
-        }
-    
-    doc_chunks = {}
-    for filename in os.listdir(EMBEDDINGS_DIR):
-        if filename.endswith('.json'):
-            doc_name = filename.split('_chunk_')[0]
-            doc_chunks[doc_name] = doc_chunks.get(doc_name, 0) + 1
-    
-    total_docs = len(doc_chunks)
-    total_chunks = sum(doc_chunks.values())
-    
-    return {
-        'total_documents': total_docs,
-        'total_chunks': total_chunks,
-        'average_chunks_per_doc': total_chunks / total_docs if total_docs > 0 else 0
-    } 
+def get_document_stats(include_documents: bool = False) -> Dict:
+    """
+    Get statistics about the document collection.
+    
+    Served from the resident index, which only rereads the store when its
+    header changes on disk, so the cost per call does not grow with the
+    corpus.
+    
+    Args:
+        include_documents (bool): Also list the chunk count of every document
+    
+    Returns:
+        Dict: Document and chunk counts plus embedding store details
+    """
+    index = get_index()
+    stats = index.stats()
+    if include_documents:
+        stats['documents'] = index.document_counts()
+    return stats
 
 # def get_document_stats() -> Dict:
 #     if not os.path.exists(EMBEDDINGS_DIR):
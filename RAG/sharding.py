@@ -0,0 +1,157 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from RAG.similarity import EmbeddingMatrix, take_rows, top_k_similar
+from config import INDEX_SHARDS, SHARD_MIN_ROWS
+
+logger = logging.getLogger(__name__)
+
+
+def shard_bounds(n_rows: int, shards: int, min_rows: int = SHARD_MIN_ROWS) -> List[Tuple[int, int]]:
+    """
+    Split ``n_rows`` rows into contiguous ranges of about equal size.
+
+    Args:
+        n_rows (int): Rows to split
+        shards (int): Most ranges to return
+        min_rows (int): Fewest rows per range; fewer ranges are made otherwise
+
+    Returns:
+        List[Tuple[int, int]]: ``(start, stop)`` of each range, at least one
+    """
+    count = max(1, min(shards, n_rows // max(1, min_rows)))
+    edges = np.linspace(0, n_rows, count + 1).astype(np.int64).tolist()
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def merge_top_k(parts: Sequence[Tuple[np.ndarray, np.ndarray]], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge the rankings of several shards into one.
+
+    Args:
+        parts (Sequence[Tuple[np.ndarray, np.ndarray]]): Row numbers and
+            scores of each shard, 1-D for one query or ``(queries, k)``
+        top_k (int): Rows to keep per query
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The best ``top_k`` rows and scores, best first
+    """
+    rows = np.concatenate([part[0] for part in parts], axis=-1)
+    scores = np.concatenate([part[1] for part in parts], axis=-1)
+    # At most shards * top_k entries per query, so a full sort is cheap
+    order = np.argsort(-scores, axis=-1, kind='stable')[..., :top_k]
+    return np.take_along_axis(rows, order, axis=-1), np.take_along_axis(scores, order, axis=-1)
+
+
+def limit_blas_threads() -> bool:
+    """
+    Limit BLAS to one thread for the whole process with ``threadpoolctl``, if installed.
+
+    Returns:
+        bool: Whether the limit was applied
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning(
+            "threadpoolctl is not installed, so BLAS may start threads for every shard; "
+            "install it with 'pip install threadpoolctl' or set OPENBLAS_NUM_THREADS=1"
+        )
+        return False
+    threadpool_limits(limits=1, user_api='blas')
+    return True
+
+
+class ShardedSearch:
+    """
+    Exact similarity search scattered over row ranges of one matrix.
+
+    Every shard is a contiguous range of rows of the same, usually
+    memory-mapped, matrix, so the shards share its pages and nothing is
+    copied. A query is scored against all shards at once on a pool of
+    worker threads (the matrix products and partial sorts run in NumPy
+    with the GIL released), and the per-shard top-k lists are merged.
+    With filters, the candidate rows are split into shards instead.
+
+    Every server worker process has its own pool, so a host runs up to
+    workers x shards search threads: pick INDEX_SHARDS so that product does
+    not exceed the cores (e.g. 4 gunicorn workers x 8 shards on 32 cores).
+    When the first sharded search starts, BLAS is limited to one thread per
+    caller through the optional ``threadpoolctl`` package, as the shards
+    already use the cores; without it, set ``OPENBLAS_NUM_THREADS=1`` (or
+    the equivalent for your BLAS) in the environment.
+    """
+
+    def __init__(self, shards: int = INDEX_SHARDS, min_rows: int = SHARD_MIN_ROWS):
+        self.shards = max(1, shards)
+        self.min_rows = min_rows
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def bounds(self, n_rows: int) -> List[Tuple[int, int]]:
+        return shard_bounds(n_rows, self.shards, self.min_rows)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Shared by all requests, so concurrent queries queue for the same workers
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    limit_blas_threads()
+                    self._executor = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix='index-shard')
+        return self._executor
+
+    @staticmethod
+    def _search_shard(
+        matrix: EmbeddingMatrix,
+        queries: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray],
+        start: int,
+        stop: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if candidates is None:
+            rows, scores = top_k_similar(queries, matrix[start:stop], top_k)
+            return rows + start, scores
+        shard = candidates[start:stop]
+        rows, scores = top_k_similar(queries, take_rows(matrix, shard), top_k)
+        return shard[rows], scores
+
+    def search(
+        self,
+        matrix: EmbeddingMatrix,
+        queries: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the most similar rows for one or many queries.
+
+        Args:
+            matrix (EmbeddingMatrix): Unit-length rows
+            queries (np.ndarray): One query vector, or a matrix of query rows
+            top_k (int): Rows to return per query
+            candidates (Optional[np.ndarray]): Search only these rows, ascending
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Row numbers and scores, best first;
+            1-D for one query, ``(queries, k)`` for several
+        """
+        n = matrix.shape[0] if candidates is None else candidates.shape[0]
+        bounds = self.bounds(n)
+        if len(bounds) == 1:
+            return self._search_shard(matrix, queries, top_k, candidates, 0, n)
+        pool = self._pool()
+        futures = [
+            pool.submit(self._search_shard, matrix, queries, top_k, candidates, start, stop)
+            for start, stop in bounds
+        ]
+        return merge_top_k([future.result() for future in futures], top_k)
+
+    def close(self) -> None:
+        """Stop the worker threads; they are started again on the next sharded search."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,203 @@
+from typing import Optional, Tuple, Union
+import numpy as np
+from config import SIMILARITY_BLOCK_ROWS
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Return the positions of the ``top_k`` highest scores, best first."""
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale one vector, or every row of a matrix, to unit length.
+
+    Zero vectors are returned unchanged. Integer input is converted to
+    float32; floating input keeps its dtype.
+    """
+    embeddings = np.asarray(embeddings)
+    if not np.issubdtype(embeddings.dtype, np.floating):
+        embeddings = embeddings.astype(np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+class QuantizedMatrix:
+    """
+    Embedding matrix stored as float16 or int8 to cut memory and bandwidth.
+
+    int8 rows are scaled symmetrically, row ``i`` being approximately
+    ``data[i] * scales[i]``. Rows are converted back to float32 one block at
+    a time, so products accumulate in float32 without a full-size copy.
+    """
+
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.data = data
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+
+    @classmethod
+    def from_float(cls, matrix: np.ndarray, dtype: str = 'int8') -> "QuantizedMatrix":
+        """
+        Quantize a float matrix.
+
+        Args:
+            matrix (np.ndarray): Float embeddings, one row per vector
+            dtype (str): "float16" or "int8"
+
+        Returns:
+            QuantizedMatrix: The quantized matrix
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if dtype == 'float16':
+            return cls(matrix.astype(np.float16))
+        if dtype == 'int8':
+            scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.zeros(matrix.shape[0])
+            scales[scales == 0] = 1.0
+            data = np.rint(matrix / scales[:, None]).astype(np.int8)
+            return cls(data, scales)
+        raise ValueError(f"Unsupported storage dtype: {dtype}")
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.data.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.data.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Dequantize rows (a slice or an index array) to float32."""
+        block = self.data[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][..., None]
+        return block
+
+
+EmbeddingMatrix = Union[np.ndarray, QuantizedMatrix]
+
+
+def take_rows(matrix: EmbeddingMatrix, rows) -> np.ndarray:
+    """Read rows (a slice or an index array) of any embedding matrix as float32."""
+    return np.asarray(matrix[rows], dtype=np.float32)
+
+
+def _single_product(matrix: EmbeddingMatrix) -> bool:
+    # float32 arrays (in RAM or memory-mapped) are multiplied in one BLAS call;
+    # anything needing conversion is done a block at a time
+    return isinstance(matrix, np.ndarray) and matrix.dtype == np.float32
+
+
+def similarity(
+    queries: np.ndarray,
+    matrix: EmbeddingMatrix,
+    block_rows: int = SIMILARITY_BLOCK_ROWS
+) -> np.ndarray:
+    """
+    Cosine similarity of unit-length queries against every row of a matrix.
+
+    Args:
+        queries (np.ndarray): One query vector, or a matrix of query rows
+        matrix (EmbeddingMatrix): Unit-length rows, as float32, float16 or a QuantizedMatrix
+        block_rows (int): Matrix rows converted to float32 at a time
+
+    Returns:
+        np.ndarray: float32 scores, shaped ``(rows,)`` for one query and
+        ``(queries, rows)`` for several
+
+    Raises:
+        ValueError: If the dimensions don't match
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if queries.shape[-1] != matrix.shape[1]:
+        raise ValueError(f"Embedding dimensions don't match: {queries.shape} vs {matrix.shape[1:]}")
+    if _single_product(matrix):
+        return matrix @ queries if queries.ndim == 1 else queries @ matrix.T
+
+    n = matrix.shape[0]
+    scores = np.empty(queries.shape[:-1] + (n,), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = take_rows(matrix, slice(start, start + block_rows))
+        scores[..., start:start + block.shape[0]] = queries @ block.T
+    return scores
+
+
+def _top_k_columns(
+    scores: np.ndarray,
+    k: int,
+    offset: int,
+    rows: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the ``k`` best columns of each row of scores, unordered, with their row numbers."""
+    if rows is None:
+        rows = np.broadcast_to(np.arange(offset, offset + scores.shape[1]), scores.shape)
+    if scores.shape[1] <= k:
+        return np.array(rows, dtype=np.int64), scores
+    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.take_along_axis(rows, keep, axis=1)
+    return rows.astype(np.int64, copy=False), np.take_along_axis(scores, keep, axis=1)
+
+
+def top_k_similar(
+    queries: np.ndarray,
+    matrix: EmbeddingMatrix,
+    top_k: int,
+    block_rows: int = SIMILARITY_BLOCK_ROWS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the most similar rows for one or many queries, one block of rows at a time.
+
+    Only ``queries x block_rows`` scores exist at once, so the matrix may
+    be a memory-mapped file far larger than RAM and the queries a large
+    batch; each block's winners are merged into a running top-k.
+
+    Args:
+        queries (np.ndarray): One query vector, or a matrix of query rows
+        matrix (EmbeddingMatrix): Unit-length rows, as float32, float16 or a QuantizedMatrix
+        top_k (int): Rows to return per query
+        block_rows (int): Matrix rows scored at a time
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Row numbers and scores, best first;
+        1-D for one query, ``(queries, k)`` for several
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    single = queries.ndim == 1
+    queries = np.atleast_2d(queries)
+    n = matrix.shape[0]
+    k = min(top_k, n)
+    if k <= 0:
+        empty = np.zeros((queries.shape[0], 0))
+        rows, scores = empty.astype(np.int64), empty.astype(np.float32)
+        return (rows[0], scores[0]) if single else (rows, scores)
+
+    best_rows = np.zeros((queries.shape[0], 0), dtype=np.int64)
+    best_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = take_rows(matrix, slice(start, start + block_rows))
+        rows, scores = _top_k_columns(queries @ block.T, k, start)
+        if best_rows.shape[1]:
+            rows, scores = _top_k_columns(
+                np.concatenate([best_scores, scores], axis=1), k, 0,
+                np.concatenate([best_rows, rows], axis=1)
+            )
+        best_rows, best_scores = rows, scores
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best_rows = np.take_along_axis(best_rows, order, axis=1).astype(np.int64, copy=False)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    return (best_rows[0], best_scores[0]) if single else (best_rows, best_scores)
@@ -0,0 +1,308 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import List, Dict, Optional, Tuple, Iterable
+import numpy as np
+from datetime import datetime
+from RAG.lexical import BM25Index
+from RAG.similarity import normalize_rows
+from RAG.quantization import build_quantizer, load_quantizer
+from model_backend import get_backend
+from config import EMBEDDINGS_DIR, QUANTIZATION
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "store.json"
+LEGACY_CHUNK_PATTERN = re.compile(r'^(?P<document>.+)_chunk_(?P<chunk>\d+)\.json$')
+
+
+class StoreError(Exception):
+    """Custom exception for embedding store errors."""
+    pass
+
+
+class EmbeddingStore:
+    """
+    Binary embedding store for one corpus.
+
+    Layout inside the store directory:
+        store.json            -- current version, dimension, model, per-document chunk counts
+        vectors-<v>.npy       -- float32 matrix of unit-length chunk embeddings, one row per chunk
+        chunks-<v>.jsonl      -- one JSON record per row: document, chunk, content, hash, timestamps, attributes
+        lexical-<v>.npz       -- BM25 inverted index over the chunk texts, in row order
+        quantized-<v>.npz     -- int8 or PQ codes of the vectors, in row order (when QUANTIZATION is set)
+
+    The matrix is opened with ``mmap_mode='r'`` so every gunicorn worker shares
+    the same pages through the OS cache. Writers produce a new version of the
+    data files and swap ``store.json`` atomically, so readers never observe a
+    half-written store.
+    """
+
+    def __init__(self, directory: str = EMBEDDINGS_DIR, quantization: str = QUANTIZATION):
+        self.directory = directory
+        self.quantization = quantization
+        self.store_path = os.path.join(directory, STORE_FILE)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.store_path)
+
+    def signature(self) -> Optional[int]:
+        """Return the mtime of store.json, which changes on every write."""
+        try:
+            return os.stat(self.store_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read_info(self) -> Dict:
+        """Read the store header (version, dim, model, document counts)."""
+        with open(self.store_path, 'r') as f:
+            return json.load(f)
+
+    def _vectors_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"vectors-{version}.npy")
+
+    def _chunks_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"chunks-{version}.jsonl")
+
+    def _lexical_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"lexical-{version}.npz")
+
+    def _quantized_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"quantized-{version}.npz")
+
+    def load(self) -> Tuple[np.ndarray, List[Dict], Dict]:
+        """
+        Open the current version of the store.
+
+        Returns:
+            Tuple[np.ndarray, List[Dict], Dict]: Memory-mapped embedding matrix,
+            chunk records and the store header
+
+        Raises:
+            StoreError: If the store is missing or inconsistent
+        """
+        try:
+            info = self.read_info()
+            version = info['version']
+            matrix = np.load(self._vectors_path(version), mmap_mode='r')
+            with open(self._chunks_path(version), 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError, KeyError) as e:
+            raise StoreError(f"Failed to load embedding store: {str(e)}") from e
+
+        if matrix.ndim != 2 or matrix.shape[0] != len(records):
+            raise StoreError(
+                f"Embedding store is inconsistent: {matrix.shape[0]} vectors vs {len(records)} chunks"
+            )
+        return matrix, records, info
+
+    def load_lexical(self, info: Dict) -> Optional[BM25Index]:
+        """
+        Open the BM25 index written with a store version.
+
+        Args:
+            info (Dict): Store header returned by ``load``
+
+        Returns:
+            Optional[BM25Index]: The index, or None if this version has none
+        """
+        path = self._lexical_path(info['version'])
+        try:
+            return BM25Index.load(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load lexical index {path}: {str(e)}")
+            return None
+
+    def load_quantized(self, info: Dict):
+        """
+        Open the quantized codes written with a store version.
+
+        Args:
+            info (Dict): Store header returned by ``load``
+
+        Returns:
+            The ScalarQuantizer or ProductQuantizer, or None if this version has none
+        """
+        path = self._quantized_path(info['version'])
+        try:
+            return load_quantizer(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load quantized codes {path}: {str(e)}")
+            return None
+
+    def write(self, matrix: np.ndarray, records: List[Dict]) -> None:
+        """
+        Write a complete new version of the store.
+
+        Args:
+            matrix (np.ndarray): Embedding matrix, one row per record
+            records (List[Dict]): Chunk records in row order
+        """
+        if matrix.shape[0] != len(records):
+            raise ValueError(
+                f"Row count doesn't match: {matrix.shape[0]} vectors vs {len(records)} chunks"
+            )
+        os.makedirs(self.directory, exist_ok=True)
+
+        previous = self.read_info()['version'] if self.exists() else 0
+        version = previous + 1
+
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        with open(self._vectors_path(version), 'wb') as f:
+            np.save(f, matrix)
+        with open(self._chunks_path(version), 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        BM25Index.build(record['content'] for record in records).save(self._lexical_path(version))
+        if self.quantization != 'none' and matrix.shape[0] > 0:
+            build_quantizer(matrix, self.quantization).save(self._quantized_path(version))
+
+        documents: Dict[str, int] = {}
+        for record in records:
+            documents[record['document']] = documents.get(record['document'], 0) + 1
+
+        info = {
+            'version': version,
+            'rows': int(matrix.shape[0]),
+            'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            'model': get_backend().embedding_model,
+            'documents': documents
+        }
+        tmp_path = self.store_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.store_path)
+
+        self._remove_old_versions(version)
+
+    def _remove_old_versions(self, keep: int) -> None:
+        for filename in os.listdir(self.directory):
+            match = re.match(r'^(?:vectors|chunks|lexical|quantized)-(\d+)\.(?:npy|jsonl|npz)$', filename)
+            if match and int(match.group(1)) != keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def update(
+        self,
+        records: List[Dict],
+        matrix: np.ndarray,
+        remove: Iterable[str] = ()
+    ) -> None:
+        """
+        Replace the chunks of some documents and write a new version.
+
+        Every document named in ``records`` or ``remove`` has its existing rows
+        dropped before the new rows are appended.
+
+        Args:
+            records (List[Dict]): New chunk records
+            matrix (np.ndarray): Embeddings for the new records
+            remove (Iterable[str]): Additional documents to delete
+        """
+        dropped = set(remove) | {record['document'] for record in records}
+
+        if self.exists():
+            old_matrix, old_records, _ = self.load()
+            keep = [i for i, record in enumerate(old_records) if record['document'] not in dropped]
+            kept_records = [old_records[i] for i in keep]
+            kept_matrix = np.asarray(old_matrix[keep], dtype=np.float32)
+        else:
+            kept_records = []
+            kept_matrix = None
+
+        parts = []
+        if kept_records:
+            parts.append(kept_matrix)
+        if records:
+            parts.append(np.asarray(matrix, dtype=np.float32).reshape(len(records), -1))
+        combined = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+        self.write(combined, kept_records + records)
+
+
+def chunk_hash(content: str) -> str:
+    """Content hash used to recognise identical chunk text across runs."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def make_record(
+    document: str,
+    chunk: int,
+    content: str,
+    source_path: Optional[str] = None,
+    attributes: Optional[Dict] = None
+) -> Dict:
+    """
+    Build a chunk record for the store.
+
+    Args:
+        document (str): Source document filename
+        chunk (int): Chunk number within the document
+        content (str): Chunk text
+        source_path (Optional[str]): File whose timestamps describe the chunk
+        attributes (Optional[Dict]): Document attributes used for filtering, e.g. jurisdiction
+
+    Returns:
+        Dict: Chunk record
+    """
+    if source_path and os.path.exists(source_path):
+        stats = os.stat(source_path)
+        created_at, last_modified = stats.st_ctime, stats.st_mtime
+    else:
+        created_at = last_modified = datetime.now().timestamp()
+    record = {
+        'document': document,
+        'chunk': chunk,
+        'content': content,
+        'hash': chunk_hash(content),
+        'created_at': datetime.fromtimestamp(created_at).isoformat(),
+        'last_modified': datetime.fromtimestamp(last_modified).isoformat()
+    }
+    if attributes:
+        record['attributes'] = dict(attributes)
+    return record
+
+
+def read_legacy_json(directory: str = EMBEDDINGS_DIR) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Read the old one-JSON-file-per-chunk layout.
+
+    Args:
+        directory (str): Directory holding ``<document>_chunk_<n>.json`` files
+
+    Returns:
+        Tuple[np.ndarray, List[Dict]]: Normalized embedding matrix and chunk records
+    """
+    entries = []
+    if os.path.exists(directory):
+        for filename in os.listdir(directory):
+            match = LEGACY_CHUNK_PATTERN.match(filename)
+            if match:
+                entries.append((match.group('document'), int(match.group('chunk')), filename))
+    entries.sort()
+
+    vectors = []
+    records = []
+    for document, chunk, filename in entries:
+        file_path = os.path.join(directory, filename)
+        try:
+            with open(file_path, 'r') as f:
+                doc_data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {filename}: {str(e)}")
+            continue
+        vectors.append(np.asarray(doc_data['embedding'], dtype=np.float32))
+        records.append(make_record(document, chunk, doc_data['content'], file_path))
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32), []
+
+    return normalize_rows(np.vstack(vectors)).astype(np.float32), records
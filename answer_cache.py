@@ -0,0 +1,273 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from RAG.index import get_index
+from RAG.similarity import similarity
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+
+
+# Words the document and query preprocessors drop as stopwords although
+# they change what a question asks ("before" vs "after filing", "when" vs
+# "why must the employer file"). Two questions whose
+# words differ by any of these never share an answer, however similar
+# their embeddings are. "t" is what is left of "don't", "isn't", etc.
+CONTRAST_WORDS = frozenset({
+    'what', 'when', 'where', 'who', 'whom', 'whose', 'which', 'why', 'how',
+    'is', 'are', 'was', 'were',
+    'not', 'no', 'nor', 'never', 'none', 'neither', 'without', 'cannot', 't',
+    'before', 'after', 'above', 'below', 'over', 'under', 'up', 'down',
+    'in', 'out', 'on', 'off', 'into', 'from', 'to', 'against', 'for',
+    'until', 'since', 'during', 'prior', 'later', 'earlier',
+    'more', 'most', 'less', 'least', 'fewer', 'few', 'only', 'all', 'any',
+    'some', 'each', 'every', 'both', 'either', 'first', 'last', 'same',
+    'other', 'than', 'except', 'unless', 'if', 'can', 'could', 'may',
+    'might', 'must', 'should', 'would', 'will', 'shall'
+})
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a question so trivially different spellings share a cache key."""
+    query = re.sub(r'[^\w\s\-]', ' ', query.lower())
+    return ' '.join(query.split())
+
+
+def same_intent(query: str, other: str) -> bool:
+    """Tell whether two normalized questions differ by no contrast word, see CONTRAST_WORDS."""
+    return not (set(query.split()) ^ set(other.split())) & CONTRAST_WORDS
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of LLM answers keyed on normalized query text.
+
+    When a question embedding is supplied, a miss on the exact key falls
+    back to the most similar cached question, so close paraphrases also hit
+    once their similarity reaches ``similarity_threshold``. The embedding
+    must be of the question as asked (``normalize_query``), not of the
+    preprocessed retrieval query, which has lost words like "not",
+    "before" or "why"; paraphrases differing by such a word never match. Question
+    embeddings live in one preallocated matrix, so a lookup is a single
+    matrix-vector product without copies. Entries stored under
+    a ``scope`` (e.g. the retrieval filters of the request) only answer
+    lookups with the same scope. The whole cache is dropped whenever
+    ``version()`` reports that the document index changed.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity_threshold: Optional[float] = ANSWER_CACHE_SIMILARITY,
+        version: Optional[Callable[[], object]] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version = version
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # Row i of the matrix holds the embedding of entry _rows[i]; unused rows are listed in _free_rows
+        self._matrix: Optional[np.ndarray] = None
+        self._rows: List[Optional[Dict]] = []
+        self._free_rows: List[int] = []
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        if self.version is None:
+            return
+        current = self.version()
+        if current != self._version:
+            self._reset()
+            self._version = current
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._rows = []
+        self._free_rows = []
+
+    def _remove(self, entry: Dict) -> None:
+        """Drop an entry and free its embedding row."""
+        self._entries.pop(entry['key'], None)
+        row = entry.get('row')
+        if row is not None:
+            self._rows[row] = None
+            self._free_rows.append(row)
+            entry['row'] = None
+
+    def _store_embedding(self, entry: Dict, embedding: np.ndarray) -> None:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+            # First embedding, or the embedding model changed: older rows are not comparable
+            for other in self._entries.values():
+                other['row'] = None
+            # One spare row: the new entry is stored before the oldest is evicted
+            self._matrix = np.zeros((self.max_entries + 1, embedding.shape[0]), dtype=np.float32)
+            self._rows = [None] * self._matrix.shape[0]
+            self._free_rows = list(range(self._matrix.shape[0] - 1, -1, -1))
+        row = self._free_rows.pop()
+        self._matrix[row] = embedding
+        self._rows[row] = entry
+        entry['row'] = row
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl is not None and now - entry['created'] > self.ttl
+
+    @staticmethod
+    def _key(query: str, scope: Optional[str]) -> str:
+        key = normalize_query(query)
+        return key if scope is None else f"{scope}\0{key}"
+
+    def get(
+        self,
+        query: str,
+        query_embedding: Optional[np.ndarray] = None,
+        scope: Optional[str] = None
+    ) -> Optional[Tuple[str, List[str]]]:
+        """
+        Look up a cached answer.
+
+        Args:
+            query (str): The user's question
+            query_embedding (Optional[np.ndarray]): Normalized embedding of
+                ``normalize_query(query)`` for paraphrase matching
+            scope (Optional[str]): Only match entries stored with the same scope
+
+        Returns:
+            Optional[Tuple[str, List[str]]]: Cached (answer, sources), or None on a miss
+        """
+        key = self._key(query, scope)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(entry)
+                entry = None
+
+            if entry is None and query_embedding is not None and self.similarity_threshold is not None:
+                entry = self._nearest(key, query_embedding, now, scope)
+                if entry is not None:
+                    self.semantic_hits += 1
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(entry['key'])
+            return entry['answer'], list(entry['sources'])
+
+    def get_exact(self, query: str, scope: Optional[str] = None) -> Optional[Tuple[str, List[str]]]:
+        """
+        Look up a question by its exact normalized text, before it is embedded.
+
+        A miss is not counted, since ``get`` is expected to follow with the
+        question embedding.
+
+        Returns:
+            Optional[Tuple[str, List[str]]]: Cached (answer, sources), or None
+        """
+        key = self._key(query, scope)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, time.monotonic()):
+                self._remove(entry)
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry['answer'], list(entry['sources'])
+
+    def _nearest(self, key: str, query_embedding: np.ndarray, now: float, scope: Optional[str]) -> Optional[Dict]:
+        if self._matrix is None or len(self._free_rows) == self._matrix.shape[0]:
+            return None
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if query_embedding.shape[0] != self._matrix.shape[1]:
+            return None
+        # Rows of evicted entries keep stale vectors but map to None
+        scores = similarity(query_embedding, self._matrix)
+        rows = np.flatnonzero(scores >= self.similarity_threshold)
+        question = key.rsplit('\0', 1)[-1]
+        for row in rows[np.argsort(-scores[rows], kind='stable')].tolist():
+            entry = self._rows[row]
+            if entry is None or entry['scope'] != scope:
+                continue
+            if self._expired(entry, now):
+                self._remove(entry)
+            elif same_intent(question, entry['question']):
+                return entry
+        return None
+
+    def put(
+        self,
+        query: str,
+        answer: str,
+        sources: List[str],
+        query_embedding: Optional[np.ndarray] = None,
+        scope: Optional[str] = None
+    ) -> None:
+        """
+        Store an answer, evicting the least recently used entries beyond ``max_entries``.
+
+        ``query_embedding`` is the embedding of ``normalize_query(query)``, as for ``get``.
+        """
+        key = self._key(query, scope)
+        with self._lock:
+            self._check_version()
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._remove(previous)
+            entry = {
+                'key': key,
+                'question': normalize_query(query),
+                'scope': scope,
+                'answer': answer,
+                'sources': list(sources),
+                'row': None,
+                'created': time.monotonic()
+            }
+            self._entries[key] = entry
+            if query_embedding is not None and self.max_entries > 0:
+                self._store_embedding(entry, query_embedding)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries.values())))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Return the process-wide answer cache, tied to the vector index version."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(version=get_index().version)
+    return _answer_cache
@@ -1,7 +1,9 @@
 import logging
-from typing import Optional
+from typing import Dict, Optional
 from llm import get_llm_response, LLMError
-from RAG.retrieval import retrieve_relevant_documents, get_document_stats
+from RAG.context import build_context
+from RAG.retrieval import retrieve_relevant_documents, embed_queries_and_questions, get_document_stats, normalize_filters, filters_key
+from answer_cache import get_answer_cache, normalize_query
 from data_processing.preprocess_docs import preprocess_document
 from config import TOP_K_RESULTS
 
@@ -16,6 +18,8 @@ logging.getLogger('ollama').setLevel(logging.WARNING)
 # logging.getLogger("requests").setLevel(logging.WARNING)
 # logging.getLogger("ollama").setLevel(logging.WARNING)
 
+answer_cache = get_answer_cache()
+
 def clear_screen():
     """Clear the terminal screen."""
     print("\033[H\033[J", end="")
@@ -58,12 +62,13 @@ def format_response(response: str, sources: list) -> str:
 #             formatted += f"\n• {source}"
 #     return formatted
 
-def process_query(user_query: str) -> Optional[str]:
+def process_query(user_query: str, filters: Optional[Dict] = None) -> Optional[str]:
     """
     Process a user query and return a response.
     
     Args:
         user_query (str): The user's question
+        filters (Optional[Dict]): Restrict retrieval to matching documents, e.g. {"jurisdiction": "US"}
     
     Returns:
         Optional[str]: The response, or None if processing failed
@@ -77,26 +82,40 @@ def process_query(user_query: str) -> Optional[str]:
         
         # Preprocess the query
         processed_query = preprocess_document(user_query)
+        # Paraphrases are matched on the question as asked, see AnswerCache
+        (query_embedding,), (question_embedding,) = embed_queries_and_questions(
+            [processed_query], [normalize_query(user_query)]
+        )
+        filters = normalize_filters(filters)
+        scope = filters_key(filters)
+        
+        # Answer repeated and paraphrased questions from the cache
+        cached = answer_cache.get(user_query, question_embedding, scope)
+        if cached is not None:
+            response, sources = cached
+            return format_response(response, sources) if sources else response
         
         # Retrieve relevant documents
         relevant_docs = retrieve_relevant_documents(
             processed_query,
-            top_k=TOP_K_RESULTS
+            top_k=TOP_K_RESULTS,
+            query_embedding=query_embedding,
+            filters=filters
         )
         
-        # Extract document contents and metadata
-        doc_contents = [doc['content'] for doc in relevant_docs] if relevant_docs else []
-        doc_metadata = [doc['metadata'] for doc in relevant_docs] if relevant_docs else []
+        # Fit the chunks into the context budget, dropping near-duplicates
+        context = build_context(relevant_docs)
         
         # Get response from LLM
-        response = get_llm_response(user_query, doc_contents)
+        response = get_llm_response(user_query, context.contents)
         
         # Format sources if available
-        if doc_metadata:
-            sources = [
-                f"{meta['filename']} (Last modified: {meta['last_modified']})"
-                for meta in doc_metadata
-            ]
+        sources = [
+            f"{chunk['metadata']['filename']} (Last modified: {chunk['metadata']['last_modified']})"
+            for chunk in context.chunks
+        ]
+        answer_cache.put(user_query, response, sources, question_embedding, scope)
+        if sources:
             return format_response(response, sources)
         
         return response
@@ -1,8 +1,11 @@
 import requests
 import os
+import json
+from typing import Iterator
 
 # Server endpoint and auth token
 API_URL = "http://localhost:5001/query"
+STREAM_URL = API_URL + "/stream"
 API_TOKEN = "secret-token-123"
 HEADERS = {
     "Authorization": f"Bearer {API_TOKEN}",
@@ -43,6 +46,31 @@ def send_query_to_api(query: str) -> str:
     except Exception as e:
         return f"An error occurred: {e}"
     
+def stream_query_to_api(query: str) -> Iterator[str]:
+    """Send query to the streaming endpoint and yield response text as it arrives."""
+    try:
+        payload = {"query": query}
+        with requests.post(STREAM_URL, headers=HEADERS, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                yield f"(Error {response.status_code}): {response.text}"
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "token" in event:
+                    yield event["token"]
+                elif "sources" in event:
+                    yield "\n\n" + "─" * 50 + "\nSources:"
+                    for source in event["sources"]:
+                        yield f"\n• {source}"
+                elif "error" in event:
+                    yield event["error"]
+                elif event.get("done"):
+                    return
+    except Exception as e:
+        yield f"An error occurred: {e}"
+
 # def send_query_to_api(query: str) -> str:
 #     try:
 #         payload = {"query": query}
@@ -74,8 +102,11 @@ def main():
             elif not user_query:
                 continue
 
-            response_text = send_query_to_api(user_query)
-            print("\n" + response_text + "\n")
+            # Print the answer as it is generated
+            print()
+            for text in stream_query_to_api(user_query):
+                print(text, end="", flush=True)
+            print("\n")
 
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -0,0 +1,519 @@
+# lawgpt_server_async.py
+#
+# asyncio (ASGI) variant of app_server_flask.py. Each in-flight query is a
+# coroutine rather than a whole worker, so one process can hold hundreds of
+# LLM-bound requests. Run with:
+#   uvicorn app_server_async:app --port 5001
+#   gunicorn -k uvicorn.workers.UvicornWorker app_server_async:app
+
+import os
+import json
+import asyncio
+import logging
+import numpy as np
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+
+from llm import aget_llm_response, astream_llm_response, LLMError
+from RAG.context import build_context
+from RAG.retrieval import (
+    aretrieve_relevant_documents,
+    retrieve_relevant_documents_batch,
+    aembed_query,
+    aembed_question,
+    embed_queries_and_questions,
+    get_document_stats,
+    normalize_filters,
+    filters_key
+)
+from answer_cache import get_answer_cache, normalize_query
+from telemetry import (
+    span,
+    trace_request,
+    new_request_id,
+    profile_requested,
+    record_cache,
+    render_metrics,
+    install_log_filter,
+    METRICS_CONTENT_TYPE
+)
+from data_processing.preprocess_docs import preprocess_document, preprocess_documents
+from config import (
+    TOP_K_RESULTS,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE,
+    BATCH_MAX_QUERIES,
+    BATCH_LLM_CONCURRENCY,
+    REQUEST_ID_HEADER,
+    PUBLIC_STATS
+)
+
+app = FastAPI(title="LawGPT API")
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s",
+    force=True  # RAG.retrieval configures logging on import; every line should carry the request ID
+)
+install_log_filter()
+
+# Simulated token for demonstration
+API_TOKEN = "secret-token-123"
+
+# Silence third-party logging
+logging.getLogger('httpx').setLevel(logging.WARNING)
+logging.getLogger('urllib3').setLevel(logging.WARNING)
+logging.getLogger('requests').setLevel(logging.WARNING)
+logging.getLogger('ollama').setLevel(logging.WARNING)
+
+NO_DOCUMENTS_MESSAGE = "I don't have any legal documents loaded yet. Please add some documents first."
+LLM_ERROR_MESSAGE = "I'm having trouble processing your request right now. Please try again later."
+UNEXPECTED_ERROR_MESSAGE = "An unexpected error occurred. Please try again later."
+BUSY_MESSAGE = "The server is busy. Please try again shortly."
+NOT_AN_OBJECT_MESSAGE = "The request body must be a JSON object."
+
+
+class QueueFullError(Exception):
+    """Raised when too many requests are already waiting for the model backend."""
+    pass
+
+
+class BackendLimiter:
+    """
+    Bounds the requests sent to the model backend.
+
+    At most ``concurrency`` requests talk to the backend at once; up to
+    ``max_queue`` more wait their turn, and any beyond that are rejected
+    straight away instead of piling up.
+    """
+
+    def __init__(self, concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self.waiting >= self.max_queue:
+            raise QueueFullError(f"{self.waiting} requests already waiting for the model backend")
+        self.waiting += 1
+        try:
+            with span('queue'):
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+limiter = BackendLimiter()
+answer_cache = get_answer_cache()
+
+
+def check_auth(req: Request) -> bool:
+    """Check if request has valid bearer token."""
+    return req.headers.get("Authorization") == f"Bearer {API_TOKEN}"
+
+
+def check_stats_auth(req: Request) -> bool:
+    """Check if request may read the stats and metrics endpoints."""
+    return PUBLIC_STATS or check_auth(req)
+
+
+def format_response(response: str, sources: list) -> str:
+    """Format response with optional source listing."""
+    formatted = response.strip()
+    if sources:
+        formatted += "\n\n" + "─" * 50 + "\nSources:"
+        for source in sources:
+            formatted += f"\n• {source}"
+    return formatted
+
+
+async def retrieve_context(
+    processed_query: str,
+    query_embedding: np.ndarray,
+    filters: Optional[Dict] = None
+) -> Tuple[List[str], List[str]]:
+    """Retrieve the chunks for a query and the source lines to cite."""
+    with span('retrieve'):
+        relevant_docs = await aretrieve_relevant_documents(
+            processed_query,
+            top_k=TOP_K_RESULTS,
+            query_embedding=query_embedding,
+            filters=filters
+        )
+
+    return context_from_documents(relevant_docs)
+
+
+def context_from_documents(relevant_docs: List[Dict]) -> Tuple[List[str], List[str]]:
+    """Fit retrieved chunks into the LLM context budget and list the sources to cite."""
+    with span('context'):
+        context = build_context(relevant_docs)
+    logging.info(
+        f"Context: {len(context.chunks)} chunks, ~{context.token_count} tokens "
+        f"({context.duplicates} near-duplicates and {context.over_budget} over budget dropped)"
+    )
+    sources = [
+        f"{chunk['metadata']['filename']} (Last modified: {chunk['metadata']['last_modified']})"
+        for chunk in context.chunks
+    ]
+    return context.contents, sources
+
+
+async def lookup_answer(
+    user_query: str,
+    filters: Optional[Dict] = None
+) -> Tuple[Optional[Tuple[str, List[str]]], Optional[str], Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Look a question up in the answer cache, embedding it only if needed.
+
+    Repeated questions are answered before any backend slot is taken; only
+    the embedding calls for a paraphrase lookup wait for one.
+
+    Returns:
+        Tuple: The cached (answer, sources) or None, then the preprocessed
+        query, its retrieval embedding and the question embedding for
+        ``answer_cache.put``, which are None on an exact hit
+    """
+    scope = filters_key(filters)
+    with span('answer_cache'):
+        cached = answer_cache.get_exact(user_query, scope)
+    if cached is not None:
+        record_cache('answer', True)
+        return cached, None, None, None
+
+    with span('preprocess'):
+        processed_query = await asyncio.to_thread(preprocess_document, user_query)
+    async with limiter.slot():
+        with span('embed'):
+            # Paraphrases are matched on the question as asked, see AnswerCache
+            query_embedding, question_embedding = await asyncio.gather(
+                aembed_query(processed_query), aembed_question(normalize_query(user_query))
+            )
+    with span('answer_cache'):
+        cached = answer_cache.get(user_query, question_embedding, scope)
+    record_cache('answer', cached is not None)
+    return cached, processed_query, query_embedding, question_embedding
+
+
+async def process_query(user_query: str, filters: Optional[Dict] = None) -> str:
+    try:
+        stats = await asyncio.to_thread(get_document_stats)
+        if stats['total_documents'] == 0:
+            return NO_DOCUMENTS_MESSAGE
+
+        cached, processed_query, query_embedding, question_embedding = await lookup_answer(user_query, filters)
+        if cached is not None:
+            response, sources = cached
+        else:
+            doc_contents, sources = await retrieve_context(processed_query, query_embedding, filters)
+            async with limiter.slot():
+                with span('llm'):
+                    response = await aget_llm_response(user_query, doc_contents)
+            answer_cache.put(user_query, response, sources, question_embedding, filters_key(filters))
+
+        if sources:
+            return format_response(response, sources)
+        return response
+
+    except QueueFullError:
+        raise
+    except LLMError:
+        return LLM_ERROR_MESSAGE
+    except Exception:
+        return UNEXPECTED_ERROR_MESSAGE
+
+
+async def process_query_stream(user_query: str, filters: Optional[Dict] = None) -> AsyncIterator[Dict]:
+    """Async variant of app_server_flask.process_query_stream."""
+    try:
+        stats = await asyncio.to_thread(get_document_stats)
+        if stats['total_documents'] == 0:
+            yield {"token": NO_DOCUMENTS_MESSAGE}
+            return
+
+        cached, processed_query, query_embedding, question_embedding = await lookup_answer(user_query, filters)
+        if cached is not None:
+            response, sources = cached
+            yield {"token": response}
+        else:
+            doc_contents, sources = await retrieve_context(processed_query, query_embedding, filters)
+            tokens = []
+            async with limiter.slot():
+                # Includes the time the client takes to read each token
+                with span('llm'):
+                    async for token in astream_llm_response(user_query, doc_contents):
+                        tokens.append(token)
+                        yield {"token": token}
+            answer_cache.put(user_query, ''.join(tokens), sources, question_embedding, filters_key(filters))
+
+        if sources:
+            yield {"sources": sources}
+
+    except QueueFullError:
+        yield {"error": BUSY_MESSAGE}
+    except LLMError:
+        yield {"error": LLM_ERROR_MESSAGE}
+    except Exception:
+        yield {"error": UNEXPECTED_ERROR_MESSAGE}
+
+
+async def process_queries(user_queries: List[str], filters: Optional[Dict] = None) -> AsyncIterator[Dict]:
+    """
+    Async variant of app_server_flask.process_queries.
+
+    The batch's embedding call and each of its LLM calls take a slot from
+    the shared backend limiter, so a large batch queues behind interactive
+    queries rather than starving them.
+    """
+    def result(i: int, **fields) -> Dict:
+        return {"index": i, "query": user_queries[i], **fields}
+
+    try:
+        stats = await asyncio.to_thread(get_document_stats)
+        if stats['total_documents'] == 0:
+            for i in range(len(user_queries)):
+                yield result(i, response=NO_DOCUMENTS_MESSAGE)
+            return
+
+        with span('preprocess'):
+            processed_queries = await asyncio.to_thread(preprocess_documents, user_queries)
+        # The embedding requests count against the backend limit like a single query's
+        async with limiter.slot():
+            with span('embed'):
+                # Paraphrases are matched on the questions as asked, see AnswerCache
+                query_embeddings, question_embeddings = await asyncio.to_thread(
+                    embed_queries_and_questions, processed_queries, [normalize_query(query) for query in user_queries]
+                )
+        scope = filters_key(filters)
+
+        pending = []
+        answered = []
+        with span('answer_cache'):
+            for i, user_query in enumerate(user_queries):
+                cached = answer_cache.get(user_query, question_embeddings[i], scope)
+                record_cache('answer', cached is not None)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    answered.append((i, cached))
+        for i, (response, sources) in answered:
+            yield result(i, response=format_response(response, sources) if sources else response)
+        if not pending:
+            return
+
+        with span('retrieve'):
+            retrieved = await asyncio.to_thread(
+                retrieve_relevant_documents_batch,
+                [processed_queries[i] for i in pending],
+                top_k=TOP_K_RESULTS,
+                query_embeddings=query_embeddings[pending],
+                filters=filters
+            )
+    except QueueFullError:
+        for i in range(len(user_queries)):
+            yield result(i, error=BUSY_MESSAGE)
+        return
+    except Exception:
+        logging.exception("Batch query preparation failed")
+        for i in range(len(user_queries)):
+            yield result(i, error=UNEXPECTED_ERROR_MESSAGE)
+        return
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(i: int, relevant_docs: List[Dict]) -> Dict:
+        try:
+            async with semaphore:
+                doc_contents, sources = context_from_documents(relevant_docs)
+                async with limiter.slot():
+                    with span('llm'):
+                        response = await aget_llm_response(user_queries[i], doc_contents)
+            answer_cache.put(user_queries[i], response, sources, question_embeddings[i], scope)
+            return result(i, response=format_response(response, sources) if sources else response)
+        except QueueFullError:
+            return result(i, error=BUSY_MESSAGE)
+        except LLMError:
+            return result(i, error=LLM_ERROR_MESSAGE)
+        except Exception:
+            return result(i, error=UNEXPECTED_ERROR_MESSAGE)
+
+    tasks = [asyncio.create_task(answer(i, relevant_docs)) for i, relevant_docs in zip(pending, retrieved)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # A disconnected client should not keep the remaining LLM calls queued
+        for task in tasks:
+            task.cancel()
+
+
+def parse_batch_queries(data: Dict) -> List[str]:
+    """
+    Validate the ``queries`` field of a batch request.
+
+    Raises:
+        ValueError: If it is not a non-empty list of non-empty strings within BATCH_MAX_QUERIES
+    """
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list of strings.")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries are accepted per batch.")
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("Every query must be a non-empty string.")
+    return [query.strip() for query in queries]
+
+
+async def read_query(request: Request) -> Tuple[str, Optional[Dict], Optional[Response]]:
+    """Authenticate a request and pull the query and optional filters out of its JSON body."""
+    if not check_auth(request):
+        logging.warning(f"Unauthorized access attempt from {request.client.host}")
+        return "", None, JSONResponse({"error": "Unauthorized"}, status_code=401)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        return "", None, JSONResponse({"error": NOT_AN_OBJECT_MESSAGE}, status_code=400)
+    user_query = data.get("query") or ""
+    if not isinstance(user_query, str):
+        return "", None, JSONResponse({"error": "query must be a string."}, status_code=400)
+    user_query = user_query.strip()
+    logging.info(f"Received query from {request.client.host}: {user_query}")
+    if not user_query:
+        return "", None, JSONResponse({"error": "Empty query provided."}, status_code=400)
+    try:
+        filters = normalize_filters(data.get("filters"))
+    except ValueError as e:
+        return "", None, JSONResponse({"error": str(e)}, status_code=400)
+    return user_query, filters, None
+
+
+@app.get("/")
+async def home():
+    return {"message": "Welcome to the LawGPT API!"}
+
+
+@app.get("/favicon.ico")
+async def favicon():
+    return Response(status_code=204)
+
+
+@app.get("/stats")
+async def stats_endpoint(request: Request):
+    """Report corpus statistics from the in-memory index."""
+    if not check_stats_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return await asyncio.to_thread(get_document_stats, True)
+
+
+@app.get("/cache/stats")
+async def cache_stats(request: Request):
+    """Report answer cache hits, misses and hit rate."""
+    if not check_stats_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return answer_cache.stats()
+
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    """Expose request and per-stage latency histograms, token and cache counters for Prometheus."""
+    if not check_stats_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.post("/query")
+async def query_endpoint(request: Request):
+    """Handle queries sent to the /query endpoint."""
+    user_query, filters, error = await read_query(request)
+    if error is not None:
+        return error
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    headers = {REQUEST_ID_HEADER: request_id}
+    try:
+        with trace_request("/query", request_id, profile_requested(request.headers)):
+            response = await process_query(user_query, filters)
+    except QueueFullError:
+        return JSONResponse({"error": BUSY_MESSAGE}, status_code=503, headers=headers)
+    return JSONResponse({"response": response}, headers=headers)
+
+
+@app.post("/query/stream")
+async def query_stream_endpoint(request: Request):
+    """Stream the answer to a query as Server-Sent Events."""
+    user_query, filters, error = await read_query(request)
+    if error is not None:
+        return error
+    if limiter.waiting >= limiter.max_queue:
+        return JSONResponse({"error": BUSY_MESSAGE}, status_code=503)
+
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    profile = profile_requested(request.headers)
+
+    async def generate():
+        with trace_request("/query/stream", request_id, profile):
+            async for event in process_query_stream(user_query, filters):
+                yield f"data: {json.dumps(event)}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
+
+
+@app.post("/query/batch")
+async def query_batch_endpoint(request: Request):
+    """Answer many queries, streaming one JSON line per answer as it completes."""
+    if not check_auth(request):
+        logging.warning(f"Unauthorized access attempt from {request.client.host}")
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        return JSONResponse({"error": NOT_AN_OBJECT_MESSAGE}, status_code=400)
+    try:
+        user_queries = parse_batch_queries(data)
+        filters = normalize_filters(data.get("filters"))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    logging.info(f"Received batch of {len(user_queries)} queries from {request.client.host}")
+
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    profile = profile_requested(request.headers)
+
+    async def generate():
+        with trace_request("/query/batch", request_id, profile):
+            async for result in process_queries(user_queries, filters):
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run(app, host="0.0.0.0", port=port)
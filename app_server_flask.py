@@ -1,14 +1,37 @@
 # lawgpt_server.py
 
-from flask import Flask, request, jsonify
-from typing import Optional
+from flask import Flask, request, jsonify, Response, stream_with_context
+from typing import Optional, List, Dict, Tuple, Iterator
+import json
 import logging
+import numpy as np
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask_cors import CORS
 
-from llm import get_llm_response, LLMError
-from RAG.retrieval import retrieve_relevant_documents, get_document_stats
-from data_processing.preprocess_docs import preprocess_document
-from config import TOP_K_RESULTS
+from llm import get_llm_response, stream_llm_response, LLMError
+from RAG.context import build_context
+from RAG.retrieval import (
+    retrieve_relevant_documents,
+    retrieve_relevant_documents_batch,
+    embed_queries_and_questions,
+    get_document_stats,
+    normalize_filters,
+    filters_key
+)
+from answer_cache import get_answer_cache, normalize_query
+from telemetry import (
+    span,
+    trace_request,
+    new_request_id,
+    profile_requested,
+    record_cache,
+    render_metrics,
+    install_log_filter,
+    METRICS_CONTENT_TYPE
+)
+from data_processing.preprocess_docs import preprocess_document, preprocess_documents
+from config import TOP_K_RESULTS, BATCH_MAX_QUERIES, BATCH_LLM_CONCURRENCY, REQUEST_ID_HEADER, PUBLIC_STATS
 from datetime import datetime
 import os
 
@@ -18,8 +41,13 @@ CORS(app)  # <-- Add this line right after app = Flask(__name__)
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+    format="%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s",
+    force=True  # RAG.retrieval configures logging on import; every line should carry the request ID
 )
+install_log_filter()
+
+# Answers shared by all requests in this worker
+answer_cache = get_answer_cache()
 
 # Simulated token for demonstration
 API_TOKEN = "secret-token-123"
@@ -37,6 +65,10 @@ def check_auth(req):
     print(f"Received Authorization Header: {auth_header}")
     return auth_header == f"Bearer {API_TOKEN}"
 
+def check_stats_auth(req):
+    """Check if request may read the stats and metrics endpoints."""
+    return PUBLIC_STATS or check_auth(req)
+
 def format_response(response: str, sources: list) -> str:
     """Format response with optional source listing."""
     formatted = response.strip()
@@ -47,34 +79,251 @@ def format_response(response: str, sources: list) -> str:
     return formatted
 
 
-def process_query(user_query: str) -> Optional[str]:
+NO_DOCUMENTS_MESSAGE = "I don't have any legal documents loaded yet. Please add some documents first."
+LLM_ERROR_MESSAGE = "I'm having trouble processing your request right now. Please try again later."
+UNEXPECTED_ERROR_MESSAGE = "An unexpected error occurred. Please try again later."
+NOT_AN_OBJECT_MESSAGE = "The request body must be a JSON object."
+
+
+def retrieve_context(
+    processed_query: str,
+    query_embedding: np.ndarray,
+    filters: Optional[Dict] = None
+) -> Tuple[List[str], List[str]]:
+    """Retrieve the chunks for a query and the source lines to cite."""
+    with span('retrieve'):
+        relevant_docs = retrieve_relevant_documents(
+            processed_query,
+            top_k=TOP_K_RESULTS,
+            query_embedding=query_embedding,
+            filters=filters
+        )
+    return context_from_documents(relevant_docs)
+
+
+def context_from_documents(relevant_docs: List[Dict]) -> Tuple[List[str], List[str]]:
+    """Fit retrieved chunks into the LLM context budget and list the sources to cite."""
+    with span('context'):
+        context = build_context(relevant_docs)
+    logging.info(
+        f"Context: {len(context.chunks)} chunks, ~{context.token_count} tokens "
+        f"({context.duplicates} near-duplicates and {context.over_budget} over budget dropped)"
+    )
+    sources = [
+        f"{chunk['metadata']['filename']} (Last modified: {chunk['metadata']['last_modified']})"
+        for chunk in context.chunks
+    ]
+    return context.contents, sources
+
+
+def process_query(user_query: str, filters: Optional[Dict] = None) -> Optional[str]:
+    """
+    Answer a query from the documents.
+
+    ``filters`` (see ``normalize_filters``) restrict retrieval to matching
+    documents, e.g. ``{"jurisdiction": "US", "modified_after": "2024-01-01"}``.
+    """
     try:
         stats = get_document_stats()
         if stats['total_documents'] == 0:
-            return "I don't have any legal documents loaded yet. Please add some documents first."
-
-        processed_query = preprocess_document(user_query)
-
-        relevant_docs = retrieve_relevant_documents(processed_query, top_k=TOP_K_RESULTS)
+            return NO_DOCUMENTS_MESSAGE
 
-        doc_contents = [doc['content'] for doc in relevant_docs] if relevant_docs else []
-        doc_metadata = [doc['metadata'] for doc in relevant_docs] if relevant_docs else []
+        with span('preprocess'):
+            processed_query = preprocess_document(user_query)
+        with span('embed'):
+            # Paraphrases are matched on the question as asked, see AnswerCache
+            (query_embedding,), (question_embedding,) = embed_queries_and_questions(
+                [processed_query], [normalize_query(user_query)]
+            )
+        scope = filters_key(filters)
 
-        response = get_llm_response(user_query, doc_contents)
+        # Repeated and paraphrased questions are answered from the cache
+        with span('answer_cache'):
+            cached = answer_cache.get(user_query, question_embedding, scope)
+        record_cache('answer', cached is not None)
+        if cached is not None:
+            response, sources = cached
+        else:
+            doc_contents, sources = retrieve_context(processed_query, query_embedding, filters)
+            with span('llm'):
+                response = get_llm_response(user_query, doc_contents)
+            answer_cache.put(user_query, response, sources, question_embedding, scope)
 
-        if doc_metadata:
-            sources = [
-                f"{meta['filename']} (Last modified: {meta['last_modified']})"
-                for meta in doc_metadata
-            ]
+        if sources:
             return format_response(response, sources)
 
         return response
 
     except LLMError:
-        return "I'm having trouble processing your request right now. Please try again later."
+        return LLM_ERROR_MESSAGE
     except Exception:
-        return "An unexpected error occurred. Please try again later."
+        return UNEXPECTED_ERROR_MESSAGE
+
+
+def process_query_stream(user_query: str, filters: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Process a query and yield the answer as it is generated.
+
+    Yields ``{"token": ...}`` events while the model writes, then a single
+    ``{"sources": [...]}`` event, or an ``{"error": ...}`` event on failure.
+    """
+    try:
+        stats = get_document_stats()
+        if stats['total_documents'] == 0:
+            yield {"token": NO_DOCUMENTS_MESSAGE}
+            return
+
+        with span('preprocess'):
+            processed_query = preprocess_document(user_query)
+        with span('embed'):
+            # Paraphrases are matched on the question as asked, see AnswerCache
+            (query_embedding,), (question_embedding,) = embed_queries_and_questions(
+                [processed_query], [normalize_query(user_query)]
+            )
+        scope = filters_key(filters)
+
+        with span('answer_cache'):
+            cached = answer_cache.get(user_query, question_embedding, scope)
+        record_cache('answer', cached is not None)
+        if cached is not None:
+            response, sources = cached
+            yield {"token": response}
+        else:
+            doc_contents, sources = retrieve_context(processed_query, query_embedding, filters)
+            tokens = []
+            # Includes the time the client takes to read each token
+            with span('llm'):
+                for token in stream_llm_response(user_query, doc_contents):
+                    tokens.append(token)
+                    yield {"token": token}
+            answer_cache.put(user_query, ''.join(tokens), sources, question_embedding, scope)
+
+        if sources:
+            yield {"sources": sources}
+
+    except LLMError:
+        yield {"error": LLM_ERROR_MESSAGE}
+    except Exception:
+        yield {"error": UNEXPECTED_ERROR_MESSAGE}
+
+def process_queries(user_queries: List[str], filters: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Answer many queries, yielding each result as soon as it is ready.
+
+    The queries are preprocessed and embedded in batches and scored against
+    the index together. Cached answers are yielded first, then the rest are
+    sent to the LLM with at most BATCH_LLM_CONCURRENCY calls in flight.
+
+    Yields:
+        Dict: ``{"index": i, "query": ..., "response": ...}``, or an
+        ``"error"`` instead of ``"response"``, in completion order
+    """
+    def result(i: int, **fields) -> Dict:
+        return {"index": i, "query": user_queries[i], **fields}
+
+    try:
+        stats = get_document_stats()
+        if stats['total_documents'] == 0:
+            for i in range(len(user_queries)):
+                yield result(i, response=NO_DOCUMENTS_MESSAGE)
+            return
+
+        with span('preprocess'):
+            processed_queries = preprocess_documents(user_queries)
+        with span('embed'):
+            # Paraphrases are matched on the questions as asked, see AnswerCache
+            query_embeddings, question_embeddings = embed_queries_and_questions(
+                processed_queries, [normalize_query(query) for query in user_queries]
+            )
+        scope = filters_key(filters)
+
+        pending = []
+        answered = []
+        with span('answer_cache'):
+            for i, user_query in enumerate(user_queries):
+                cached = answer_cache.get(user_query, question_embeddings[i], scope)
+                record_cache('answer', cached is not None)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    answered.append((i, cached))
+        for i, (response, sources) in answered:
+            yield result(i, response=format_response(response, sources) if sources else response)
+        if not pending:
+            return
+
+        with span('retrieve'):
+            retrieved = retrieve_relevant_documents_batch(
+                [processed_queries[i] for i in pending],
+                top_k=TOP_K_RESULTS,
+                query_embeddings=query_embeddings[pending],
+                filters=filters
+            )
+    except Exception:
+        logging.exception("Batch query preparation failed")
+        for i in range(len(user_queries)):
+            yield result(i, error=UNEXPECTED_ERROR_MESSAGE)
+        return
+
+    def answer(i: int, relevant_docs: List[Dict]) -> str:
+        doc_contents, sources = context_from_documents(relevant_docs)
+        with span('llm'):
+            response = get_llm_response(user_queries[i], doc_contents)
+        answer_cache.put(user_queries[i], response, sources, question_embeddings[i], scope)
+        return format_response(response, sources) if sources else response
+
+    executor = ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY)
+    try:
+        # Each call runs in a copy of this context so its spans land in the request's trace
+        futures = {
+            executor.submit(contextvars.copy_context().run, answer, i, relevant_docs): i
+            for i, relevant_docs in zip(pending, retrieved)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                yield result(i, response=future.result())
+            except LLMError:
+                yield result(i, error=LLM_ERROR_MESSAGE)
+            except Exception:
+                yield result(i, error=UNEXPECTED_ERROR_MESSAGE)
+    finally:
+        # A disconnected client should not keep the remaining LLM calls queued
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_batch_queries(data: Dict) -> List[str]:
+    """
+    Validate the ``queries`` field of a batch request.
+
+    Raises:
+        ValueError: If it is not a non-empty list of non-empty strings within BATCH_MAX_QUERIES
+    """
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list of strings.")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries are accepted per batch.")
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("Every query must be a non-empty string.")
+    return [query.strip() for query in queries]
+
+def parse_query_body(data) -> Tuple[str, Optional[Dict]]:
+    """
+    Pull the query and optional filters out of a /query or /query/stream body.
+
+    Returns:
+        Tuple[str, Optional[Dict]]: The stripped query, empty if missing, and the normalized filters
+
+    Raises:
+        ValueError: If the body is not a JSON object, the query is not a string or the filters are invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError(NOT_AN_OBJECT_MESSAGE)
+    user_query = data.get("query") or ""
+    if not isinstance(user_query, str):
+        raise ValueError("query must be a string.")
+    return user_query.strip(), normalize_filters(data.get("filters"))
 
 @app.route("/", methods=["GET"])
 def home():
@@ -84,6 +333,27 @@ def home():
 def favicon():
     return "", 204  # Return an empty response with status code 204 (No Content)
 
+@app.route("/stats", methods=["GET"])
+def stats_endpoint():
+    """Report corpus statistics from the in-memory index."""
+    if not check_stats_auth(request):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(get_document_stats(include_documents=True))
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Report answer cache hits, misses and hit rate."""
+    if not check_stats_auth(request):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(answer_cache.stats())
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Expose request and per-stage latency histograms, token and cache counters for Prometheus."""
+    if not check_stats_auth(request):
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route("/query", methods=["POST"])
 def query_endpoint():
     """Handle queries sent to the /query endpoint."""
@@ -92,15 +362,81 @@ def query_endpoint():
         print(f"Headers received: {request.headers}")  # Debugging
         return jsonify({"error": "Unauthorized"}), 401
 
-    data = request.get_json()
-    user_query = data.get("query", "").strip()
+    try:
+        user_query, filters = parse_query_body(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     logging.info(f"Received query from {request.remote_addr}: {user_query}")
 
     if not user_query:
         return jsonify({"error": "Empty query provided."}), 400
 
-    response = process_query(user_query)
-    return jsonify({"response": response})
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    with trace_request("/query", request_id, profile_requested(request.headers)):
+        response = process_query(user_query, filters)
+    return jsonify({"response": response}), 200, {REQUEST_ID_HEADER: request_id}
+
+@app.route("/query/stream", methods=["POST"])
+def query_stream_endpoint():
+    """Stream the answer to a query as Server-Sent Events."""
+    if not check_auth(request):
+        logging.warning(f"Unauthorized access attempt from {request.remote_addr}")
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        user_query, filters = parse_query_body(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logging.info(f"Received streaming query from {request.remote_addr}: {user_query}")
+
+    if not user_query:
+        return jsonify({"error": "Empty query provided."}), 400
+
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    profile = profile_requested(request.headers)
+
+    def generate():
+        with trace_request("/query/stream", request_id, profile):
+            for event in process_query_stream(user_query, filters):
+                yield f"data: {json.dumps(event)}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
+
+@app.route("/query/batch", methods=["POST"])
+def query_batch_endpoint():
+    """Answer many queries, streaming one JSON line per answer as it completes."""
+    if not check_auth(request):
+        logging.warning(f"Unauthorized access attempt from {request.remote_addr}")
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": NOT_AN_OBJECT_MESSAGE}), 400
+    try:
+        user_queries = parse_batch_queries(data)
+        filters = normalize_filters(data.get("filters"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logging.info(f"Received batch of {len(user_queries)} queries from {request.remote_addr}")
+
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    profile = profile_requested(request.headers)
+
+    def generate():
+        with trace_request("/query/batch", request_id, profile):
+            for result in process_queries(user_queries, filters):
+                yield json.dumps(result) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
 
 # @app.route("/query", methods=["POST"])
 # def query_endpoint():
@@ -0,0 +1,110 @@
+"""
+Compare two benchmark result files written with ``--json``.
+
+Usage: python benchmarks/compare.py BASELINE.json CURRENT.json [--threshold 0.1]
+
+Prints every metric of both runs with its relative change and flags
+regressions: ``_seconds`` metrics that grew or ``_per_second`` and
+``_ratio`` metrics that shrank by more than the threshold (10% by default).
+Exits with status 1 if any metric regressed, so it can gate CI. Timings
+only compare meaningfully between runs on the same machine; the
+environment of both runs is printed when it differs.
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Dict, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 for counts and unknown units."""
+    if metric.endswith("_per_second") or metric.endswith("_ratio"):
+        return 1
+    if metric.endswith("_seconds"):
+        return -1
+    return 0
+
+
+def load_result(path: str) -> Dict:
+    with open(path, 'r') as f:
+        result = json.load(f)
+    if 'metrics' not in result:
+        raise ValueError(f"{path} is not a benchmark result file")
+    return result
+
+
+def change(baseline: float, current: float) -> Optional[float]:
+    if baseline == 0:
+        return None
+    return (current - baseline) / abs(baseline)
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> list:
+    """
+    Diff the metrics of two result records.
+
+    Returns:
+        list: ``(metric, baseline value, current value, relative change, regressed)``
+        for every metric in either record; missing values are None
+    """
+    rows = []
+    names = list(baseline['metrics']) + [name for name in current['metrics'] if name not in baseline['metrics']]
+    for name in names:
+        old = baseline['metrics'].get(name)
+        new = current['metrics'].get(name)
+        relative = change(old, new) if old is not None and new is not None else None
+        regressed = relative is not None and direction(name) * relative < -threshold
+        rows.append((name, old, new, relative, regressed))
+    return rows
+
+
+def format_value(metric: str, value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if metric.endswith("_seconds"):
+        return f"{value * 1000:.3f} ms"
+    if metric.endswith("_count"):
+        return f"{value:.0f}"
+    return f"{value:.2f}"
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv[1:])
+
+    baseline = load_result(args.baseline)
+    current = load_result(args.current)
+    if baseline.get('benchmark') != current.get('benchmark'):
+        print(f"Warning: comparing {baseline.get('benchmark')} against {current.get('benchmark')}")
+    for key in ('commit', 'platform', 'cpu_count'):
+        old = baseline.get('environment', {}).get(key)
+        new = current.get('environment', {}).get(key)
+        if old != new:
+            print(f"{key}: {old} -> {new}")
+    if baseline.get('parameters') != current.get('parameters'):
+        print(f"Parameters differ: {baseline.get('parameters')} -> {current.get('parameters')}")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'metric':42s} {'baseline':>14s} {'current':>14s} {'change':>9s}")
+    for name, old, new, relative, regressed in rows:
+        delta = f"{relative * 100:+.1f}%" if relative is not None else "-"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:42s} {format_value(name, old):>14s} {format_value(name, new):>14s} {delta:>9s}{flag}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,135 @@
+"""
+Synthetic corpus generator for the benchmarks.
+
+Usage: python benchmarks/corpus.py [chunks] [directory] [--words N] [--seed S]
+
+Writes an embedding store with the same layout as data/embeddings
+(vectors, chunk records and BM25 index; see RAG/store.py) holding
+``chunks`` chunks (10,000 by default) to ``directory`` (default
+data/benchmarks/corpus-<chunks>). Chunks are random runs of sentences
+taken from the bundled store, falling back to synthetic statute text, in
+documents of 50 chunks with a rotating ``jurisdiction`` attribute for
+filter benchmarks. Vectors are what the fake model backend computes for
+the chunk text, so the corpus can be served offline with
+
+    MODEL_BACKEND=fake EMBEDDINGS_DIR=<directory> python app_server_flask.py
+
+Generation is linear in the corpus size; 10^6 chunks of the default length
+write about 4 GB of chunk text and 3 GB of vectors.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+from config import DATA_DIR, CHUNK_SIZE, FAKE_BACKEND_EMBEDDING_DIM
+from model_backend import FakeBackend
+from RAG.store import EmbeddingStore, make_record
+from RAG.similarity import normalize_rows
+from benchmarks.preprocess import SYNTHETIC_PARAGRAPH
+
+SOURCE_DIR = os.path.join(DATA_DIR, "embeddings")
+CHUNKS_PER_DOCUMENT = 50
+JURISDICTIONS = ("US", "CA", "UK")
+BLOCK_CHUNKS = 1000
+
+
+def default_directory(chunks: int) -> str:
+    return os.path.join(DATA_DIR, "benchmarks", f"corpus-{chunks}")
+
+
+def load_sentences(source: str = SOURCE_DIR) -> list:
+    """Split the chunks of the bundled store into sentences, or fall back to synthetic text."""
+    texts = []
+    store = EmbeddingStore(source)
+    if store.exists():
+        _, records, _ = store.load()
+        texts = [record['content'] for record in records]
+    if not texts:
+        texts = [SYNTHETIC_PARAGRAPH]
+    sentences = [s.strip() for text in texts for s in re.split(r'(?<=[.;:])\s+', text)]
+    # Deduplicated and sorted so the same seed gives the same corpus
+    return sorted({s for s in sentences if len(s.split()) >= 3})
+
+
+def sample_queries(texts: list, count: int, seed: int = 0, words: int = 8) -> list:
+    """Make ``count`` queries from runs of ``words`` words of random texts, as users quote their documents."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(0, len(texts), count):
+        tokens = texts[i].split()
+        start = int(rng.integers(0, max(1, len(tokens) - words)))
+        queries.append(' '.join(tokens[start:start + words]))
+    return queries
+
+
+def generate_corpus(chunks: int, directory: str, words: int = CHUNK_SIZE, seed: int = 0) -> None:
+    """
+    Write a synthetic embedding store of ``chunks`` chunks.
+
+    Args:
+        chunks (int): Number of chunks to generate
+        directory (str): Store directory, created if needed
+        words (int): Approximate words per chunk
+        seed (int): Random seed; the same seed gives the same corpus
+    """
+    rng = np.random.default_rng(seed)
+    sentences = load_sentences()
+    backend = FakeBackend(dimension=FAKE_BACKEND_EMBEDDING_DIM)
+    # Fake embeddings sum one signed bucket per word, so a chunk's vector is
+    # the sum of its sentences' vectors and each sentence is hashed once
+    sentence_vectors = np.vstack([backend.hash_embedding(sentence) for sentence in sentences])
+    mean_words = np.mean([len(sentence.split()) for sentence in sentences])
+    per_chunk = max(1, int(round(words / mean_words)))
+
+    os.makedirs(directory, exist_ok=True)
+    scratch = os.path.join(directory, "vectors.tmp.npy")
+    # Built on disk so 10^6 chunks do not need the whole matrix in RAM
+    matrix = np.lib.format.open_memmap(
+        scratch, mode='w+', dtype=np.float32, shape=(chunks, FAKE_BACKEND_EMBEDDING_DIM)
+    )
+    records = []
+    for start in range(0, chunks, BLOCK_CHUNKS):
+        count = min(BLOCK_CHUNKS, chunks - start)
+        picks = rng.integers(0, len(sentences), size=(count, per_chunk))
+        matrix[start:start + count] = normalize_rows(sentence_vectors[picks].sum(axis=1))
+        for offset, row in enumerate(picks.tolist()):
+            number = start + offset
+            document = number // CHUNKS_PER_DOCUMENT
+            records.append(make_record(
+                f"synthetic-{document:06d}.txt",
+                number % CHUNKS_PER_DOCUMENT,
+                ' '.join(sentences[i] for i in row),
+                attributes={'jurisdiction': JURISDICTIONS[document % len(JURISDICTIONS)]}
+            ))
+
+    matrix.flush()
+    EmbeddingStore(directory).write(matrix, records)
+    del matrix
+    os.remove(scratch)
+
+
+def main(argv: list) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic embedding store for benchmarks.")
+    parser.add_argument("chunks", type=int, nargs="?", default=10000)
+    parser.add_argument("directory", nargs="?")
+    parser.add_argument("--words", type=int, default=CHUNK_SIZE, help="approximate words per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv[1:])
+    directory = args.directory or default_directory(args.chunks)
+
+    start = time.perf_counter()
+    generate_corpus(args.chunks, directory, args.words, args.seed)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"Wrote {args.chunks} chunks to {directory} in {elapsed:.1f}s ({size / 2 ** 20:.1f} MB)")
+    print(f"Serve it with: MODEL_BACKEND=fake EMBEDDINGS_DIR={directory} python app_server_flask.py")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,279 @@
+"""
+Concurrent load generator for the /query endpoint.
+
+Usage: python benchmarks/load_test.py [--url URL] [--server flask|async] [--corpus DIR]
+                                      [--concurrency N] [--requests N | --duration S]
+                                      [--distinct N] [--fake-latency S] [--json PATH]
+
+Without ``--url`` a server is started on a free local port with the fake
+model backend (``--fake-latency`` and ``--fake-tokens-per-second`` set
+the simulated model time) serving ``--corpus`` (default EMBEDDINGS_DIR), and
+stopped afterwards. Queries are quoted from the corpus chunks; ``--distinct``
+cycles a smaller pool so repeats exercise the answer cache.
+
+Each of ``--concurrency`` clients sends its next query as soon as the last
+one is answered (a closed loop), so the reported QPS is what the server
+sustains at that concurrency. Reports p50/p95/p99 latency of successful
+requests, QPS, errors, the answer cache hit ratio and the server's mean
+time per pipeline stage, both read from /metrics.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.results import latency_metrics, write_results
+
+API_TOKEN = "secret-token-123"
+READY_TIMEOUT = 120  # Seconds to wait for a started server to answer
+
+# Run with ``python -c`` so the fake backend's timing can be set before the
+# server module builds its clients; argv is [-c, server, port, latency, tokens/s]
+SERVER_SCRIPT = """
+import sys
+from model_backend import FakeBackend, set_backend
+set_backend(FakeBackend(latency=float(sys.argv[3]), tokens_per_second=float(sys.argv[4])))
+port = int(sys.argv[2])
+if sys.argv[1] == "async":
+    import uvicorn
+    import app_server_async
+    uvicorn.run(app_server_async.app, host="127.0.0.1", port=port, log_level="warning")
+else:
+    import app_server_flask
+    app_server_flask.app.run(host="127.0.0.1", port=port, threaded=True)
+"""
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, corpus: str, latency: float, tokens_per_second: float, log_path: str):
+    """Start a server with the fake backend and return (process, base URL)."""
+    port = free_port()
+    env = dict(os.environ, MODEL_BACKEND="fake", EMBEDDINGS_DIR=corpus)
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SCRIPT, kind, str(port), str(latency), str(tokens_per_second)],
+        cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    return process, f"http://127.0.0.1:{port}"
+
+
+def request(url: str, method: str = "GET", path: str = "/", body: dict = None, timeout: float = 60):
+    """Send one request on a fresh connection and return (status, body bytes)."""
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+    try:
+        # /metrics needs the token too unless the server sets PUBLIC_STATS
+        headers = {"Authorization": f"Bearer {API_TOKEN}"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers["Content-Type"] = "application/json"
+        connection.request(method, parts.path.rstrip('/') + path, body=payload, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def wait_until_ready(url: str, process=None) -> None:
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if request(url, timeout=5)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not answer within {READY_TIMEOUT}s")
+
+
+def scrape_metrics(url: str) -> dict:
+    """Read /metrics into {(name, ((label, value), ...)): value}; empty if the server has none."""
+    try:
+        status, body = request(url, path="/metrics")
+    except OSError:
+        return {}
+    if status != 200:
+        return {}
+    samples = {}
+    for line in body.decode('utf-8').splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            labels = tuple(sorted(_LABEL.findall(match.group(2))))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+def server_metrics(before: dict, after: dict) -> dict:
+    """Answer cache hit ratio and mean seconds per /query stage over the run."""
+    delta = {key: value - before.get(key, 0.0) for key, value in after.items()}
+    metrics = {}
+    hits = delta.get(('lawgpt_cache_lookups_total', (('cache', 'answer'), ('result', 'hit'))), 0.0)
+    misses = delta.get(('lawgpt_cache_lookups_total', (('cache', 'answer'), ('result', 'miss'))), 0.0)
+    if hits + misses:
+        metrics["answer_cache_hit_ratio"] = hits / (hits + misses)
+    for (name, labels), total in sorted(delta.items()):
+        labels = dict(labels)
+        if name != 'lawgpt_stage_duration_seconds_sum' or labels.get('endpoint') != '/query':
+            continue
+        count = delta.get(('lawgpt_stage_duration_seconds_count', tuple(sorted(labels.items()))), 0.0)
+        if count:
+            metrics[f"stage_{labels['stage']}_mean_seconds"] = total / count
+    return metrics
+
+
+def run_load(url: str, queries: list, concurrency: int, total: int = None, duration: float = None) -> dict:
+    """
+    Drive /query from ``concurrency`` closed-loop clients.
+
+    Args:
+        url (str): Server base URL
+        queries (list): Queries, sent in order and cycled
+        concurrency (int): Number of concurrent clients
+        total (int): Stop after this many requests
+        duration (float): Or stop after this many seconds
+
+    Returns:
+        dict: ``latencies`` of successful requests, ``errors`` and ``elapsed`` seconds
+    """
+    lock = threading.Lock()
+    next_request = [0]
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration if duration else None
+
+    def client() -> None:
+        while True:
+            with lock:
+                i = next_request[0]
+                if (total is not None and i >= total) or (deadline is not None and time.monotonic() >= deadline):
+                    return
+                next_request[0] += 1
+            start = time.perf_counter()
+            try:
+                status, _ = request(url, "POST", "/query", {"query": queries[i % len(queries)]})
+                error = None if status == 200 else f"HTTP {status}"
+            except (OSError, http.client.HTTPException) as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if error is None:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(error)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'latencies': latencies, 'errors': errors, 'elapsed': time.perf_counter() - start}
+
+
+def main(argv: list) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the /query endpoint.")
+    parser.add_argument("--url", help="server to test; by default one is started with the fake backend")
+    parser.add_argument("--server", choices=("flask", "async"), default="flask", help="server to start")
+    parser.add_argument("--corpus", help="store to serve and quote queries from (default EMBEDDINGS_DIR)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests to send")
+    parser.add_argument("--duration", type=float, help="send requests for this many seconds instead")
+    parser.add_argument("--distinct", type=int, default=0, help="cycle this many distinct queries (0: all distinct)")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests sent first")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument("--fake-tokens-per-second", type=float, default=0.0, help="simulated streaming rate")
+    parser.add_argument("--json", help="write results to this file, '-' for stdout")
+    args = parser.parse_args(argv[1:])
+
+    if args.corpus:
+        os.environ["EMBEDDINGS_DIR"] = os.path.abspath(args.corpus)
+    # config reads EMBEDDINGS_DIR on import
+    from config import EMBEDDINGS_DIR, DATA_DIR
+    from RAG.store import EmbeddingStore
+    from benchmarks.corpus import sample_queries
+
+    _, records, _ = EmbeddingStore(EMBEDDINGS_DIR).load()
+    pool = args.distinct or args.requests or 10000
+    queries = sample_queries([record['content'] for record in records], pool + args.warmup, seed=1)
+    warmup, queries = queries[:args.warmup], queries[args.warmup:]
+
+    process = None
+    url = args.url
+    if url is None:
+        log_path = os.path.join(DATA_DIR, "benchmarks", "load_test_server.log")
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        process, url = start_server(
+            args.server, EMBEDDINGS_DIR, args.fake_latency, args.fake_tokens_per_second, log_path
+        )
+        print(f"Started {args.server} server at {url} (log: {log_path})")
+    try:
+        wait_until_ready(url, process)
+        # Loads the index and models before timing starts
+        for query in warmup:
+            request(url, "POST", "/query", {"query": query})
+        before = scrape_metrics(url)
+        result = run_load(url, queries, args.concurrency, None if args.duration else args.requests, args.duration)
+        after = scrape_metrics(url)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    latencies = result['latencies']
+    metrics = {
+        "requests_count": len(latencies) + len(result['errors']),
+        "errors_count": len(result['errors']),
+        "queries_per_second": len(latencies) / result['elapsed']
+    }
+    metrics.update(latency_metrics("query", latencies))
+    metrics.update(server_metrics(before, after))
+
+    print(
+        f"{metrics['requests_count']} requests from {args.concurrency} clients in {result['elapsed']:.1f}s "
+        f"({len(queries)} distinct queries), {metrics['errors_count']} errors:"
+    )
+    for name, value in metrics.items():
+        if name.endswith("_seconds"):
+            print(f"  {name:42s} {value * 1000:10.3f} ms")
+        elif not name.endswith("_count"):
+            print(f"  {name:42s} {value:10.2f}")
+    if result['errors']:
+        print(f"  first errors: {', '.join(sorted(set(result['errors']))[:5])}")
+    write_results(
+        args.json,
+        "load_test",
+        {
+            'url': args.url, 'server': None if args.url else args.server, 'corpus': EMBEDDINGS_DIR,
+            'chunks': len(records), 'concurrency': args.concurrency, 'requests': args.requests,
+            'duration': args.duration, 'distinct': len(queries),
+            'fake_latency': args.fake_latency, 'fake_tokens_per_second': args.fake_tokens_per_second
+        },
+        metrics
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
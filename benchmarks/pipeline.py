@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks for the stages of the RAG pipeline.
+
+Usage: python benchmarks/pipeline.py [--corpus DIR] [--queries N] [--runs N] [--json PATH]
+
+Times, with the fake model backend so no model server is involved:
+  - preprocess_document on a user query and on a 1 MB document
+  - split_into_chunks on the preprocessed document
+  - retrieve_relevant_documents over the store in ``--corpus`` (default
+    EMBEDDINGS_DIR; generate a large one with benchmarks/corpus.py), per
+    query with the query embedding precomputed, unfiltered and filtered
+    to one jurisdiction
+  - ingestion of 20 text documents: chunking, embedding and writing a store
+
+Per-query latencies are reported as p50/p95/p99. ``--json`` writes the
+metrics in the format read by benchmarks/compare.py.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def time_each(func, items: list) -> list:
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(argv: list) -> None:
+    parser = argparse.ArgumentParser(description="Time the stages of the RAG pipeline.")
+    parser.add_argument("--corpus", help="embedding store to retrieve from (default EMBEDDINGS_DIR)")
+    parser.add_argument("--queries", type=int, default=200, help="queries timed per retrieval benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="repetitions of the whole-document benchmarks")
+    parser.add_argument("--json", help="write results to this file, '-' for stdout")
+    args = parser.parse_args(argv[1:])
+
+    # config reads these on import
+    if args.corpus:
+        os.environ["EMBEDDINGS_DIR"] = os.path.abspath(args.corpus)
+    os.environ["MODEL_BACKEND"] = "fake"
+
+    import numpy as np
+    from config import EMBEDDINGS_DIR
+    from model_backend import FakeBackend, set_backend
+    from data_processing.preprocess_docs import preprocess_document, split_into_chunks
+    from data_processing.generate_embeddings import chunk_document, embed_records
+    from RAG.retrieval import retrieve_relevant_documents, embed_queries
+    from RAG.store import EmbeddingStore
+    from benchmarks.corpus import load_sentences, sample_queries
+    from benchmarks.preprocess import build_document
+    from benchmarks.results import best_of, latency_metrics, write_results
+
+    # Instant answers and embeddings: only the pipeline's own work is timed
+    set_backend(FakeBackend(latency=0, tokens_per_second=0))
+    metrics = {}
+
+    _, records, info = EmbeddingStore(EMBEDDINGS_DIR).load()
+    texts = [record['content'] for record in records]
+    queries = sample_queries(texts, args.queries)
+
+    preprocess_document(queries[0])  # Loads the stopword list
+    latencies = time_each(preprocess_document, queries)
+    metrics.update(latency_metrics("preprocess_query", latencies))
+
+    document = build_document(1.0)
+    megabytes = len(document) / 2 ** 20
+    elapsed = best_of(lambda: preprocess_document(document), args.runs)
+    metrics["preprocess_document_megabytes_per_second"] = megabytes / elapsed
+    processed = preprocess_document(document)
+    elapsed = best_of(lambda: split_into_chunks(processed), args.runs)
+    metrics["split_into_chunks_megabytes_per_second"] = len(processed) / 2 ** 20 / elapsed
+
+    processed_queries = [preprocess_document(query) for query in queries]
+    embeddings = embed_queries(processed_queries)
+    retrieve_relevant_documents(processed_queries[0], query_embedding=embeddings[0])  # Loads the index
+    pairs = list(zip(processed_queries, embeddings))
+    latencies = time_each(lambda pair: retrieve_relevant_documents(pair[0], query_embedding=pair[1]), pairs)
+    metrics.update(latency_metrics("retrieve", latencies))
+    filters = {'jurisdiction': ['US']}
+    latencies = time_each(
+        lambda pair: retrieve_relevant_documents(pair[0], query_embedding=pair[1], filters=filters), pairs
+    )
+    metrics.update(latency_metrics("retrieve_filtered", latencies))
+
+    sentences = load_sentences()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(20):
+            path = os.path.join(directory, f"document-{i:02d}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(sentences[j] for j in rng.integers(0, len(sentences), 2000)))
+            paths.append(path)
+        start = time.perf_counter()
+        ingested = [record for path in paths for record in chunk_document(path) or []]
+        EmbeddingStore(os.path.join(directory, "store")).write(embed_records(ingested), ingested)
+        elapsed = time.perf_counter() - start
+    metrics["ingest_chunks_per_second"] = len(ingested) / elapsed
+
+    print(f"Pipeline stages over {info.get('rows', len(records))} chunks in {EMBEDDINGS_DIR}:")
+    for name, value in metrics.items():
+        if name.endswith("_seconds"):
+            print(f"  {name:42s} {value * 1000:10.3f} ms")
+        else:
+            print(f"  {name:42s} {value:10.1f}")
+    write_results(
+        args.json,
+        "pipeline",
+        {'corpus': EMBEDDINGS_DIR, 'chunks': len(records), 'queries': args.queries, 'runs': args.runs},
+        metrics
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
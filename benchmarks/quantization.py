@@ -0,0 +1,82 @@
+"""
+Memory and recall benchmark for RAG.quantization.
+
+Usage: python benchmarks/quantization.py [rows] [queries] [runs]
+
+Builds int8 and product-quantization codes over a clustered random
+unit-length matrix (100,000 rows of 768 dimensions and 100 queries by
+default; real chunk embeddings are clustered by topic, unlike uniform
+noise) and reports code size against the float32 matrix, build time,
+per-query latency, and recall@k against exact search both on the codes
+alone and after re-ranking RERANK_CANDIDATES rows with exact vectors.
+"""
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+from config import TOP_K_RESULTS, RERANK_CANDIDATES
+from RAG.quantization import build_quantizer, quantized_search
+from RAG.similarity import normalize_rows, similarity, top_k_rows, top_k_similar
+
+DIMENSION = 768
+TOPICS = 1000
+
+
+def best_of(func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def recall(rows: list, exact: np.ndarray) -> float:
+    hits = [len(set(found.tolist()) & set(expected.tolist())) for found, expected in zip(rows, exact)]
+    return sum(hits) / exact.size
+
+
+def main(argv: list) -> None:
+    n_rows = int(argv[1]) if len(argv) > 1 else 100000
+    n_queries = int(argv[2]) if len(argv) > 2 else 100
+    runs = int(argv[3]) if len(argv) > 3 else 3
+    rng = np.random.default_rng(0)
+    topics = normalize_rows(rng.normal(size=(TOPICS, DIMENSION)).astype(np.float32))
+    matrix = np.empty((n_rows, DIMENSION), dtype=np.float32)
+    for start in range(0, n_rows, 10000):
+        count = min(10000, n_rows - start)
+        noise = rng.normal(scale=0.04, size=(count, DIMENSION)).astype(np.float32)
+        matrix[start:start + count] = normalize_rows(topics[rng.integers(0, TOPICS, count)] + noise)
+    # Queries near existing rows, as real queries land near relevant chunks
+    noise = rng.normal(scale=0.03, size=(n_queries, DIMENSION)).astype(np.float32)
+    queries = normalize_rows(matrix[rng.integers(0, n_rows, n_queries)] + noise)
+    exact, _ = top_k_similar(queries, matrix, TOP_K_RESULTS)
+
+    exact_time = best_of(lambda: [top_k_rows(similarity(query, matrix), TOP_K_RESULTS) for query in queries], runs)
+    print(f"{n_queries} queries x {n_rows} rows x {DIMENSION} dims, best of {runs} runs:")
+    print(
+        f"  float32 exact  {matrix.nbytes / 2 ** 20:8.1f} MB  {'':16s}"
+        f"{exact_time / n_queries * 1000:7.2f} ms/query"
+    )
+    for kind in ('int8', 'pq'):
+        start = time.perf_counter()
+        quantizer = build_quantizer(matrix, kind)
+        build_time = time.perf_counter() - start
+
+        codes_only = [top_k_rows(quantizer.scores(query), TOP_K_RESULTS) for query in queries]
+        reranked = [quantized_search(quantizer, matrix, query, TOP_K_RESULTS)[0] for query in queries]
+        elapsed = best_of(lambda: [quantized_search(quantizer, matrix, query, TOP_K_RESULTS) for query in queries], runs)
+        print(
+            f"  {kind:5s} codes    {quantizer.nbytes / 2 ** 20:8.1f} MB  {matrix.nbytes / quantizer.nbytes:5.1f}x smaller  "
+            f"{elapsed / n_queries * 1000:7.2f} ms/query  build {build_time:6.1f}s  "
+            f"recall@{TOP_K_RESULTS} codes only {recall(codes_only, exact):.3f}, "
+            f"re-ranked top {RERANK_CANDIDATES} {recall(reranked, exact):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
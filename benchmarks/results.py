@@ -0,0 +1,88 @@
+"""
+Shared helpers for the benchmark scripts: latency percentiles and
+machine-readable result files.
+
+A result file is one JSON object:
+    {"benchmark": ..., "timestamp": ..., "environment": {...},
+     "parameters": {...}, "metrics": {"name": value, ...}}
+Metric names end in their unit: ``_seconds`` (lower is better),
+``_per_second`` (higher is better), ``_ratio`` or ``_count``.
+benchmarks/compare.py diffs two such files.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from typing import Dict, List, Optional
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_of(func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def latency_metrics(prefix: str, latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99, mean and max of a list of latencies in seconds."""
+    if not latencies:
+        return {}
+    samples = np.asarray(latencies, dtype=np.float64)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        f"{prefix}_p50_seconds": float(p50),
+        f"{prefix}_p95_seconds": float(p95),
+        f"{prefix}_p99_seconds": float(p99),
+        f"{prefix}_mean_seconds": float(samples.mean()),
+        f"{prefix}_max_seconds": float(samples.max())
+    }
+
+
+def environment() -> Dict:
+    """Describe the machine and code a result was measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def write_results(path: Optional[str], benchmark: str, parameters: Dict, metrics: Dict) -> Dict:
+    """
+    Build a result record and write it to ``path`` ("-" for stdout, None to skip).
+
+    Returns:
+        Dict: The result record
+    """
+    result = {
+        'benchmark': benchmark,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment(),
+        'parameters': parameters,
+        'metrics': metrics
+    }
+    if path == '-':
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif path:
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {path}")
+    return result
@@ -0,0 +1,71 @@
+"""
+Scaling benchmark for RAG.sharding.
+
+Usage: python benchmarks/sharding.py [rows] [queries] [runs]
+
+Times exact top-k search of single queries over a random unit-length
+matrix (1,000,000 rows of 768 dimensions and 50 queries by default, about
+3 GB) split into 1, 2, 4, ... shards up to the number of CPUs, and checks
+that every shard count returns the rows of unsharded search. Sharded
+search limits BLAS to one thread when ``threadpoolctl`` is installed;
+otherwise run with OPENBLAS_NUM_THREADS=1 (or the equivalent for your BLAS)
+so each shard uses one core.
+"""
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+from config import TOP_K_RESULTS
+from RAG.sharding import ShardedSearch
+from RAG.similarity import normalize_rows
+
+DIMENSION = 768
+
+
+def best_of(func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv: list) -> None:
+    n_rows = int(argv[1]) if len(argv) > 1 else 1000000
+    n_queries = int(argv[2]) if len(argv) > 2 else 50
+    runs = int(argv[3]) if len(argv) > 3 else 3
+    rng = np.random.default_rng(0)
+    matrix = np.empty((n_rows, DIMENSION), dtype=np.float32)
+    for start in range(0, n_rows, 10000):
+        count = min(10000, n_rows - start)
+        matrix[start:start + count] = normalize_rows(rng.normal(size=(count, DIMENSION)).astype(np.float32))
+    queries = normalize_rows(rng.normal(size=(n_queries, DIMENSION)).astype(np.float32))
+
+    counts = [1]
+    while counts[-1] * 2 <= max(os.cpu_count() or 1, 4):
+        counts.append(counts[-1] * 2)
+    print(f"{n_queries} queries x {n_rows} rows x {DIMENSION} dims on {os.cpu_count()} CPUs, best of {runs} runs:")
+    expected = None
+    baseline = None
+    for shards in counts:
+        sharding = ShardedSearch(shards, min_rows=1)
+        found = [sharding.search(matrix, query, TOP_K_RESULTS)[0] for query in queries]
+        if expected is None:
+            expected = found
+        same = all(np.array_equal(a, b) for a, b in zip(found, expected))
+        elapsed = best_of(lambda: [sharding.search(matrix, query, TOP_K_RESULTS) for query in queries], runs)
+        sharding.close()
+        baseline = baseline or elapsed
+        print(
+            f"  {shards:3d} shards  {elapsed / n_queries * 1000:8.2f} ms/query  "
+            f"{baseline / elapsed:5.2f}x  {'same rows' if same else 'ROWS DIFFER'}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
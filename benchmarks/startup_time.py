@@ -0,0 +1,46 @@
+"""
+Measure the cold import time of a module in fresh interpreter processes.
+
+Usage: python benchmarks/startup_time.py [module] [runs]
+
+Defaults to app_server_flask, the module every gunicorn worker imports on
+boot. Run it before and after a change to compare startup cost.
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str, runs: int = 5) -> list:
+    """Import ``module`` in ``runs`` fresh processes and return the wall times in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", f"import {module}"],
+            cwd=PROJECT_ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv: list) -> None:
+    module = argv[1] if len(argv) > 1 else "app_server_flask"
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    # Interpreter start-up alone, to separate it from the module's own cost
+    baseline = statistics.median(measure_import("sys", runs))
+    timings = measure_import(module, runs)
+    print(f"python -c 'import {module}' over {runs} runs:")
+    print(f"  median {statistics.median(timings):.3f}s  min {min(timings):.3f}s  max {max(timings):.3f}s")
+    print(f"  bare interpreter {baseline:.3f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
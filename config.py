@@ -4,7 +4,7 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DOCUMENTS_DIR = os.path.join(DATA_DIR, "documents")
-EMBEDDINGS_DIR = os.path.join(DATA_DIR, "embeddings")
+EMBEDDINGS_DIR = os.environ.get("EMBEDDINGS_DIR", os.path.join(DATA_DIR, "embeddings"))  # Override to serve another store, e.g. a benchmark corpus
 
 # BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -15,13 +15,73 @@ EMBEDDINGS_DIR = os.path.join(DATA_DIR, "embeddings")
 LLM_MODEL = "llama3.2"
 # LLM_MODEL = "mistral"
 EMBEDDING_MODEL = "nomic-embed-text"
+EMBEDDING_BATCH_SIZE = 32  # Chunks sent per embedding request
+EMBEDDING_CONCURRENCY = 4  # Embedding requests in flight at once during ingestion
+EMBEDDING_CACHE_ENABLED = True  # Persistent embedding cache shared by all processes
+EMBEDDING_CACHE_PATH = os.path.join(DATA_DIR, "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = 200000  # Least recently used entries are evicted beyond this
+EMBEDDING_CACHE_TOUCH_INTERVAL = 3600  # Seconds before a hit refreshes an entry's last use; eviction needs only coarse recency
 
 # RAG settings
 CHUNK_SIZE = 500  # Reduced chunk size for more granular retrieval
+CHUNK_OVERLAP = 50  # Tokens repeated at the start of the next chunk
 TOP_K_RESULTS = 5  # Increased number of results
 SIMILARITY_THRESHOLD = 0.5  # Lowered threshold to get more matches
 MAX_RETRIES = 3
 
+# Model backend client
+BACKEND_CONNECT_TIMEOUT = 5.0  # Seconds to connect to the model server
+BACKEND_READ_TIMEOUT = 120.0  # Seconds to wait for data from the model server
+BACKEND_MAX_CONNECTIONS = 32  # Pooled keep-alive connections per client
+RETRY_BACKOFF_BASE = 0.5  # Upper bound of the first retry delay in seconds, doubled per attempt
+RETRY_BACKOFF_MAX = 8.0  # Longest retry delay in seconds
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive backend failures that open the circuit
+CIRCUIT_RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before a trial request
+
+# Model backend selection
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "ollama")  # "ollama", or "fake" to run without a model server
+FAKE_BACKEND_LATENCY = 0.05  # Seconds before the fake backend's first token or embedding batch
+FAKE_BACKEND_TOKENS_PER_SECOND = 40.0  # Fake answer generation rate, 0 for instant answers
+FAKE_BACKEND_RESPONSE_TOKENS = 64  # Tokens in every fake answer
+FAKE_BACKEND_EMBEDDING_DIM = 768  # Same as nomic-embed-text
+
+# Approximate nearest-neighbour search
+RETRIEVAL_INDEX = "exact"  # "exact", "ivf" (pure NumPy) or "hnsw" (needs hnswlib)
+ANN_MIN_CHUNKS = 10000  # Below this many chunks exact search is used anyway
+IVF_NLIST = 0  # Number of IVF cells, 0 picks about 4 * sqrt(chunk count)
+IVF_NPROBE = 16  # Cells scanned per query, higher means better recall but slower
+IVF_TRAIN_ITERATIONS = 10
+HNSW_M = 16  # Graph degree
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # Candidate list size per query, higher means better recall but slower
+SIMILARITY_BLOCK_ROWS = 65536  # Matrix rows scored at a time when the matrix is large, quantized or memory-mapped
+
+# Quantized embedding codes
+QUANTIZATION = "none"  # "none", "int8" (4x smaller) or "pq" (product quantization, about 30x smaller)
+PQ_SUBVECTORS = 96  # Slices per vector, one byte of code each
+PQ_CENTROIDS = 256  # Codebook size per slice, at most 256
+PQ_TRAIN_ITERATIONS = 10
+PQ_TRAIN_SAMPLE = 10000  # Rows sampled to train the codebooks, about 40 per centroid
+RERANK_CANDIDATES = 100  # Best rows by code rescored with the exact vectors
+
+# Index sharding
+INDEX_SHARDS = int(os.environ.get("INDEX_SHARDS", 1))  # Threads scanning row ranges of the matrix per exact search, 1 disables; keep server workers x shards <= cores
+SHARD_MIN_ROWS = 10000  # Rows per shard at least; smaller indexes are split into fewer shards
+
+# Hybrid lexical + vector retrieval
+RETRIEVAL_MODE = "hybrid"  # "dense", "lexical" or "hybrid" (BM25 and vector rankings fused)
+BM25_K1 = 1.5  # Term frequency saturation
+BM25_B = 0.75  # Document length normalization
+RRF_K = 60  # Rank offset in reciprocal rank fusion
+HYBRID_CANDIDATES = 100  # Results taken from each ranking before fusion
+LEXICAL_PREFILTER = 5000  # On larger corpora only this many BM25 candidates get vector scores, 0 disables
+LEXICAL_MIN_COVERAGE = 0.5  # Chunks holding this share of the query's IDF-weighted terms are kept below SIMILARITY_THRESHOLD, above 1 disables
+
+# Context assembly
+CONTEXT_TOKEN_BUDGET = 3000  # Estimated tokens of retrieved text per prompt, 0 disables the limit
+MMR_LAMBDA = 0.7  # Relevance vs. diversity when picking chunks, 1.0 ranks by relevance alone
+CONTEXT_DUPLICATE_SIMILARITY = 0.92  # Chunks this similar to an already picked chunk are dropped
+
 # LLM Prompt Template
 LLM_PROMPT_TEMPLATE = """You are a legal assistant chatbot. Your task is to answer questions based on the provided context.
 
@@ -51,6 +111,37 @@ Follow these guidelines:
 5. Always maintain a professional tone
 """
 
+# Answer cache settings
+ANSWER_CACHE_SIZE = 1000  # Maximum cached answers per process (LRU eviction)
+ANSWER_CACHE_TTL = 3600  # Seconds before a cached answer expires
+ANSWER_CACHE_SIMILARITY = 0.95  # Paraphrases at or above this query similarity share an answer, None disables
+
+# Batch query settings
+BATCH_MAX_QUERIES = 5000  # Largest /query/batch request accepted
+BATCH_LLM_CONCURRENCY = 4  # LLM calls in flight per batch request
+BATCH_SCORE_BLOCK = 256  # Queries scored against the index per matrix-matrix product
+
+# Async server settings (app_server_async.py)
+LLM_MAX_CONCURRENCY = 4  # Requests sent to the model backend at once per process
+LLM_MAX_QUEUE = 256  # Requests allowed to wait for the backend before new ones get 503
+
+# Request telemetry
+REQUEST_ID_HEADER = "X-Request-ID"  # Taken from the client when present, echoed on every response
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Histogram upper bounds in seconds
+PROFILE_REQUESTS = "off"  # "off", "header" (requests sending PROFILE_HEADER: 1) or "all"
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")  # One <request id>.prof cProfile dump per profiled request
+PUBLIC_STATS = os.environ.get("PUBLIC_STATS", "0") == "1"  # Serve /stats, /cache/stats and /metrics without the bearer token
+
+# Ingestion settings
+INGEST_WORKERS = 0  # Processes used to parse documents, 0 uses every CPU core
+PDF_PAGES_PER_TASK = 100  # Larger PDFs are split into page ranges parsed in parallel
+DOCUMENT_ATTRIBUTES_FILE = os.path.join(DOCUMENTS_DIR, "attributes.json")  # Optional {filename: {"jurisdiction": ...}} used by retrieval filters
+
+# Text processing settings
+NLTK_DATA_DIR = os.path.join(DATA_DIR, "nltk_data")  # Searched first and used as the download target
+NLTK_ALLOW_DOWNLOAD = os.environ.get("NLTK_ALLOW_DOWNLOAD", "0") == "1"  # Lets the ingestion CLI fetch missing NLTK data; serving never downloads
+
 # File extensions
 SUPPORTED_DOCUMENT_TYPES = ('.txt', '.pdf', '.doc', '.docx')
 
@@ -1,6 +1,7 @@
 import os
-import json
 import sys
+import time
+import numpy as np
 from pathlib import Path
 
 # Add the project root directory to Python path
@@ -13,11 +14,26 @@ from config import (
     DOCUMENTS_DIR,
     EMBEDDINGS_DIR,
     SUPPORTED_DOCUMENT_TYPES,
-    CHUNK_SIZE
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    INGEST_WORKERS,
+    PDF_PAGES_PER_TASK
 )
-from RAG.embedding import get_embedding, get_embedding_stats
-from data_processing.preprocess_docs import preprocess_document, split_into_chunks
-from typing import Optional
+from RAG.embedding import embed_texts, get_embedding_stats
+from model_backend import get_backend
+from RAG.store import EmbeddingStore, make_record, chunk_hash
+from data_processing.preprocess_docs import get_preprocessor, iter_chunks, download_nltk_data
+from data_processing.manifest import (
+    load_manifest,
+    save_manifest,
+    document_entry,
+    unchanged_entry,
+    file_sha256,
+    load_document_attributes
+)
+from typing import Optional, List, Dict, Tuple, Iterator, Iterable
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # def read_text_file(file_path: str) -> str:
 #     with open(file_path, 'r', encoding='utf-8') as file:
@@ -27,6 +43,17 @@ def read_txt_file(file_path: str) -> str:
     with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
         return f.read()
 
+def iter_txt_file(file_path: str, lines_per_block: int = 1000) -> Iterator[str]:
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        block = []
+        for line in f:
+            block.append(line)
+            if len(block) >= lines_per_block:
+                yield "".join(block)
+                block = []
+        if block:
+            yield "".join(block)
+
 # def read_pdf_file(file_path: str) -> str:
 #     text = ""
 #     with open(file_path, 'rb') as file:
@@ -35,17 +62,29 @@ def read_txt_file(file_path: str) -> str:
 #             text += page.extract_text()
 #     return text
 
-def read_pdf_file(file_path: str) -> str:
+def _import_pypdf2():
     try:
         import PyPDF2
     except ImportError:
         raise ImportError("PyPDF2 is required to read PDF files. Please install it with 'pip install PyPDF2'.")
-    text = ""
+    return PyPDF2
+
+def count_pdf_pages(file_path: str) -> int:
+    PyPDF2 = _import_pypdf2()
+    with open(file_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def iter_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of pages ``start`` to ``stop`` one page at a time."""
+    PyPDF2 = _import_pypdf2()
     with open(file_path, 'rb') as f:
         reader = PyPDF2.PdfReader(f)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    return text
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for page_number in range(start, stop):
+            yield reader.pages[page_number].extract_text() or ""
+
+def read_pdf_file(file_path: str) -> str:
+    return "".join(iter_pdf_pages(file_path))
 
 # def read_docx_file(file_path: str) -> str:
 #     text = ""
@@ -62,6 +101,15 @@ def read_docx_file(file_path: str) -> str:
     doc = docx.Document(file_path)
     return "\n".join([para.text for para in doc.paragraphs])
 
+def iter_docx_file(file_path: str, paragraphs_per_block: int = 200) -> Iterator[str]:
+    try:
+        import docx
+    except ImportError:
+        raise ImportError("python-docx is required to read DOCX files. Please install it with 'pip install python-docx'.")
+    paragraphs = [para.text for para in docx.Document(file_path).paragraphs]
+    for start in range(0, len(paragraphs), paragraphs_per_block):
+        yield "\n".join(paragraphs[start:start + paragraphs_per_block])
+
 # def read_document(file_path: str) -> str:
 #     ext = os.path.splitext(file_path)[1].lower()
 #     if ext == '.txt':
@@ -85,28 +133,215 @@ def read_document(file_path: str) -> Optional[str]:
     else:
         print(f"Unsupported file type: {ext}")
         return None
-    
 
+def iter_document_pages(file_path: str) -> Iterator[str]:
+    """Yield a document's text piece by piece (pages for PDFs, line blocks for text files)."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.txt':
+        return iter_txt_file(file_path)
+    elif ext == '.pdf':
+        return iter_pdf_pages(file_path)
+    elif ext in ('.doc', '.docx'):
+        return iter_docx_file(file_path)
+    else:
+        print(f"Unsupported file type: {ext}")
+        return iter(())
 
-def generate_embeddings_for_document(file_path: str) -> None:
+
+def iter_parsed_pages(file_path: str, start: Optional[int] = None, stop: Optional[int] = None) -> Iterator[str]:
+    """Extract and preprocess a document, or a page range of a PDF, one page at a time."""
+    if start is None:
+        pages = iter_document_pages(file_path)
+    else:
+        pages = iter_pdf_pages(file_path, start, stop)
+    preprocessor = get_preprocessor()
+    for page in pages:
+        if page.strip():
+            yield preprocessor.process(page)
+
+
+def parse_pages(file_path: str, start: Optional[int] = None, stop: Optional[int] = None) -> List[str]:
+    """
+    Extract and preprocess a document, or a page range of a PDF.
+
+    Runs inside the ingestion process pool, so it only takes and returns
+    picklable values.
+    """
+    return list(iter_parsed_pages(file_path, start, stop))
+
+
+def parse_documents(file_paths: List[str], max_workers: int = INGEST_WORKERS) -> Iterator[Tuple[str, Iterable[str]]]:
+    """
+    Parse documents across a process pool.
+
+    PDFs longer than PDF_PAGES_PER_TASK pages are split into page ranges so
+    one large filing is spread over several cores. With a single worker
+    pages are parsed lazily as they are consumed, so consume each
+    document's pages before moving on to the next document.
+
+    Yields:
+        Tuple[str, Iterable[str]]: File path and its preprocessed pages, as
+        each document finishes
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    tasks = []
+    for file_path in file_paths if max_workers > 1 else ():
+        page_count = 0
+        if file_path.lower().endswith('.pdf'):
+            try:
+                page_count = count_pdf_pages(file_path)
+            except Exception as e:
+                print(f"Could not open {file_path}: {str(e)}")
+        if page_count > PDF_PAGES_PER_TASK:
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                tasks.append((file_path, start, start + PDF_PAGES_PER_TASK))
+        else:
+            tasks.append((file_path, None, None))
+
+    if len(tasks) <= 1:
+        for file_path in file_paths:
+            yield file_path, iter_parsed_pages(file_path)
+        return
+
+    remaining = {}
+    for file_path, start, _ in tasks:
+        remaining[file_path] = remaining.get(file_path, 0) + 1
+    parts: Dict[str, Dict[int, List[str]]] = {file_path: {} for file_path in remaining}
+
+    executor = ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)))
+    futures = {executor.submit(parse_pages, *task): task for task in tasks}
+    results = ((futures[future], future.result()) for future in as_completed(futures))
+
+    try:
+        for (file_path, start, _), pages in results:
+            parts[file_path][start or 0] = pages
+            remaining[file_path] -= 1
+            if remaining[file_path] == 0:
+                ranges = parts.pop(file_path)
+                yield file_path, chain.from_iterable(ranges[key] for key in sorted(ranges))
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+
+def chunk_document(
+    file_path: str,
+    pages: Optional[Iterable[str]] = None,
+    attributes: Optional[Dict] = None
+) -> Optional[List[Dict]]:
+    """
+    Read content from a document, preprocess it and split it into chunk
+    records. ``pages`` may carry text already preprocessed by
+    ``parse_documents``. Pages are chunked as they stream in, so the whole
+    document text is never held at once. ``attributes`` are copied onto
+    every record for retrieval filters. Returns None if the document
+    could not be read.
+    """
+    if pages is None:
+        pages = iter_parsed_pages(file_path)
+    document = os.path.basename(file_path)
+    records = [
+        make_record(document, i, chunk, file_path, attributes)
+        for i, chunk in enumerate(iter_chunks(pages, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+    ]
+    if not records:
+        print(f"Could not read content from {file_path}.")
+        return None
+    return records
+
+
+def embed_records(records: List[Dict]) -> np.ndarray:
+    """
+    Embed chunk records in concurrent batches and report throughput.
+
+    Returns the embedding matrix in record order.
+    """
+    if not records:
+        return np.zeros((0, 0), dtype=np.float32)
+    start = time.perf_counter()
+    matrix = embed_texts([record['content'] for record in records])
+    elapsed = time.perf_counter() - start
+    rate = len(records) / elapsed if elapsed > 0 else float('inf')
+    print(f"Embedded {len(records)} chunks in {elapsed:.1f}s ({rate:.1f} chunks/s).")
+    return matrix
+
+
+def embed_document(file_path: str) -> Optional[Tuple[List[Dict], np.ndarray]]:
     """
     Read content from a document, preprocess it, split it into chunks,
     and generate embeddings for each chunk.
 
+    Returns the chunk records and their embedding matrix, or None if the
+    document could not be read.
     """
-    os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
-    content = read_document(file_path)
-    if not content:
-        print(f"Could not read content from {file_path}.")
+    records = chunk_document(file_path)
+    if records is None:
+        return None
+    return records, embed_records(records)
+
+
+def reuse_or_embed(records: List[Dict], store: EmbeddingStore) -> np.ndarray:
+    """
+    Build the embedding matrix for chunk records, reusing stored vectors for
+    any chunk text that is already in the store and embedding only the rest.
+    """
+    if not records:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    old_matrix = None
+    known: Dict[str, int] = {}
+    if store.exists():
+        old_matrix, old_records, info = store.load()
+        if info.get('model') != get_backend().embedding_model:
+            # Vectors from another model are not comparable
+            old_records = []
+        for row, record in enumerate(old_records):
+            known.setdefault(record.get('hash') or chunk_hash(record['content']), row)
+
+    # Embed each new piece of chunk text once
+    missing: Dict[str, Dict] = {}
+    for record in records:
+        if record['hash'] not in known:
+            missing.setdefault(record['hash'], record)
+    reused = sum(1 for record in records if record['hash'] not in missing)
+    print(f"Reusing {reused} stored chunk embeddings, embedding {len(missing)} new chunks.")
+    new_matrix = embed_records(list(missing.values()))
+    new_rows = {digest: row for row, digest in enumerate(missing)}
+
+    dim = new_matrix.shape[1] if new_rows else old_matrix.shape[1]
+    matrix = np.empty((len(records), dim), dtype=np.float32)
+    for row, record in enumerate(records):
+        if record['hash'] in new_rows:
+            matrix[row] = new_matrix[new_rows[record['hash']]]
+        else:
+            matrix[row] = old_matrix[known[record['hash']]]
+    return matrix
+
+
+def generate_embeddings_for_document(file_path: str) -> None:
+    """
+    Generate embeddings for a single document and write them to the store,
+    replacing any chunks previously stored for it. If the store holds
+    vectors of another embedding model, every document is re-embedded first.
+    """
+    document = os.path.basename(file_path)
+    attributes = load_document_attributes().get(document)
+    records = chunk_document(file_path, attributes=attributes)
+    if records is None:
         return
-    processed_content = preprocess_document(content)
-    chunks = split_into_chunks(processed_content, chunk_size=CHUNK_SIZE)
-    for i, chunk in enumerate(chunks):
-        embedding = get_embedding(chunk)
-        output_file = os.path.join(EMBEDDINGS_DIR, 
-            f"{os.path.splitext(os.path.basename(file_path))[0]}_chunk_{i}.json")
-        with open(output_file, 'w') as f:
-            json.dump({"content": chunk, "embedding": embedding.tolist()}, f)
+    store = EmbeddingStore(EMBEDDINGS_DIR)
+    embedding_model = get_backend().embedding_model
+    if store.exists() and store.read_info().get('model') != embedding_model:
+        # The other documents' rows would keep vectors of the old model
+        print(f"Embedding model changed to {embedding_model}, rebuilding all embeddings first.")
+        process_all_documents(full_rebuild=True)
+    store.update(records, reuse_or_embed(records, store), remove=[document])
+
+    manifest = load_manifest()
+    manifest[document] = document_entry(
+        file_path, file_sha256(file_path), [record['hash'] for record in records], attributes
+    )
+    save_manifest(manifest)
 
 
 # def generate_embeddings_for_document(file_path: str) -> None:
@@ -132,24 +367,76 @@ def generate_embeddings_for_document(file_path: str) -> None:
 #                 'embedding': embedding.tolist()
 #             }, f)
 
-def process_all_documents() -> None:
+def process_all_documents(full_rebuild: bool = False) -> None:
+    """
+    Bring the embedding store in line with DOCUMENTS_DIR.
+
+    Documents whose size, mtime or content hash match the manifest are
+    skipped, changed documents are re-chunked with stored vectors reused
+    for identical chunk text, and chunks of deleted documents are removed.
+    ``full_rebuild`` ignores the manifest and re-embeds everything.
+    """
     if not os.path.exists(DOCUMENTS_DIR):
         print(f"Documents directory {DOCUMENTS_DIR} does not exist!")
         return
-    for filename in os.listdir(DOCUMENTS_DIR):
+    store = EmbeddingStore(EMBEDDINGS_DIR)
+    embedding_model = get_backend().embedding_model
+    if store.exists() and store.read_info().get('model') != embedding_model:
+        print(f"Embedding model changed to {embedding_model}, rebuilding all embeddings.")
+        full_rebuild = True
+    manifest = {} if full_rebuild else load_manifest()
+    attributes = load_document_attributes()
+    new_manifest = {}
+    changed_records = []
+    changed_documents = set()
+
+    changed_paths = []
+    for filename in sorted(os.listdir(DOCUMENTS_DIR)):
         if filename.endswith(SUPPORTED_DOCUMENT_TYPES):
             file_path = os.path.join(DOCUMENTS_DIR, filename)
-            print(f"Processing {file_path}...")
-            generate_embeddings_for_document(file_path)
-            print(f"Finished processing {file_path}.")
-
-if __name__ == "__main__":
-    process_all_documents()
-
-
-
-
+            entry = unchanged_entry(manifest.get(filename), file_path, attributes.get(filename))
+            if entry is not None:
+                new_manifest[filename] = entry
+            else:
+                changed_paths.append(file_path)
 
+    # Chunk each document as soon as its pages are parsed
+    for file_path, pages in parse_documents(changed_paths):
+        print(f"Processing {file_path}...")
+        filename = os.path.basename(file_path)
+        records = chunk_document(file_path, pages, attributes.get(filename)) or []
+        changed_records.extend(records)
+        changed_documents.add(filename)
+        new_manifest[filename] = document_entry(
+            file_path,
+            file_sha256(file_path),
+            [record['hash'] for record in records],
+            attributes.get(filename)
+        )
+        print(f"Finished processing {file_path}.")
+    changed_records.sort(key=lambda record: (record['document'], record['chunk']))
 
+    stored_documents = set(manifest)
+    if store.exists():
+        stored_documents |= set(store.read_info().get('documents', {}))
+    removed_documents = stored_documents - set(new_manifest)
 
+    if full_rebuild:
+        # Embed chunks from every document together so batches stay full
+        store.write(embed_records(changed_records), changed_records)
+    elif changed_documents or removed_documents:
+        for document in sorted(removed_documents):
+            print(f"Removing chunks of deleted document {document}.")
+        store.update(
+            changed_records,
+            reuse_or_embed(changed_records, store),
+            remove=changed_documents | removed_documents
+        )
+    else:
+        print("Embeddings are up to date.")
+    save_manifest(new_manifest)
 
+if __name__ == "__main__":
+    # The only place NLTK data is downloaded (with NLTK_ALLOW_DOWNLOAD=1); the servers stay offline
+    download_nltk_data()
+    process_all_documents(full_rebuild='--full' in sys.argv)
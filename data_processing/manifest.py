@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+from config import EMBEDDINGS_DIR, DOCUMENT_ATTRIBUTES_FILE
+from data_processing.preprocess_docs import PREPROCESSOR_VERSION
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash a file's bytes without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_document_attributes(path: str = DOCUMENT_ATTRIBUTES_FILE) -> Dict[str, Dict]:
+    """
+    Load the optional per-document attributes file.
+
+    The file maps document filenames to attributes such as
+    ``{"jurisdiction": "US", "document_type": "statute"}`` that retrieval
+    can filter on.
+
+    Returns:
+        Dict[str, Dict]: Attributes by document filename, empty if there is no file
+    """
+    try:
+        with open(path, 'r') as f:
+            attributes = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Could not read document attributes from {path}: {str(e)}")
+        return {}
+    return {name: value for name, value in attributes.items() if isinstance(value, dict)}
+
+
+def load_manifest(directory: str = EMBEDDINGS_DIR) -> Dict[str, Dict]:
+    """
+    Load the ingestion manifest.
+
+    Returns:
+        Dict[str, Dict]: Document filename to its recorded size, mtime,
+        content hash and chunk hashes. Empty if no manifest exists yet.
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: Dict[str, Dict], directory: str = EMBEDDINGS_DIR) -> None:
+    """Atomically write the ingestion manifest."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def document_entry(
+    file_path: str,
+    sha256: str,
+    chunk_hashes: List[str],
+    attributes: Optional[Dict] = None
+) -> Dict:
+    """Build the manifest entry for one ingested document."""
+    stats = os.stat(file_path)
+    entry = {
+        'size': stats.st_size,
+        'mtime_ns': stats.st_mtime_ns,
+        'sha256': sha256,
+        'chunks': chunk_hashes,
+        'preprocessor': PREPROCESSOR_VERSION
+    }
+    if attributes:
+        entry['attributes'] = dict(attributes)
+    return entry
+
+
+def unchanged_entry(
+    entry: Optional[Dict],
+    file_path: str,
+    attributes: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    Check a document against its manifest entry.
+
+    A change to the document's attributes, or a document processed by
+    another PREPROCESSOR_VERSION, counts as a change. Otherwise
+    size and mtime are compared first so unchanged files are never read; if
+    they differ the content hash decides.
+
+    Returns:
+        Optional[Dict]: The (refreshed) entry if the document is unchanged,
+        otherwise None
+    """
+    if not entry or entry.get('attributes', {}) != (attributes or {}):
+        return None
+    if entry.get('preprocessor') != PREPROCESSOR_VERSION:
+        return None
+    stats = os.stat(file_path)
+    if entry.get('size') == stats.st_size and entry.get('mtime_ns') == stats.st_mtime_ns:
+        return entry
+    if entry.get('sha256') == file_sha256(file_path):
+        return dict(entry, size=stats.st_size, mtime_ns=stats.st_mtime_ns)
+    return None
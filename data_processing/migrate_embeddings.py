@@ -0,0 +1,52 @@
+import os
+import sys
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from config import DOCUMENTS_DIR, EMBEDDINGS_DIR, SUPPORTED_DOCUMENT_TYPES
+from RAG.store import EmbeddingStore, LEGACY_CHUNK_PATTERN, read_legacy_json
+
+
+def resolve_document_name(stem: str) -> str:
+    """Map a legacy chunk prefix back to its source filename, if it still exists."""
+    for ext in SUPPORTED_DOCUMENT_TYPES:
+        if os.path.exists(os.path.join(DOCUMENTS_DIR, stem + ext)):
+            return stem + ext
+    return stem
+
+
+def migrate_json_embeddings(directory: str = EMBEDDINGS_DIR, remove_json: bool = True) -> int:
+    """
+    Convert ``<document>_chunk_<n>.json`` files into the binary embedding store.
+
+    Args:
+        directory (str): Directory holding the legacy JSON chunk files
+        remove_json (bool): Delete the JSON files once the store is written
+
+    Returns:
+        int: Number of chunks migrated
+    """
+    matrix, records = read_legacy_json(directory)
+    if not records:
+        print(f"No legacy JSON embeddings found in {directory}.")
+        return 0
+
+    for record in records:
+        record['document'] = resolve_document_name(record['document'])
+
+    EmbeddingStore(directory).write(matrix, records)
+    print(f"Migrated {len(records)} chunks into {directory}.")
+
+    if remove_json:
+        for filename in os.listdir(directory):
+            if LEGACY_CHUNK_PATTERN.match(filename):
+                os.remove(os.path.join(directory, filename))
+    return len(records)
+
+
+if __name__ == "__main__":
+    migrate_json_embeddings(remove_json='--keep-json' not in sys.argv)
@@ -5,34 +5,197 @@
 # from PyPDF2 import PdfReader
 # from docx import Document
 
+import os
 import re
-import nltk
-from nltk.tokenize import sent_tokenize
-from nltk.corpus import stopwords
-from typing import List, Dict, Any
+import hashlib
+import threading
+from typing import List, Dict, Any, FrozenSet, Iterable, Iterator, Optional
+from config import NLTK_DATA_DIR, NLTK_ALLOW_DOWNLOAD, CHUNK_SIZE, CHUNK_OVERLAP
+
+# NLTK resources used here, by lookup path and downloader package name
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab/english/',
+}
+
+# The 198 English stopwords of the NLTK stopwords corpus (nltk_data 2023),
+# vendored so processed text, chunk hashes and cache keys are the same on
+# every host, whether or not NLTK data is installed there
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against ain all am an and any are aren aren't as at
+be because been before being below between both but by can couldn couldn't d
+did didn didn't do does doesn doesn't doing don don't down during each few for
+from further had hadn hadn't has hasn hasn't have haven haven't having he he'd
+he'll her here hers herself he's him himself his how i i'd if i'll i'm in into
+is isn isn't it it'd it'll it's its itself i've just ll m ma me mightn mightn't
+more most mustn mustn't my myself needn needn't no nor not now o of off on once
+only or other our ours ourselves out over own re s same shan shan't she she'd
+she'll she's should shouldn shouldn't should've so some such t than that
+that'll the their theirs them themselves then there these they they'd they'll
+they're they've this those through to too under until up ve very was wasn
+wasn't we we'd we'll we're were weren weren't we've what when where which while
+who whom why will with won won't wouldn wouldn't y you you'd you'll your you're
+yours yourself yourselves you've
+""".split())
+
+# Recorded in the ingestion manifest; documents processed under another
+# version are re-chunked (see data_processing.manifest.unchanged_entry)
+PREPROCESSOR_VERSION = "stopwords-" + hashlib.sha256(
+    ' '.join(sorted(ENGLISH_STOPWORDS)).encode('utf-8')
+).hexdigest()[:12]
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+_resolved: Dict[str, bool] = {}
+_resolve_lock = threading.Lock()
+
+
+def _nltk():
+    """Import NLTK on first use and point it at the project's local data directory."""
+    import nltk
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    return nltk
+
+
+def ensure_nltk_resource(package: str, download: bool = False) -> bool:
+    """
+    Resolve an NLTK resource once per process.
+
+    Only the local NLTK data directories are searched, so the request path
+    never touches the network. With ``download`` (used by the ingestion CLI
+    through ``download_nltk_data``) and NLTK_ALLOW_DOWNLOAD set, a missing
+    resource is downloaded into NLTK_DATA_DIR so later runs find it offline.
+
+    Returns:
+        bool: Whether the resource is available
+    """
+    if package in _resolved and (_resolved[package] or not download):
+        return _resolved[package]
+    with _resolve_lock:
+        if not _resolved.get(package):
+            nltk = _nltk()
+            try:
+                nltk.data.find(NLTK_RESOURCES[package])
+                available = True
+            except LookupError:
+                available = False
+                if download and NLTK_ALLOW_DOWNLOAD:
+                    print(f"Downloading NLTK {package} data...")
+                    os.makedirs(NLTK_DATA_DIR, exist_ok=True)
+                    available = bool(nltk.download(package, download_dir=NLTK_DATA_DIR, quiet=True))
+            _resolved[package] = available
+    return _resolved[package]
+
 
 def download_nltk_data():
-    """Download required NLTK data."""
-    required_packages = [
-        'punkt',
-        'stopwords',
-        'punkt_tab'
-    ]
-    
-    for package in required_packages:
-        try:
-            if package == 'punkt_tab':
-                nltk.download('punkt_tab', quiet=True)
-            else:
-                nltk.data.find(f'tokenizers/{package}')
-        except LookupError:
-            print(f"Downloading NLTK {package} data...")
-            nltk.download(package, quiet=True)
-            print(f"Downloaded NLTK {package} data.")
+    """Download missing NLTK data into NLTK_DATA_DIR, if NLTK_ALLOW_DOWNLOAD is set."""
+    for package in NLTK_RESOURCES:
+        ensure_nltk_resource(package, download=True)
+
+
+def get_stopwords() -> FrozenSet[str]:
+    """English stopwords, see ENGLISH_STOPWORDS."""
+    return ENGLISH_STOPWORDS
+
+
+def sentence_tokenize(text: str) -> List[str]:
+    """Split text into sentences with NLTK punkt, or a punctuation rule when it is unavailable."""
+    if ensure_nltk_resource('punkt_tab'):
+        from nltk.tokenize import sent_tokenize
+        return sent_tokenize(text)
+    return [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+# Characters dropped by clean_text; everything else (words, digits, '-', '.') is kept
+_DISALLOWED_CHAR = re.compile(r'[^\w\s\-\.]')
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'\d+')
+_ORDINAL_SUFFIXES = frozenset(('st', 'nd', 'rd', 'th'))
+# Terms such as "h1b" or "h-1b" that are kept even if they are stopwords
+_KEEP_TERM = re.compile(r'[a-z]+\d+|[a-z]+-[a-z]+')
+
+
+class TextPreprocessor:
+    """
+    Reusable text preprocessor.
+
+    Patterns are compiled once and the stopword set is frozen at
+    construction. Text is cleaned once, stopwords are dropped in one pass over
+    its words, and whole numbers, decimals and ordinals all come from a
+    single scan for digit runs. With the same stopword list the output is
+    identical to the original multi-pass implementation.
+    """
+
+    def __init__(self, stop_words: Optional[Iterable[str]] = None):
+        self.stop_words = frozenset(get_stopwords() if stop_words is None else stop_words)
+
+    def extract_numbers(self, text: str) -> List[str]:
+        """
+        Extract numbers and numerical patterns from text in a single scan.
+
+        Every run of digits is a number. A run followed by an ordinal suffix
+        is also an ordinal, and two runs joined by a single '.' form a
+        decimal, pairing runs from left to right.
+
+        Returns:
+            List[str]: Whole numbers, then decimals, then ordinals, each in text order
+        """
+        runs = list(_DIGITS.finditer(text))
+        numbers = [run.group() for run in runs]
+        decimals, ordinals = [], []
+        paired = False
+        for i, run in enumerate(runs):
+            end = run.end()
+            suffix = text[end:end + 2]
+            if suffix in _ORDINAL_SUFFIXES:
+                ordinals.append(numbers[i] + suffix)
+            if paired:
+                # Already the fractional part of the previous decimal
+                paired = False
+            elif i + 1 < len(runs) and runs[i + 1].start() == end + 1 and text[end] == '.':
+                decimals.append(numbers[i] + '.' + numbers[i + 1])
+                paired = True
+        return numbers + decimals + ordinals
+
+    def process(self, text: str) -> str:
+        """
+        Preprocess a text.
+
+        Args:
+            text (str): The input text
 
+        Returns:
+            str: Lowercased words without stopwords, followed by the numbers in the text
+        """
+        text = _DISALLOWED_CHAR.sub(' ', text)
+        stop_words = self.stop_words
+        filtered_words = [
+            word for word in text.lower().split()
+            if word not in stop_words or word.isdigit() or _KEEP_TERM.fullmatch(word)
+        ]
+        # Numbers are matched before lowercasing, so "1ST" is not an ordinal
+        filtered_words += self.extract_numbers(text)
+        return ' '.join(filtered_words)
 
-# Download required NLTK data at module import
-download_nltk_data()
+    def process_batch(self, texts: Iterable[str]) -> List[str]:
+        """Preprocess many texts, in input order."""
+        process = self.process
+        return [process(text) for text in texts]
+
+    __call__ = process
+
+
+_preprocessor: Optional[TextPreprocessor] = None
+_preprocessor_lock = threading.Lock()
+
+
+def get_preprocessor() -> TextPreprocessor:
+    """Return the process-wide preprocessor, creating it on first use."""
+    global _preprocessor
+    if _preprocessor is None:
+        with _preprocessor_lock:
+            if _preprocessor is None:
+                _preprocessor = TextPreprocessor()
+    return _preprocessor
 
 
 # def clean_text(text: str) -> str:
@@ -52,16 +215,7 @@ def clean_text(text: str) -> str:
     Returns:
         str: Cleaned text
     """
-    # Replace multiple spaces with single space
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Preserve numbers and important punctuation
-    text = re.sub(r'[^\w\s\d\-\.]', ' ', text)
-    
-    # Remove extra whitespace
-    text = text.strip()
-    
-    return text
+    return _DISALLOWED_CHAR.sub(' ', _WHITESPACE.sub(' ', text)).strip()
 
 
 # def extract_numbers(text: str) -> list[str]:
@@ -80,21 +234,7 @@ def extract_numbers(text: str) -> List[str]:
     Returns:
         List[str]: List of extracted numbers and numerical patterns
     """
-    # Match various number patterns
-    patterns = [
-        r'\d+',  # Simple numbers
-        r'\d+\.\d+',  # Decimal numbers
-        r'\d+%',  # Percentages
-        r'\$\d+(?:\.\d+)?',  # Currency
-        r'\d+(?:st|nd|rd|th)',  # Ordinal numbers
-    ]
-    
-    numbers = []
-    for pattern in patterns:
-        matches = re.finditer(pattern, text)
-        numbers.extend(match.group() for match in matches)
-    
-    return numbers
+    return get_preprocessor().extract_numbers(text)
 
 
 # def preprocess_text(text: str) -> str:
@@ -130,35 +270,20 @@ def preprocess_document(text: str) -> str:
     Returns:
         str: Preprocessed text
     """
-    # Clean the text first
-    text = clean_text(text)
-    
-    # Extract numbers before converting to lowercase
-    numbers = extract_numbers(text)
-    
-    # Convert to lowercase
-    text = text.lower()
-    
-    # Remove stopwords but preserve numbers and important terms
-    stop_words = set(stopwords.words('english'))
-    words = text.split()
-    
-    # Keep words that are:
-    # 1. Not in stopwords
-    # 2. Numbers
-    # 3. Important terms (like h-1b, lca, etc.)
-    filtered_words = []
-    for word in words:
-        if (word not in stop_words or
-            word.isdigit() or
-            re.match(r'^[a-z]+\d+$', word) or  # Matches patterns like "h1b"
-            re.match(r'^[a-z]+-[a-z]+$', word)):  # Matches patterns like "h-1b"
-            filtered_words.append(word)
+    return get_preprocessor().process(text)
+
+
+def preprocess_documents(texts: Iterable[str]) -> List[str]:
+    """
+    Preprocess many texts with the shared preprocessor.
     
-    # Add extracted numbers back
-    filtered_words.extend(numbers)
+    Args:
+        texts (Iterable[str]): The input texts
     
-    return ' '.join(filtered_words)
+    Returns:
+        List[str]: Preprocessed texts, in input order
+    """
+    return get_preprocessor().process_batch(texts)
 
 # def split_into_chunks(text: str, chunk_size: int) -> list[str]:
 #     """
@@ -178,6 +303,55 @@ def preprocess_document(text: str) -> str:
 #     chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
 #     return chunks
 
+def iter_chunks(
+    texts: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP
+) -> Iterator[str]:
+    """
+    Split a stream of text into chunks lazily.
+
+    Text is consumed piece by piece (e.g. one page at a time) and at most
+    about two chunks of tokens are held at once, so memory stays flat
+    however long the document is. Tokens are whitespace-separated words.
+    A chunk ends at the last sentence boundary in its second half when
+    there is one, otherwise after ``chunk_size`` tokens.
+
+    Args:
+        texts (Iterable[str]): Pieces of one document, in order
+        chunk_size (int): Maximum number of tokens per chunk
+        overlap (int): Tokens from the end of a chunk repeated at the start of the next
+
+    Yields:
+        str: Chunks of text
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    overlap = max(0, min(overlap, chunk_size // 2))
+    buffer: List[str] = []
+    fresh = 0  # Tokens in the buffer not yet part of an emitted chunk
+
+    for text in texts:
+        words = text.split()
+        for start in range(0, len(words), chunk_size):
+            piece = words[start:start + chunk_size]
+            buffer.extend(piece)
+            fresh += len(piece)
+            while len(buffer) > chunk_size:
+                cut = chunk_size
+                for end in range(chunk_size, chunk_size // 2, -1):
+                    if buffer[end - 1][-1] in '.!?':
+                        cut = end
+                        break
+                yield ' '.join(buffer[:cut])
+                keep = min(overlap, cut - 1)
+                del buffer[:cut - keep]
+                fresh = len(buffer) - keep
+
+    if fresh > 0:
+        yield ' '.join(buffer)
+
+
 def split_into_chunks(text: str, chunk_size: int = 1000) -> List[str]:
     """
     Split text into smaller chunks for processing.
@@ -188,6 +362,9 @@ def split_into_chunks(text: str, chunk_size: int = 1000) -> List[str]:
     
     Returns:
         List[str]: List of text chunks
+
+    Loads the whole text and every chunk into memory; ingestion uses
+    ``iter_chunks`` over a document's pages instead.
     """
     try:
         # First try to split by newlines to preserve structure
@@ -195,17 +372,7 @@ def split_into_chunks(text: str, chunk_size: int = 1000) -> List[str]:
         
         # If paragraphs are too long, try sentence tokenization
         if any(len(p.split()) > chunk_size for p in paragraphs):
-            try:
-                sentences = sent_tokenize(text)
-            except LookupError as e:
-                print(f"Error with NLTK data: {str(e)}")
-                print("Attempting to download required NLTK data...")
-                download_nltk_data()
-                try:
-                    sentences = sent_tokenize(text)
-                except LookupError as e:
-                    print(f"Failed to download NLTK data: {str(e)}")
-                    sentences = [s.strip() for s in text.split('.') if s.strip()]
+            sentences = sentence_tokenize(text)
         else:
             sentences = paragraphs
     except Exception as e:
@@ -1,6 +1,6 @@
-import ollama
-from typing import List
-from config import LLM_MODEL, MAX_RETRIES, LLM_PROMPT_TEMPLATE
+from typing import List, Iterator, AsyncIterator
+from model_backend import get_backend
+from config import MAX_RETRIES, LLM_PROMPT_TEMPLATE
 
 class LLMError(Exception):
     """Custom exception for LLM-related errors."""
@@ -9,10 +9,38 @@ class LLMError(Exception):
 # class LLMError(Exception):
 #     pass
 
+def build_prompt(query: str, context: List[str]) -> str:
+    """
+    Build the LLM prompt for a query and its retrieved context.
+    
+    Args:
+        query (str): User's question
+        context (List[str]): List of relevant document chunks
+    
+    Returns:
+        str: The formatted prompt
+    """
+    # If no context is provided, use a simpler prompt
+    if not context:
+        return f"""You are a helpful legal assistant chatbot. While I don't have specific legal documents to reference for your question, I'll do my best to provide a general answer.
+
+Question: {query}
+Answer:"""
+    # Format the prompt with context and query
+    return LLM_PROMPT_TEMPLATE.format(
+        context=' '.join(context),
+        query=query
+    )
+
+
 def get_llm_response(query: str, context: List[str], max_retries: int = MAX_RETRIES) -> str:
     """
     Get response from LLM with retry logic.
     
+    The model backend (see ``model_backend.get_backend``) retries transient
+    failures with jittered exponential backoff and fails straight away while
+    the model server is down.
+    
     Args:
         query (str): User's question
         context (List[str]): List of relevant document chunks
@@ -22,35 +50,78 @@ def get_llm_response(query: str, context: List[str], max_retries: int = MAX_RETR
         str: LLM's response
     
     Raises:
-        LLMError: If all retry attempts fail
+        LLMError: If all retry attempts fail or the backend is unavailable
     """
-    for attempt in range(max_retries):
-        try:
-            # If no context is provided, use a simpler prompt
-            if not context:
-                prompt = f"""You are a helpful legal assistant chatbot. While I don't have specific legal documents to reference for your question, I'll do my best to provide a general answer.
+    prompt = build_prompt(query, context)
+    try:
+        # Get response from LLM
+        return get_backend().chat(prompt, max_retries)
+    except Exception as e:
+        raise LLMError(f"Failed to get LLM response: {str(e)}") from e
 
-Question: {query}
-Answer:"""
-            else:
-                # Format the prompt with context and query
-                prompt = LLM_PROMPT_TEMPLATE.format(
-                    context=' '.join(context),
-                    query=query
-                )
-            
-            # Get response from LLM
-            response = ollama.chat(
-                model=LLM_MODEL,
-                messages=[{'role': 'user', 'content': prompt}]
-            )
-            
-            return response['message']['content']
-            
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise LLMError(f"Failed to get LLM response after {max_retries} attempts: {str(e)}") from e
-            continue 
+
+def stream_llm_response(query: str, context: List[str], max_retries: int = MAX_RETRIES) -> Iterator[str]:
+    """
+    Stream the LLM response token by token.
+    
+    Failures before the first token are retried like ``get_llm_response``;
+    once tokens have been yielded a failure is raised immediately, since the
+    caller has already shown part of the answer.
+    
+    Args:
+        query (str): User's question
+        context (List[str]): List of relevant document chunks
+        max_retries (int): Maximum number of retry attempts
+    
+    Yields:
+        str: Pieces of the response as the model generates them
+    
+    Raises:
+        LLMError: If all retry attempts fail, the stream breaks or the backend is unavailable
+    """
+    prompt = build_prompt(query, context)
+    started = False
+    try:
+        for token in get_backend().stream_chat(prompt, max_retries):
+            started = True
+            yield token
+    except Exception as e:
+        if started:
+            raise LLMError(f"LLM stream interrupted: {str(e)}") from e
+        raise LLMError(f"Failed to get LLM response: {str(e)}") from e
+
+
+async def aget_llm_response(query: str, context: List[str], max_retries: int = MAX_RETRIES) -> str:
+    """
+    Async variant of ``get_llm_response`` for the asyncio server.
+    
+    Raises:
+        LLMError: If all retry attempts fail or the backend is unavailable
+    """
+    prompt = build_prompt(query, context)
+    try:
+        return await get_backend().achat(prompt, max_retries)
+    except Exception as e:
+        raise LLMError(f"Failed to get LLM response: {str(e)}") from e
+
+
+async def astream_llm_response(query: str, context: List[str], max_retries: int = MAX_RETRIES) -> AsyncIterator[str]:
+    """
+    Async variant of ``stream_llm_response`` for the asyncio server.
+    
+    Raises:
+        LLMError: If all retry attempts fail, the stream breaks or the backend is unavailable
+    """
+    prompt = build_prompt(query, context)
+    started = False
+    try:
+        async for token in get_backend().astream_chat(prompt, max_retries):
+            started = True
+            yield token
+    except Exception as e:
+        if started:
+            raise LLMError(f"LLM stream interrupted: {str(e)}") from e
+        raise LLMError(f"Failed to get LLM response: {str(e)}") from e
 
 
 # def get_llm_response(query: str, context: List[str], max_retries: int = MAX_RETRIES):
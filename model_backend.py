@@ -0,0 +1,522 @@
+import re
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, TypeVar
+import httpx
+import ollama
+import numpy as np
+from telemetry import record_tokens
+from config import (
+    LLM_MODEL,
+    EMBEDDING_MODEL,
+    MAX_RETRIES,
+    BACKEND_CONNECT_TIMEOUT,
+    BACKEND_READ_TIMEOUT,
+    BACKEND_MAX_CONNECTIONS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    MODEL_BACKEND,
+    FAKE_BACKEND_LATENCY,
+    FAKE_BACKEND_TOKENS_PER_SECOND,
+    FAKE_BACKEND_RESPONSE_TOKENS,
+    FAKE_BACKEND_EMBEDDING_DIM
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the backend keeps failing."""
+    pass
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tell whether an error means the backend is unreachable or overloaded.
+
+    Only these are worth retrying and count against the circuit breaker;
+    errors such as an unknown model fail the same way on every attempt.
+    """
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    # ollama turns httpx.ConnectError into the builtin ConnectionError
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_MAX) -> float:
+    """
+    Delay before retry number ``attempt`` (from 0), with full jitter.
+
+    A random delay up to ``base * 2 ** attempt`` seconds, capped at ``cap``,
+    so workers that failed together do not retry in lockstep.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a backend is down.
+
+    After ``failure_threshold`` consecutive transient failures the circuit
+    opens and ``before_call`` raises CircuitOpenError straight away. Once
+    ``reset_timeout`` seconds have passed one trial call is let through:
+    success closes the circuit, another failure keeps it open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self) -> None:
+        """
+        Check that a call may go ahead.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call already running
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            retry_in = self.opened_at + self.reset_timeout - now
+            # A trial that never reported back (e.g. a cancelled request) expires after reset_timeout
+            if retry_in > 0 or now < self._trial_until:
+                raise CircuitOpenError(
+                    f"{self.name} backend unavailable after {self.failures} failures, "
+                    f"retrying in {max(retry_in, 0.0):.0f}s"
+                )
+            self._trial_until = now + self.reset_timeout
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.name} backend recovered, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_until = 0.0
+
+    def record_error(self, error: Exception) -> bool:
+        """
+        Record a failed call.
+
+        Returns:
+            bool: Whether the call may be retried: the error was transient and the circuit is still closed
+        """
+        if not is_transient(error):
+            # The backend answered, so it is up
+            self.record_success()
+            return False
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if was_open or self.failures >= self.failure_threshold:
+                if not was_open:
+                    logger.warning(f"{self.name} backend failed {self.failures} times in a row, opening circuit")
+                self.opened_at = time.monotonic()
+                self._trial_until = 0.0
+            return self.opened_at is None
+
+
+chat_breaker = CircuitBreaker("chat")
+embedding_breaker = CircuitBreaker("embedding")
+
+
+def call_with_retries(func: Callable[[], T], breaker: CircuitBreaker, max_retries: int = MAX_RETRIES) -> T:
+    """
+    Call the backend, retrying transient failures with jittered exponential backoff.
+
+    Args:
+        func (Callable[[], T]): Makes one backend request
+        breaker (CircuitBreaker): Circuit guarding the backend
+        max_retries (int): Maximum number of attempts
+
+    Returns:
+        T: What ``func`` returned
+
+    Raises:
+        CircuitOpenError: If the circuit is open
+        Exception: The last error from ``func`` if it is not transient or every attempt failed
+    """
+    for attempt in range(max_retries):
+        breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if not breaker.record_error(e) or attempt == max_retries - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"{breaker.name} request failed ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_retries(
+    func: Callable[[], Awaitable[T]],
+    breaker: CircuitBreaker,
+    max_retries: int = MAX_RETRIES
+) -> T:
+    """Async variant of ``call_with_retries``; ``func`` returns a new awaitable per attempt."""
+    for attempt in range(max_retries):
+        breaker.before_call()
+        try:
+            result = await func()
+        except Exception as e:
+            if not breaker.record_error(e) or attempt == max_retries - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"{breaker.name} request failed ({str(e)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def _client_options() -> dict:
+    return {
+        'timeout': httpx.Timeout(BACKEND_READ_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+        'limits': httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_CONNECTIONS
+        )
+    }
+
+
+_client: Optional[ollama.Client] = None
+_async_client: Optional[ollama.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ollama.Client:
+    """
+    Return the process-wide Ollama client, creating it on first use.
+
+    It keeps a pool of keep-alive connections shared by every thread, and
+    honours OLLAMA_HOST like the ``ollama`` module functions.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ollama.Client(**_client_options())
+    return _client
+
+
+def get_async_client() -> ollama.AsyncClient:
+    """Return the process-wide async Ollama client, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        _async_client = ollama.AsyncClient(**_client_options())
+    return _async_client
+
+
+def log_token_usage(response) -> None:
+    """Log and count the prompt and completion tokens reported by the backend."""
+    prompt_tokens = response.get('prompt_eval_count')
+    if prompt_tokens is not None:
+        logger.info(f"LLM tokens: {prompt_tokens} prompt, {response.get('eval_count')} completion")
+        record_tokens(prompt_tokens, response.get('eval_count'))
+
+
+class ModelBackend:
+    """
+    Interface to the chat and embedding models.
+
+    llm.py and RAG/embedding.py only talk to the models through this, and
+    wrap whatever an implementation raises in LLMError or EmbeddingError.
+    """
+
+    name = 'base'
+    embedding_model = ''  # Recorded with stored vectors; vectors of different models are never mixed
+    cache_embeddings = True  # Whether embeddings are worth keeping in the persistent cache
+
+    def chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        """Answer a prompt."""
+        raise NotImplementedError
+
+    def stream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> Iterator[str]:
+        """Answer a prompt, yielding pieces of the answer as they are generated."""
+        raise NotImplementedError
+
+    async def achat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        raise NotImplementedError
+
+    def astream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in one request, one (not necessarily normalized) row per text."""
+        raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OllamaBackend(ModelBackend):
+    """
+    Models served by Ollama, through the pooled clients above.
+
+    Transient failures are retried with backoff behind the chat and
+    embedding circuit breakers. A stream is only retried before its first
+    token, since the caller may already have shown part of the answer.
+    """
+
+    name = 'ollama'
+
+    def __init__(self, llm_model: str = LLM_MODEL, embedding_model: str = EMBEDDING_MODEL):
+        self.llm_model = llm_model
+        self.embedding_model = embedding_model
+
+    def _messages(self, prompt: str) -> List[dict]:
+        return [{'role': 'user', 'content': prompt}]
+
+    def chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        response = call_with_retries(
+            lambda: get_client().chat(model=self.llm_model, messages=self._messages(prompt)),
+            chat_breaker,
+            max_retries
+        )
+        log_token_usage(response)
+        return response['message']['content']
+
+    def stream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> Iterator[str]:
+        for attempt in range(max_retries):
+            started = False
+            chat_breaker.before_call()
+            try:
+                stream = get_client().chat(model=self.llm_model, messages=self._messages(prompt), stream=True)
+                for part in stream:
+                    token = part['message']['content']
+                    if token:
+                        started = True
+                        yield token
+                    if part.get('done'):
+                        log_token_usage(part)
+                chat_breaker.record_success()
+                return
+            except Exception as e:
+                if not chat_breaker.record_error(e) or started or attempt == max_retries - 1:
+                    raise
+            time.sleep(backoff_delay(attempt))
+
+    async def achat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        response = await acall_with_retries(
+            lambda: get_async_client().chat(model=self.llm_model, messages=self._messages(prompt)),
+            chat_breaker,
+            max_retries
+        )
+        log_token_usage(response)
+        return response['message']['content']
+
+    async def astream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> AsyncIterator[str]:
+        for attempt in range(max_retries):
+            started = False
+            chat_breaker.before_call()
+            try:
+                stream = await get_async_client().chat(
+                    model=self.llm_model, messages=self._messages(prompt), stream=True
+                )
+                async for part in stream:
+                    token = part['message']['content']
+                    if token:
+                        started = True
+                        yield token
+                    if part.get('done'):
+                        log_token_usage(part)
+                chat_breaker.record_success()
+                return
+            except Exception as e:
+                if not chat_breaker.record_error(e) or started or attempt == max_retries - 1:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        result = call_with_retries(
+            lambda: get_client().embed(model=self.embedding_model, input=texts),
+            embedding_breaker
+        )
+        return np.array(result['embeddings'], dtype=np.float32)
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        result = await acall_with_retries(
+            lambda: get_async_client().embed(model=self.embedding_model, input=texts),
+            embedding_breaker
+        )
+        return np.array(result['embeddings'], dtype=np.float32)
+
+
+_WORD = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=100000)
+def _word_hash(word: str) -> int:
+    # blake2b rather than hash() so vectors are the same in every process
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class FakeBackend(ModelBackend):
+    """
+    Deterministic stand-in for the model server, for benchmarks and offline runs.
+
+    Answers take ``latency`` seconds to start and then arrive at
+    ``tokens_per_second``; they repeat words of the prompt, so the same
+    prompt always gets the same answer. Embeddings hash the words of a text
+    into ``dimension`` signed buckets, so texts that share words get similar
+    vectors and retrieval ranks plausibly.
+    """
+
+    name = 'fake'
+    cache_embeddings = False  # Hashing is cheaper than a cache lookup
+
+    def __init__(
+        self,
+        latency: float = FAKE_BACKEND_LATENCY,
+        tokens_per_second: float = FAKE_BACKEND_TOKENS_PER_SECOND,
+        response_tokens: int = FAKE_BACKEND_RESPONSE_TOKENS,
+        dimension: int = FAKE_BACKEND_EMBEDDING_DIM
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.dimension = dimension
+        self.embedding_model = f"fake-hash-{dimension}"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        words = _WORD.findall(prompt) or ['answer']
+        start = int.from_bytes(hashlib.blake2b(prompt.encode('utf-8'), digest_size=4).digest(), 'little') % len(words)
+        return [
+            ('' if i == 0 else ' ') + words[(start + i) % len(words)]
+            for i in range(self.response_tokens)
+        ]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _usage(self, prompt: str, tokens: List[str]) -> dict:
+        # Shaped like the final Ollama response so token counts are reported the same way
+        return {'prompt_eval_count': len(_WORD.findall(prompt)), 'eval_count': len(tokens)}
+
+    def chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        tokens = self._tokens(prompt)
+        time.sleep(self.latency + len(tokens) * self._token_delay())
+        log_token_usage(self._usage(prompt, tokens))
+        return ''.join(tokens)
+
+    def stream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> Iterator[str]:
+        start = time.perf_counter() + self.latency
+        tokens = self._tokens(prompt)
+        for i, token in enumerate(tokens):
+            # Sleep to a schedule so per-token overhead does not slow the rate down
+            delay = start + (i + 1) * self._token_delay() - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield token
+        log_token_usage(self._usage(prompt, tokens))
+
+    async def achat(self, prompt: str, max_retries: int = MAX_RETRIES) -> str:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.latency + len(tokens) * self._token_delay())
+        log_token_usage(self._usage(prompt, tokens))
+        return ''.join(tokens)
+
+    async def astream_chat(self, prompt: str, max_retries: int = MAX_RETRIES) -> AsyncIterator[str]:
+        start = time.perf_counter() + self.latency
+        tokens = self._tokens(prompt)
+        for i, token in enumerate(tokens):
+            delay = start + (i + 1) * self._token_delay() - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+        log_token_usage(self._usage(prompt, tokens))
+
+    def hash_embedding(self, text: str) -> np.ndarray:
+        """Embed a text by feature hashing its lowercase words."""
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        hashes = np.fromiter((_word_hash(word) for word in _WORD.findall(text.lower())), dtype=np.uint64)
+        if hashes.shape[0]:
+            signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype(np.float32)
+            np.add.at(vector, (hashes % np.uint64(self.dimension)).astype(np.int64), signs)
+        return vector
+
+    def _embed_all(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.hash_embedding(text)
+        return matrix
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        time.sleep(self.latency)
+        return self._embed_all(texts)
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        await asyncio.sleep(self.latency)
+        return self._embed_all(texts)
+
+
+def create_backend(kind: str) -> ModelBackend:
+    """
+    Create a model backend of the given kind.
+
+    Args:
+        kind (str): "ollama" or "fake"
+
+    Returns:
+        ModelBackend: The backend
+    """
+    if kind == 'ollama':
+        return OllamaBackend()
+    if kind == 'fake':
+        return FakeBackend()
+    raise ValueError(f"Unknown model backend: {kind}")
+
+
+_backend: Optional[ModelBackend] = None
+
+
+def get_backend() -> ModelBackend:
+    """Return the process-wide model backend chosen by MODEL_BACKEND, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _client_lock:
+            if _backend is None:
+                _backend = create_backend(MODEL_BACKEND)
+    return _backend
+
+
+def set_backend(backend: ModelBackend) -> None:
+    """
+    Replace the process-wide model backend, e.g. with a tuned FakeBackend in a benchmark.
+
+    Call it before the first embedding; ``get_embedding`` keeps an
+    in-process cache of vectors from the previous backend.
+    """
+    global _backend
+    _backend = backend
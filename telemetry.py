@@ -0,0 +1,296 @@
+import os
+import re
+import time
+import uuid
+import logging
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+from config import LATENCY_BUCKETS, PROFILE_REQUESTS, PROFILE_HEADER, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def _label_pairs(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Counter:
+    """Monotonic counter per combination of label values, in the Prometheus text format."""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_label_pairs(self.labels, label_values)}}} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    Latency histogram per combination of label values.
+
+    Only bucket counts, the sum and the count are kept, so memory does not
+    grow with traffic; percentiles are estimated from the buckets by the
+    metrics server (e.g. ``histogram_quantile`` in Prometheus).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...],
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Label values to (per-bucket counts with a final +Inf bucket, sum)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values: str) -> None:
+        bucket = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                bucket = i
+                break
+        with self._lock:
+            counts, total = self._series.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bucket] += 1
+            self._series[label_values] = (counts, total + seconds)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                labels = _label_pairs(self.labels, label_values)
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'lawgpt_request_duration_seconds', 'Time to answer a request, by endpoint.', ('endpoint',)
+)
+STAGE_SECONDS = Histogram(
+    'lawgpt_stage_duration_seconds', 'Time spent in each pipeline stage, by endpoint.', ('endpoint', 'stage')
+)
+LLM_TOKENS = Counter('lawgpt_llm_tokens_total', 'Prompt and response tokens reported by the model backend.', ('kind',))
+CACHE_LOOKUPS = Counter('lawgpt_cache_lookups_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+
+
+class RequestTrace:
+    """Timings, token counts and cache results collected while one request is answered."""
+
+    def __init__(self, request_id: str, endpoint: str):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.cache_results: Dict[str, List[int]] = {}  # Cache name to [hits, misses]
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Seconds per stage, summed over repeated stages (e.g. one LLM call per batch query)."""
+        totals: Dict[str, float] = {}
+        for stage, seconds in list(self.spans):
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def summary(self, elapsed: float) -> str:
+        stages = ', '.join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in self.stage_totals().items())
+        parts = [f"Request {self.request_id} {self.endpoint}: {elapsed * 1000:.1f}ms total"]
+        if stages:
+            parts.append(stages)
+        if self.prompt_tokens or self.response_tokens:
+            parts.append(f"tokens {self.prompt_tokens} prompt / {self.response_tokens} response")
+        for cache, (hits, misses) in sorted(self.cache_results.items()):
+            if hits + misses == 1:
+                parts.append(f"{cache} cache {'hit' if hits else 'miss'}")
+            else:
+                parts.append(f"{cache} cache {hits} of {hits + misses} hit")
+        return '; '.join(parts)
+
+
+# Set for the duration of a request; asyncio tasks and asyncio.to_thread inherit it
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> str:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else '-'
+
+
+def new_request_id(header_value: Optional[str] = None) -> str:
+    """Use the client's request ID if it is a sane token, otherwise make one up."""
+    if header_value and _REQUEST_ID.match(header_value):
+        return header_value
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a pipeline stage.
+
+    The duration goes into the stage histogram and, inside ``trace_request``,
+    into the request's trace. Exceptions are timed too and propagate.
+    """
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, trace.endpoint if trace is not None else 'none', stage)
+        if trace is not None:
+            trace.spans.append((stage, seconds))
+
+
+def record_tokens(prompt_tokens: Optional[int], response_tokens: Optional[int]) -> None:
+    """Count the tokens of one LLM call."""
+    prompt_tokens = prompt_tokens or 0
+    response_tokens = response_tokens or 0
+    LLM_TOKENS.inc('prompt', amount=prompt_tokens)
+    LLM_TOKENS.inc('response', amount=response_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.prompt_tokens += prompt_tokens
+        trace.response_tokens += response_tokens
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup, overall and for the current request."""
+    CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss')
+    trace = _current_trace.get()
+    if trace is not None:
+        results = trace.cache_results.setdefault(cache, [0, 0])
+        results[0 if hit else 1] += 1
+
+
+def profile_requested(headers: Mapping[str, str], mode: str = PROFILE_REQUESTS) -> bool:
+    """Tell whether a request should be profiled under the PROFILE_REQUESTS setting."""
+    if mode == 'all':
+        return True
+    return mode == 'header' and headers.get(PROFILE_HEADER) == '1'
+
+
+# cProfile hooks the whole thread (and under asyncio every coroutine on the
+# loop), so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def _save_profile(profiler: cProfile.Profile, request_id: str) -> None:
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{request_id}.prof")
+        profiler.dump_stats(path)
+        logger.info(f"Saved profile of request {request_id} to {path}")
+    except OSError as e:
+        logger.error(f"Failed to save profile of request {request_id}: {str(e)}")
+
+
+@contextmanager
+def trace_request(endpoint: str, request_id: Optional[str] = None, profile: bool = False) -> Iterator[RequestTrace]:
+    """
+    Trace one request: its stages, tokens and cache results.
+
+    On exit the request duration is recorded and a one-line summary is
+    logged. With ``profile`` the request also runs under cProfile and the
+    stats are written to PROFILE_DIR/<request id>.prof, unless another
+    request is being profiled already. Under the asyncio server the profile
+    also covers coroutines of other requests that ran in the meantime.
+
+    Args:
+        endpoint (str): Label for the metrics, e.g. "/query"
+        request_id (Optional[str]): ID from ``new_request_id``, generated if missing
+        profile (bool): Capture a cProfile of the request
+
+    Yields:
+        RequestTrace: The trace being collected
+    """
+    trace = RequestTrace(request_id or new_request_id(), endpoint)
+    token = _current_trace.set(trace)
+    profiler = None
+    if profile:
+        if _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            logger.warning(f"Not profiling request {trace.request_id}: another request is being profiled")
+    try:
+        yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            _save_profile(profiler, trace.request_id)
+        elapsed = time.perf_counter() - trace.started
+        REQUEST_SECONDS.observe(elapsed, endpoint)
+        logger.info(trace.summary(elapsed))
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streamed response finished in a different context than it started
+            _current_trace.set(None)
+
+
+class RequestIdFilter(logging.Filter):
+    """Add the current request ID to log records as ``request_id``."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+def install_log_filter() -> None:
+    """Make ``%(request_id)s`` available to the root handlers' log format."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, RequestIdFilter) for f in handler.filters):
+            handler.addFilter(RequestIdFilter())
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in (REQUEST_SECONDS, STAGE_SECONDS, LLM_TOKENS, CACHE_LOOKUPS):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,17 @@
+import os
+
+# Read by config on import, so set before any project module is loaded
+os.environ.setdefault("MODEL_BACKEND", "fake")
+
+import pytest
+from model_backend import FakeBackend, get_backend, set_backend
+
+
+@pytest.fixture
+def fake_backend():
+    """Instant fake model backend, restored to the previous backend afterwards."""
+    previous = get_backend()
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    set_backend(backend)
+    yield backend
+    set_backend(previous)
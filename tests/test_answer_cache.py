@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from answer_cache import AnswerCache, normalize_query, same_intent
+from RAG.embedding import normalize_embedding
+from RAG.retrieval import embed_queries_and_questions
+
+BEFORE = "Is an LCA required before filing the H-1B petition?"
+AFTER = "Is an LCA required after filing the H-1B petition?"
+
+
+def unit(vector) -> np.ndarray:
+    return normalize_embedding(np.asarray(vector, dtype=np.float32))
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache(max_entries=10, ttl=None)
+    cache.put(BEFORE, "Yes.", ["a.pdf"])
+    assert cache.get("is an lca required before filing the h-1b petition") == ("Yes.", ["a.pdf"])
+    assert cache.stats()['hits'] == 1
+
+
+def test_paraphrase_hits_on_similar_question_embedding():
+    cache = AnswerCache(max_entries=10, ttl=None, similarity_threshold=0.95)
+    embedding = unit([1.0, 0.0, 0.0])
+    cache.put(BEFORE, "Yes.", [], embedding)
+    paraphrase = "Is the LCA required before filing the H-1B petition?"
+    assert cache.get(paraphrase, unit([1.0, 0.01, 0.0])) == ("Yes.", [])
+    assert cache.stats()['semantic_hits'] == 1
+
+
+def test_before_and_after_never_share_an_answer(fake_backend):
+    # Both preprocess to the same retrieval text, so even identical embeddings must not match
+    cache = AnswerCache(max_entries=10, ttl=None, similarity_threshold=0.5)
+    embedding = unit(fake_backend.embed([normalize_query(BEFORE)])[0])
+    cache.put(BEFORE, "Yes, the LCA must be certified first.", [], embedding)
+    assert cache.get(AFTER, embedding) is None
+    assert cache.get(AFTER, unit(fake_backend.embed([normalize_query(AFTER)])[0])) is None
+    assert cache.stats()['semantic_hits'] == 0
+
+
+@pytest.mark.parametrize("question, other", [
+    ("When must the employer file the LCA?", "Why must the employer file the LCA?"),
+    ("Who is the employer?", "Where was the employer?")
+])
+def test_question_words_never_share_an_answer(fake_backend, question, other):
+    # The retrieval preprocessor drops wh-words and is/was, so these only differ as asked
+    retrieval, questions = embed_queries_and_questions(
+        [question, other], [normalize_query(question), normalize_query(other)]
+    )
+    np.testing.assert_allclose(retrieval[0], retrieval[1])
+    assert float(questions[0] @ questions[1]) < 0.99
+    cache = AnswerCache(max_entries=10, ttl=None, similarity_threshold=0.5)
+    cache.put(question, "Before the petition is filed.", [], questions[0])
+    assert cache.get(other, questions[1]) is None
+    assert cache.get(other, questions[0]) is None
+    assert not same_intent(normalize_query(question), normalize_query(other))
+
+
+def test_same_intent():
+    assert same_intent("is an lca required", "is the lca required")
+    assert not same_intent("is an lca required", "is an lca not required")
+    assert not same_intent("file before the deadline", "file after the deadline")
+
+
+def test_scope_separates_entries():
+    cache = AnswerCache(max_entries=10, ttl=None)
+    embedding = unit([0.0, 1.0])
+    cache.put(BEFORE, "US answer", [], embedding, scope="us")
+    assert cache.get(BEFORE, embedding, scope="ca") is None
+    assert cache.get(BEFORE, embedding) is None
+    assert cache.get(BEFORE, embedding, scope="us") == ("US answer", [])
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("answer_cache.time.monotonic", lambda: now[0])
+    cache = AnswerCache(max_entries=10, ttl=60)
+    cache.put(BEFORE, "Yes.", [], unit([1.0, 0.0]))
+    now[0] += 59
+    assert cache.get(BEFORE) is not None
+    now[0] += 2
+    assert cache.get(BEFORE, unit([1.0, 0.0])) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_frees_embedding_rows():
+    cache = AnswerCache(max_entries=2, ttl=None, similarity_threshold=0.99)
+    first, second, third = unit([1, 0, 0]), unit([0, 1, 0]), unit([0, 0, 1])
+    cache.put("first question", "1", [], first)
+    cache.put("second question", "2", [], second)
+    assert cache.get("first question") is not None  # Now most recently used
+    cache.put("third question", "3", [], third)
+    assert cache.stats()['entries'] == 2
+    assert cache.get("second question") is None
+    assert cache.get("second question again", second) is None
+    assert cache.get("first question again", first) == ("1", [])
+    assert cache.get("third question again", third) == ("3", [])
+    # Rows are reused, never grown
+    for i in range(10):
+        cache.put(f"question {i}", str(i), [], unit([1, i, 0]))
+    assert cache._matrix.shape[0] == 3
+
+
+def test_version_change_clears_the_cache():
+    version = [1]
+    cache = AnswerCache(max_entries=10, ttl=None, version=lambda: version[0])
+    cache.put(BEFORE, "Yes.", [], unit([1.0, 0.0]))
+    version[0] = 2
+    assert cache.get(BEFORE, unit([1.0, 0.0])) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_paraphrase_matching_can_be_disabled():
+    cache = AnswerCache(max_entries=10, ttl=None, similarity_threshold=None)
+    embedding = unit([1.0, 0.0])
+    cache.put(BEFORE, "Yes.", [], embedding)
+    assert cache.get("Is the LCA required before filing the H-1B petition?", embedding) is None
+
+
+def test_get_exact_counts_hits_only():
+    cache = AnswerCache(max_entries=10, ttl=None)
+    assert cache.get_exact(BEFORE) is None
+    cache.put(BEFORE, "Yes.", [])
+    assert cache.get_exact(BEFORE.upper()) == ("Yes.", [])
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 0
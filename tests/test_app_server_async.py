@@ -0,0 +1,75 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+import app_server_async
+
+AUTH = {"Authorization": f"Bearer {app_server_async.API_TOKEN}"}
+
+
+@pytest.fixture
+def client(fake_backend):
+    with TestClient(app_server_async.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream", "/query/batch"])
+@pytest.mark.parametrize("body", [[], "text", 3])
+def test_non_object_body_is_rejected(client, path, body):
+    response = client.post(path, json=body, headers=AUTH)
+    assert response.status_code == 400
+    assert response.json() == {"error": app_server_async.NOT_AN_OBJECT_MESSAGE}
+
+
+def test_non_string_query_is_rejected(client):
+    response = client.post("/query", json={"query": 5}, headers=AUTH)
+    assert response.status_code == 400
+
+
+def test_query_requires_the_token(client):
+    assert client.post("/query", json={"query": "What is an LCA?"}).status_code == 401
+
+
+@pytest.mark.parametrize("path", ["/stats", "/cache/stats", "/metrics"])
+def test_stats_require_the_token(client, path):
+    assert client.get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", ["/cache/stats", "/metrics"])
+def test_stats_with_the_token(client, path):
+    assert client.get(path, headers=AUTH).status_code == 200
+
+
+def test_public_stats(client, monkeypatch):
+    monkeypatch.setattr(app_server_async, "PUBLIC_STATS", True)
+    assert client.get("/cache/stats").status_code == 200
+
+
+def test_batch_holds_a_backend_slot_only_for_backend_calls(client, monkeypatch):
+    limiter = app_server_async.BackendLimiter(concurrency=2, max_queue=8)
+    monkeypatch.setattr(app_server_async, "limiter", limiter)
+    active = {}
+    embed = app_server_async.embed_queries_and_questions
+    context = app_server_async.context_from_documents
+
+    def embed_in_slot(*args):
+        active['embed'] = limiter.active
+        return embed(*args)
+
+    def context_outside_slot(*args):
+        active.setdefault('context', []).append(limiter.active)
+        return context(*args)
+
+    monkeypatch.setattr(app_server_async, "embed_queries_and_questions", embed_in_slot)
+    monkeypatch.setattr(app_server_async, "context_from_documents", context_outside_slot)
+    # One query, so no other query's LLM call holds a slot meanwhile
+    response = client.post("/query/batch", json={"queries": ["Who files Form I-129?"]}, headers=AUTH)
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 1
+    assert active == {'embed': 1, 'context': [0]}
+
+
+def test_batch_is_busy_when_the_backend_queue_is_full(client, monkeypatch):
+    monkeypatch.setattr(app_server_async, "limiter", app_server_async.BackendLimiter(concurrency=1, max_queue=0))
+    response = client.post("/query/batch", json={"queries": ["What is an LCA?", "Who files it?"]}, headers=AUTH)
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result.get('error') for result in results] == [app_server_async.BUSY_MESSAGE] * 2
@@ -0,0 +1,51 @@
+import pytest
+import app_server_flask
+
+AUTH = {"Authorization": f"Bearer {app_server_flask.API_TOKEN}"}
+
+
+@pytest.fixture
+def client(fake_backend):
+    return app_server_flask.app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/stats", "/cache/stats", "/metrics"])
+def test_stats_require_the_token(client, path):
+    assert client.get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", ["/cache/stats", "/metrics"])
+def test_stats_with_the_token(client, path):
+    assert client.get(path, headers=AUTH).status_code == 200
+
+
+def test_public_stats(client, monkeypatch):
+    monkeypatch.setattr(app_server_flask, "PUBLIC_STATS", True)
+    assert client.get("/metrics").status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream", "/query/batch"])
+@pytest.mark.parametrize("body", [[], "text", 3, None])
+def test_non_object_body_is_rejected(client, path, body):
+    response = client.post(path, json=body, headers=AUTH)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": app_server_flask.NOT_AN_OBJECT_MESSAGE}
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream"])
+@pytest.mark.parametrize("query", [5, ["What is an LCA?"], {"text": "What is an LCA?"}])
+def test_non_string_query_is_rejected(client, path, query):
+    response = client.post(path, json={"query": query}, headers=AUTH)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "query must be a string."}
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream"])
+def test_empty_query_is_rejected(client, path):
+    response = client.post(path, json={"query": "  "}, headers=AUTH)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Empty query provided."}
+
+
+def test_query_requires_the_token(client):
+    assert client.post("/query", json={"query": "What is an LCA?"}).status_code == 401
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from RAG import embedding
+from RAG.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=3, model="test-model", touch_interval=3600)
+
+
+def last_used(cache: EmbeddingCache, text: str) -> float:
+    (value,) = cache._connection().execute(
+        "SELECT last_used FROM embeddings WHERE key = ?", (cache.key(text),)
+    ).fetchone()
+    return value
+
+
+def test_round_trip(cache):
+    vector = np.arange(4, dtype=np.float32)
+    cache.put("some text", vector)
+    np.testing.assert_array_equal(cache.get("some text"), vector)
+    assert cache.get("other text") is None
+    assert cache.get_many(["some text", "other text"]).keys() == {"some text"}
+
+
+def test_model_is_part_of_the_key(cache, tmp_path):
+    cache.put("some text", np.ones(4, dtype=np.float32))
+    other = EmbeddingCache(cache.path, model="other-model")
+    assert other.get("some text") is None
+
+
+def test_hits_refresh_last_use_only_after_the_touch_interval(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("RAG.embedding_cache.time.time", lambda: now[0])
+    cache.put("some text", np.ones(4, dtype=np.float32))
+    now[0] += 60
+    cache.get("some text")
+    assert last_used(cache, "some text") == 1000.0
+    now[0] += 3600
+    cache.get("some text")
+    assert last_used(cache, "some text") == now[0]
+
+
+def test_evicts_least_recently_used(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("RAG.embedding_cache.time.time", lambda: now[0])
+    for i in range(5):
+        now[0] += 1
+        cache.put(f"text {i}", np.full(4, i, dtype=np.float32))
+    cache.evict()
+    assert len(cache) == 3
+    assert cache.get("text 0") is None
+    assert cache.get("text 4") is not None
+
+
+def test_failed_write_does_not_leave_a_transaction_open(cache):
+    conn = cache._connection()
+    # Aborts the insert statement but not the transaction around it, like a lock timeout
+    conn.execute(
+        "CREATE TRIGGER reject BEFORE INSERT ON embeddings WHEN length(NEW.vector) = 8 "
+        "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+    )
+    cache.put("short", np.ones(2, dtype=np.float32))
+    assert not conn.in_transaction
+    cache.put("long", np.ones(4, dtype=np.float32))
+    assert cache.get("long") is not None
+    assert cache.get("short") is None
+
+
+def test_concurrent_writes_trigger_eviction(cache, monkeypatch):
+    monkeypatch.setattr(cache, "EVICTION_INTERVAL", 10)
+
+    def writer(thread: int) -> None:
+        for i in range(5):
+            cache.put(f"text {thread} {i}", np.ones(4, dtype=np.float32))
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache._writes == 0
+    assert len(cache) <= cache.max_entries
+
+
+def test_aget_embedding_uses_the_persistent_cache(cache, fake_backend, monkeypatch):
+    fake_backend.cache_embeddings = True
+    monkeypatch.setattr(embedding, "get_embedding_cache", lambda: cache)
+    first = asyncio.run(embedding.aget_embedding("an h-1b petition"))
+    assert cache.get("an h-1b petition") is not None
+    second = asyncio.run(embedding.aget_embedding("an h-1b petition"))
+    np.testing.assert_allclose(first, second)
@@ -0,0 +1,121 @@
+import functools
+import numpy as np
+import pytest
+from data_processing import generate_embeddings, manifest
+from RAG.store import EmbeddingStore
+from model_backend import FakeBackend, set_backend
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, fake_backend):
+    """DOCUMENTS_DIR and EMBEDDINGS_DIR in a temporary directory; returns the documents dir and embedded batch sizes."""
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    embeddings = str(tmp_path / "embeddings")
+    monkeypatch.setattr(generate_embeddings, "DOCUMENTS_DIR", str(documents))
+    monkeypatch.setattr(generate_embeddings, "EMBEDDINGS_DIR", embeddings)
+    monkeypatch.setattr(generate_embeddings, "load_manifest", functools.partial(manifest.load_manifest, embeddings))
+    monkeypatch.setattr(generate_embeddings, "save_manifest", functools.partial(manifest.save_manifest, directory=embeddings))
+    monkeypatch.setattr(generate_embeddings, "load_document_attributes", lambda: {})
+    monkeypatch.setattr(
+        generate_embeddings, "parse_documents", functools.partial(generate_embeddings.parse_documents, max_workers=1)
+    )
+    embedded = []
+    embed_records = generate_embeddings.embed_records
+
+    def counting_embed_records(records):
+        embedded.append(len(records))
+        return embed_records(records)
+    monkeypatch.setattr(generate_embeddings, "embed_records", counting_embed_records)
+    return documents, embedded
+
+
+def stored():
+    matrix, records, _ = EmbeddingStore(generate_embeddings.EMBEDDINGS_DIR).load()
+    return matrix, records
+
+
+def write_documents(documents):
+    (documents / "visas.txt").write_text("An H-1B petition is filed by the employer on Form I-129.", encoding='utf-8')
+    (documents / "citizenship.txt").write_text("Naturalization requires continuous residence.", encoding='utf-8')
+
+
+def test_first_run_embeds_every_document(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    matrix, records = stored()
+    assert sorted(record['document'] for record in records) == ["citizenship.txt", "visas.txt"]
+    assert matrix.shape[0] == len(records) == sum(embedded)
+    assert set(manifest.load_manifest(generate_embeddings.EMBEDDINGS_DIR)) == {"citizenship.txt", "visas.txt"}
+
+
+def test_unchanged_documents_are_skipped(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    before = stored()
+    embedded.clear()
+    generate_embeddings.process_all_documents()
+    assert embedded == []
+    after = stored()
+    np.testing.assert_array_equal(after[0], before[0])
+    assert after[1] == before[1]
+
+
+def test_only_changed_documents_are_embedded(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    _, before = stored()
+    embedded.clear()
+    (documents / "citizenship.txt").write_text("Naturalization requires physical presence.", encoding='utf-8')
+    generate_embeddings.process_all_documents()
+    assert embedded == [1]
+    _, after = stored()
+    visas = [record for record in before if record['document'] == "visas.txt"]
+    assert [record for record in after if record['document'] == "visas.txt"] == visas
+    assert any("physical" in record['content'] for record in after)
+    assert not any("continuous" in record['content'] for record in after)
+
+
+def test_deleted_documents_are_removed(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    embedded.clear()
+    (documents / "visas.txt").unlink()
+    generate_embeddings.process_all_documents()
+    assert sum(embedded) == 0
+    matrix, records = stored()
+    assert [record['document'] for record in records] == ["citizenship.txt"]
+    assert matrix.shape[0] == 1
+    assert set(manifest.load_manifest(generate_embeddings.EMBEDDINGS_DIR)) == {"citizenship.txt"}
+
+
+def test_full_rebuild_ignores_the_manifest(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    _, before = stored()
+    embedded.clear()
+    generate_embeddings.process_all_documents(full_rebuild=True)
+    assert embedded == [len(before)]
+    _, after = stored()
+    assert [record['hash'] for record in after] == [record['hash'] for record in before]
+
+
+def test_single_document_after_a_model_change_rebuilds_everything(corpus):
+    documents, embedded = corpus
+    write_documents(documents)
+    generate_embeddings.process_all_documents()
+    new_backend = FakeBackend(latency=0, tokens_per_second=0, dimension=64)
+    set_backend(new_backend)
+    (documents / "visas.txt").write_text("An L-1 petition is filed by the employer.", encoding='utf-8')
+    generate_embeddings.generate_embeddings_for_document(str(documents / "visas.txt"))
+    matrix, records = stored()
+    info = EmbeddingStore(generate_embeddings.EMBEDDINGS_DIR).read_info()
+    assert info['model'] == new_backend.embedding_model
+    assert matrix.shape == (2, 64)
+    assert sorted(record['document'] for record in records) == ["citizenship.txt", "visas.txt"]
+    assert any("l-1" in record['content'] for record in records)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from RAG.index import VectorIndex
+from RAG.store import EmbeddingStore, make_record
+
+QUERY = "employer file lca petition"
+
+# Row 0 answers the query, row 1 holds most of its rare terms but points elsewhere
+# in embedding space, rows 2 and 3 only share the common term "petition"
+CHUNKS = [
+    ("the employer must file the lca before the petition", [1.0, 0.0, 0.0, 0.0]),
+    ("an employer must file an lca", [0.0, 1.0, 0.0, 0.0]),
+    ("the petition fee schedule", [0.0, 0.0, 1.0, 0.0]),
+    ("the petition is approved by the service", [0.0, 0.0, 0.0, 1.0]),
+    ("weather report for the week", [0.0, 0.0, 1.0, 1.0])
+]
+
+
+@pytest.fixture
+def index(tmp_path, fake_backend):
+    matrix = np.array([embedding for _, embedding in CHUNKS], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    records = [make_record("doc.txt", i, content) for i, (content, _) in enumerate(CHUNKS)]
+    EmbeddingStore(str(tmp_path)).write(matrix, records)
+    return VectorIndex(str(tmp_path), mode='hybrid', quantization='none', shards=1)
+
+
+def contents(results):
+    return [result['content'] for result in results]
+
+
+def test_common_term_does_not_bypass_the_threshold(index):
+    query = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    results = index.search(query, 5, 0.5, QUERY)
+    assert contents(results) == [CHUNKS[0][0], CHUNKS[1][0]]
+    assert results[1]['similarity'] < 0.5
+
+
+def test_batch_search_applies_the_same_rule(index):
+    queries = np.array([[1.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+    (results,) = index.search_many(queries, 5, 0.5, [QUERY])
+    assert contents(results) == contents(index.search(queries[0], 5, 0.5, QUERY))
+
+
+def test_dense_mode_uses_the_threshold_alone(index):
+    index.mode = 'dense'
+    query = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    assert contents(index.search(query, 5, 0.5, QUERY)) == [CHUNKS[0][0]]
+
+
+def test_coverage(index):
+    index.refresh()
+    coverage = index.lexical.coverage(QUERY, np.arange(len(CHUNKS)))
+    assert coverage[0] == pytest.approx(1.0)
+    assert coverage[1] > 0.5
+    assert coverage[2] == coverage[3] < 0.25
+    assert coverage[4] == 0.0
+    assert index.lexical.coverage("zebra", np.arange(2)).tolist() == [0.0, 0.0]
@@ -0,0 +1,96 @@
+import math
+from collections import Counter
+import numpy as np
+import pytest
+from RAG.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+CONTENTS = [
+    "The H-1B petition is filed on Form I-129.",
+    "An employer files Form I-129 for the worker.",
+    "Green card holders may apply for naturalization.",
+    "Naturalization requires continuous residence and physical presence.",
+    ""
+]
+
+
+def reference_scores(contents, query, k1=1.5, b=0.75):
+    docs = [Counter(tokenize(content)) for content in contents]
+    lengths = [sum(doc.values()) for doc in docs]
+    avgdl = max(sum(lengths) / len(docs), 1.0)
+    scores = [0.0] * len(docs)
+    for term in set(tokenize(query)):
+        df = sum(1 for doc in docs if term in doc)
+        if df == 0:
+            continue
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        for row, doc in enumerate(docs):
+            tf = doc[term]
+            if tf:
+                scores[row] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[row] / avgdl))
+    return scores
+
+
+@pytest.fixture
+def index():
+    return BM25Index.build(CONTENTS)
+
+
+def test_tokenize_keeps_joined_terms():
+    assert tokenize("Form I-129, section 214.2(h)") == ["form", "i-129", "section", "214.2", "h"]
+
+
+def test_search_matches_reference_bm25(index):
+    query = "form i-129 naturalization"
+    rows, scores = index.search(query, 10)
+    expected = reference_scores(CONTENTS, query)
+    assert sorted(rows.tolist()) == [row for row, score in enumerate(expected) if score > 0]
+    for row, score in zip(rows.tolist(), scores.tolist()):
+        assert score == pytest.approx(expected[row], rel=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_search_without_known_terms(index):
+    rows, scores = index.search("zebra", 5)
+    assert rows.shape == (0,) and scores.shape == (0,)
+
+
+def test_search_mask(index):
+    mask = np.array([False, True, True, True, True])
+    rows, _ = index.search("form i-129", 5, mask)
+    assert rows.tolist() == [1]
+    rows, _ = index.search("form i-129", 5, np.zeros(5, dtype=bool))
+    assert rows.shape == (0,)
+
+
+def test_save_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.terms == index.terms
+    assert len(loaded) == len(index)
+    for query in ("naturalization residence", "the worker"):
+        rows, scores = index.search(query, 5)
+        loaded_rows, loaded_scores = loaded.search(query, 5)
+        assert loaded_rows.tolist() == rows.tolist()
+        np.testing.assert_allclose(loaded_scores, scores)
+
+
+def test_empty_index(tmp_path):
+    index = BM25Index.build([])
+    assert len(index) == 0
+    assert index.search("form", 5)[0].shape == (0,)
+    path = str(tmp_path / "empty.npz")
+    index.save(path)
+    assert len(BM25Index.load(path)) == 0
+
+
+def test_reciprocal_rank_fusion():
+    rows, scores = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4])], k=60)
+    assert rows.tolist() == [1, 3, 4, 2]
+    assert scores[0] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores[1] == pytest.approx(1 / 61)
+
+
+def test_reciprocal_rank_fusion_empty():
+    rows, scores = reciprocal_rank_fusion([np.array([], dtype=np.int64)])
+    assert rows.shape == (0,) and scores.shape == (0,)
@@ -0,0 +1,22 @@
+from data_processing import manifest
+from data_processing.preprocess_docs import PREPROCESSOR_VERSION
+
+
+def write(path, text: str) -> str:
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_entry_records_the_preprocessor(tmp_path):
+    path = write(tmp_path / "a.txt", "Some statute text.")
+    entry = manifest.document_entry(path, manifest.file_sha256(path), ["h1"])
+    assert entry['preprocessor'] == PREPROCESSOR_VERSION
+    assert manifest.unchanged_entry(entry, path) == entry
+
+
+def test_documents_from_another_preprocessor_are_reprocessed(tmp_path):
+    path = write(tmp_path / "a.txt", "Some statute text.")
+    entry = manifest.document_entry(path, manifest.file_sha256(path), ["h1"])
+    assert manifest.unchanged_entry(dict(entry, preprocessor="stopwords-old"), path) is None
+    legacy = {key: value for key, value in entry.items() if key != 'preprocessor'}
+    assert manifest.unchanged_entry(legacy, path) is None
@@ -0,0 +1,150 @@
+import asyncio
+import httpx
+import ollama
+import pytest
+import model_backend
+from model_backend import CircuitBreaker, CircuitOpenError, acall_with_retries, call_with_retries, is_transient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_backend.time, "monotonic", clock)
+    monkeypatch.setattr(model_backend.time, "sleep", lambda seconds: None)
+    return clock
+
+
+def failing(error):
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise error
+    func.calls = calls
+    return func
+
+
+def test_is_transient():
+    assert is_transient(ConnectionError())
+    assert is_transient(httpx.ReadTimeout("slow"))
+    assert is_transient(ollama.ResponseError("busy", 503))
+    assert is_transient(ollama.ResponseError("slow down", 429))
+    assert not is_transient(ollama.ResponseError("model not found", 404))
+    assert not is_transient(ValueError())
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    assert breaker.record_error(ConnectionError())
+    assert breaker.record_error(ConnectionError())
+    assert breaker.state == 'closed'
+    assert not breaker.record_error(ConnectionError())
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_error(ConnectionError())
+    breaker.record_success()
+    breaker.record_error(ConnectionError())
+    assert breaker.state == 'closed'
+
+
+def test_non_transient_errors_do_not_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    assert not breaker.record_error(ValueError())
+    assert breaker.state == 'closed'
+
+
+def test_half_open_allows_one_trial(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_error(ConnectionError())
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_error(ConnectionError())
+    clock.now += 30
+    breaker.before_call()
+    assert not breaker.record_error(ConnectionError())
+    assert breaker.state == 'open'
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_lost_trial_expires(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_error(ConnectionError())
+    clock.now += 30
+    breaker.before_call()
+    clock.now += 30
+    breaker.before_call()
+
+
+def test_call_with_retries_retries_transient_errors(clock):
+    breaker = CircuitBreaker("test", failure_threshold=10, reset_timeout=30)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError()
+        return "ok"
+
+    assert call_with_retries(flaky, breaker, max_retries=3) == "ok"
+    assert len(attempts) == 3
+    assert breaker.failures == 0
+
+
+def test_call_with_retries_does_not_retry_other_errors(clock):
+    func = failing(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        call_with_retries(func, CircuitBreaker("test"), max_retries=3)
+    assert len(func.calls) == 1
+
+
+def test_call_with_retries_stops_when_circuit_opens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    func = failing(ConnectionError())
+    with pytest.raises(ConnectionError):
+        call_with_retries(func, breaker, max_retries=5)
+    assert len(func.calls) == 2
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(func, breaker, max_retries=5)
+    assert len(func.calls) == 2
+
+
+def test_acall_with_retries(clock, monkeypatch):
+    async def no_sleep(seconds):
+        pass
+    monkeypatch.setattr(model_backend.asyncio, "sleep", no_sleep)
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    attempts = []
+
+    async def down():
+        attempts.append(1)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(acall_with_retries(down, breaker, max_retries=5))
+    assert len(attempts) == 2
+    assert breaker.state == 'open'
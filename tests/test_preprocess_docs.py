@@ -0,0 +1,93 @@
+import pytest
+from data_processing import preprocess_docs
+
+
+@pytest.fixture
+def missing_nltk_data(monkeypatch):
+    """Pretend no NLTK data is installed and record download attempts."""
+    import nltk
+    downloads = []
+
+    def find(resource):
+        raise LookupError(resource)
+
+    monkeypatch.setattr(nltk.data, "find", find)
+    monkeypatch.setattr(nltk, "download", lambda package, **kwargs: downloads.append(package) or True)
+    monkeypatch.setattr(preprocess_docs, "_resolved", {})
+    monkeypatch.setattr(preprocess_docs, "NLTK_ALLOW_DOWNLOAD", True)
+    return downloads
+
+
+def test_lookups_never_download(missing_nltk_data):
+    assert preprocess_docs.ensure_nltk_resource('punkt_tab') is False
+    assert preprocess_docs.sentence_tokenize("One. Two.") == ["One.", "Two."]
+    assert missing_nltk_data == []
+
+
+def test_ingestion_downloads_only_when_allowed(missing_nltk_data, monkeypatch):
+    monkeypatch.setattr(preprocess_docs, "NLTK_ALLOW_DOWNLOAD", False)
+    preprocess_docs.download_nltk_data()
+    assert missing_nltk_data == []
+    monkeypatch.setattr(preprocess_docs, "NLTK_ALLOW_DOWNLOAD", True)
+    preprocess_docs.download_nltk_data()
+    assert missing_nltk_data == list(preprocess_docs.NLTK_RESOURCES)
+
+
+def test_stopwords_do_not_depend_on_nltk_data(missing_nltk_data):
+    stop_words = preprocess_docs.get_stopwords()
+    assert len(stop_words) == 198
+    assert {"not", "before", "after", "i'm", "they've"} <= stop_words
+    assert preprocess_docs.TextPreprocessor().stop_words == stop_words
+
+
+def words(count, start=0):
+    return [f"w{i}" for i in range(start, start + count)]
+
+
+def test_iter_chunks_without_overlap_covers_every_word_once():
+    text = ' '.join(words(1234))
+    chunks = list(preprocess_docs.iter_chunks([text], chunk_size=100, overlap=0))
+    assert all(len(chunk.split()) <= 100 for chunk in chunks)
+    assert ' '.join(chunks).split() == words(1234)
+
+
+def test_iter_chunks_overlap():
+    chunks = list(preprocess_docs.iter_chunks([' '.join(words(250))], chunk_size=100, overlap=10))
+    assert [len(chunk.split()) for chunk in chunks] == [100, 100, 70]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.split()[:10] == previous.split()[-10:]
+    assert chunks[-1].split()[-1] == "w249"
+
+
+def test_iter_chunks_ends_at_sentence_boundary():
+    text = ' '.join(words(70)) + ". " + ' '.join(words(100, 70))
+    chunk = next(preprocess_docs.iter_chunks([text], chunk_size=100, overlap=0))
+    assert chunk.endswith("w69.")
+    # Boundaries in the first half are ignored
+    text = ' '.join(words(30)) + ". " + ' '.join(words(100, 30))
+    chunk = next(preprocess_docs.iter_chunks([text], chunk_size=100, overlap=0))
+    assert len(chunk.split()) == 100
+
+
+def test_iter_chunks_pages_match_whole_text():
+    pages = [' '.join(words(37, start)) for start in range(0, 370, 37)]
+    expected = list(preprocess_docs.iter_chunks([' '.join(pages)], chunk_size=50, overlap=5))
+    assert list(preprocess_docs.iter_chunks(pages, chunk_size=50, overlap=5)) == expected
+
+
+def test_iter_chunks_is_lazy():
+    def pages():
+        while True:
+            yield ' '.join(words(10))
+    chunk = next(preprocess_docs.iter_chunks(pages(), chunk_size=25, overlap=0))
+    assert len(chunk.split()) == 25
+
+
+def test_iter_chunks_edge_cases():
+    assert list(preprocess_docs.iter_chunks([])) == []
+    assert list(preprocess_docs.iter_chunks(["", "   "])) == []
+    assert list(preprocess_docs.iter_chunks(["one two"], chunk_size=10)) == ["one two"]
+    # Exactly one chunk of text is not followed by an overlap-only chunk
+    assert len(list(preprocess_docs.iter_chunks([' '.join(words(100))], chunk_size=100, overlap=10))) == 1
+    with pytest.raises(ValueError):
+        list(preprocess_docs.iter_chunks(["text"], chunk_size=0))
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from RAG.quantization import ProductQuantizer, ScalarQuantizer, build_quantizer, load_quantizer, quantized_search
+from RAG.similarity import normalize_rows, similarity, top_k_similar
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    return normalize_rows(rng.normal(size=(500, 32)).astype(np.float32))
+
+
+@pytest.fixture
+def query(matrix):
+    rng = np.random.default_rng(1)
+    return normalize_rows((matrix[42] + 0.05 * rng.normal(size=32)).astype(np.float32)[None])[0]
+
+
+def small_pq(matrix):
+    quantizer = ProductQuantizer(subvectors=8, centroids=16, iterations=5)
+    quantizer.build(matrix)
+    return quantizer
+
+
+def test_int8_scores_are_close(matrix, query):
+    quantizer = build_quantizer(matrix, 'int8')
+    assert len(quantizer) == matrix.shape[0]
+    assert quantizer.nbytes < matrix.nbytes / 3
+    np.testing.assert_allclose(quantizer.scores(query), similarity(query, matrix), atol=0.02)
+
+
+def test_pq_codes_are_compact(matrix, query):
+    quantizer = small_pq(matrix)
+    assert quantizer.codes.shape == (500, 8)
+    assert quantizer.codes.dtype == np.uint8
+    assert quantizer.scores(query).shape == (500,)
+    assert quantizer.scores(query, np.array([3, 4])).shape == (2,)
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        build_quantizer(np.zeros((2, 2), dtype=np.float32), 'fp4')
+
+
+def test_dimension_mismatch(matrix):
+    with pytest.raises(ValueError):
+        build_quantizer(matrix, 'int8').scores(np.zeros(16, dtype=np.float32))
+    with pytest.raises(ValueError):
+        small_pq(matrix).scores(np.zeros(16, dtype=np.float32))
+
+
+@pytest.mark.parametrize("build", [lambda m: build_quantizer(m, 'int8'), small_pq])
+def test_save_load_round_trip(matrix, query, tmp_path, build):
+    quantizer = build(matrix)
+    path = str(tmp_path / "codes.npz")
+    quantizer.save(path)
+    loaded = load_quantizer(path)
+    assert type(loaded) is type(quantizer)
+    assert len(loaded) == len(quantizer)
+    np.testing.assert_allclose(loaded.scores(query), quantizer.scores(query), rtol=1e-6)
+
+
+@pytest.mark.parametrize("build", [lambda m: build_quantizer(m, 'int8'), small_pq])
+def test_rerank_returns_exact_scores(matrix, query, build):
+    quantizer = build(matrix)
+    rows, scores = quantized_search(quantizer, matrix, query, 5, rerank=100)
+    np.testing.assert_allclose(scores, similarity(query, matrix[rows]), rtol=1e-6)
+    assert list(scores) == sorted(scores, reverse=True)
+    expected, _ = top_k_similar(query, matrix, 5)
+    assert rows[0] == expected[0] == 42
+
+
+def test_rerank_everything_is_exact(matrix, query):
+    quantizer = small_pq(matrix)
+    rows, _ = quantized_search(quantizer, matrix, query, 10, rerank=matrix.shape[0])
+    expected, _ = top_k_similar(query, matrix, 10)
+    assert rows.tolist() == expected.tolist()
+
+
+def test_rerank_within_rows(matrix, query):
+    quantizer = build_quantizer(matrix, 'int8')
+    allowed = np.arange(1, 500, 2)
+    rows, _ = quantized_search(quantizer, matrix, query, 5, rows=allowed, rerank=50)
+    assert set(rows.tolist()) <= set(allowed.tolist())
+    assert 42 not in rows.tolist()
@@ -0,0 +1,95 @@
+import sys
+import numpy as np
+import pytest
+from RAG import sharding
+from RAG.sharding import ShardedSearch, merge_top_k, shard_bounds
+from RAG.similarity import normalize_rows, top_k_similar
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    return normalize_rows(rng.normal(size=(1000, 16)).astype(np.float32))
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(sharding, 'limit_blas_threads', lambda: False)
+    search = ShardedSearch(4, min_rows=1)
+    yield search
+    search.close()
+
+
+def test_shard_bounds_cover_all_rows():
+    bounds = shard_bounds(10, 3, min_rows=1)
+    assert len(bounds) == 3
+    assert bounds[0][0] == 0 and bounds[-1][1] == 10
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+
+
+def test_shard_bounds_respects_min_rows():
+    assert shard_bounds(25, 8, min_rows=10) == [(0, 12), (12, 25)]
+    assert shard_bounds(5, 8, min_rows=10) == [(0, 5)]
+    assert shard_bounds(0, 4, min_rows=1) == [(0, 0)]
+
+
+def test_merge_top_k_single_query():
+    parts = [
+        (np.array([0, 1]), np.array([0.9, 0.2])),
+        (np.array([5, 6]), np.array([0.95, 0.5]))
+    ]
+    rows, scores = merge_top_k(parts, 3)
+    assert rows.tolist() == [5, 0, 6]
+    assert scores.tolist() == [0.95, 0.9, 0.5]
+
+
+def test_merge_top_k_many_queries():
+    parts = [
+        (np.array([[0, 1], [0, 1]]), np.array([[0.9, 0.1], [0.3, 0.2]])),
+        (np.array([[7, 8], [7, 8]]), np.array([[0.5, 0.4], [0.8, 0.7]]))
+    ]
+    rows, _ = merge_top_k(parts, 2)
+    assert rows.tolist() == [[0, 7], [7, 8]]
+
+
+def test_sharded_search_matches_unsharded(matrix, sharded):
+    query = matrix[3] + 0.1
+    query /= np.linalg.norm(query)
+    expected_rows, expected_scores = top_k_similar(query, matrix, 10)
+    rows, scores = sharded.search(matrix, query, 10)
+    assert rows.tolist() == expected_rows.tolist()
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+
+def test_sharded_search_many_queries(matrix, sharded):
+    queries = matrix[[1, 500, 999]]
+    rows, _ = sharded.search(matrix, queries, 5)
+    assert rows.shape == (3, 5)
+    assert rows[:, 0].tolist() == [1, 500, 999]
+
+
+def test_sharded_search_candidates(matrix, sharded):
+    candidates = np.arange(0, 1000, 7)
+    rows, _ = sharded.search(matrix, matrix[14], 5, candidates)
+    assert rows[0] == 14
+    assert set(rows.tolist()) <= set(candidates.tolist())
+    expected, _ = top_k_similar(matrix[14], matrix[candidates], 5)
+    assert rows.tolist() == candidates[expected].tolist()
+
+
+def test_blas_limit_applied_once_when_sharding(matrix, monkeypatch):
+    calls = []
+    monkeypatch.setattr(sharding, 'limit_blas_threads', lambda: calls.append(1) or True)
+    search = ShardedSearch(2, min_rows=1)
+    search.search(matrix, matrix[0], 3)
+    search.search(matrix, matrix[1], 3)
+    search.close()
+    assert calls == [1]
+    ShardedSearch(1, min_rows=1).search(matrix, matrix[0], 3)
+    assert calls == [1]
+
+
+def test_limit_blas_threads_without_threadpoolctl(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, 'threadpoolctl', None)
+    assert sharding.limit_blas_threads() is False
+    assert 'threadpoolctl' in caplog.text